@@ -1,10 +1,24 @@
 #!/usr/bin/env python3
-APP_VER = "1.4"
+APP_VER = "1.18"
 APP_NAME = "bic2mqtt"
 
 """
- fst:05.04.2024 lst:09.03.2025
+ fst:05.04.2024 lst:17.10.2026
  Meanwell BIC2200-XXCAN to mqtt bridge
+ V1.18 -typed register values [V,A,C] from the cbic2200 register map, no scaling here
+ V1.17 +usb/serial slcan adapter without slcand: CanInterface "native-slcan", CanChannel is the serial device
+ V1.16 +can interface type [DEVICE]Id/X/CanInterface, "native" without python-can
+ V1.15 +can bus-off/error detection and recovery, topic canbus with the recovery events and downtime
+ V1.14 +circuit breaker: offline device, only a liveness probe with backoff, no full polling
+ V1.13 +setpoint shaper: quantize, hysteresis, slew rate and direction dwell time
+ V1.12 -direction and charge current in one can transaction
+ V1.11 +priority scheduler of the can requests, setpoints before telemetry
+ V1.10 +persisted device info, refresh with {"var":"infoRefresh"}
+ V1.9 +can statistic topic canstats
+ V1.8 +adaptive can read timeouts with retries, read timeout exception
+ V1.7 +more than one bic device [DEVICE]Id/X, all devices of a channel share one can bus
+ V1.6 +eeprom write ledger, budget and write limiter
+ V1.5 -pipelined can reads for state, charge and fault update
  V1.4 Bugfix Enable/Disable ChargeControl
  V1.3 Bugfix ChargeCtrlWinter
  V1.2 +fanspeed info
@@ -38,7 +52,7 @@ import logging
 #future use from logging.handlers import RotatingFileHandler
 
 from cmqtt import CMQTT
-from cbic2200 import CBic
+from cbic2200 import CBic,CEepromLedger,CCanBus,CCanTimeoutError,CBicSched,FutureTimeoutError
 
 from datetime import datetime
 import time
@@ -47,7 +61,7 @@ import json
 import configparser
 from cavg import CMAvg
 
-import sys,re
+import sys,re,math
 
 # later we modify this, using a config file
 MQTT_BROKER_ADR = "127.0.0.1" # mqtt broker ip-address
@@ -337,6 +351,91 @@ class CSurplus():
 		return
 
 
+""" setpoint shaper between the charge control and the can writes
+	- slew rate limit, min. dwell time of a direction, quantization grid and hysteresis band
+	- 0[W] (stop) is passed without slew limit, quantization or hysteresis
+	- hysteresis of the target: a target outside the band is followed with slew steps until it is reached
+	- slew step: time since the last call, the time base starts again with a target in the band or reset()
+	- all stages are disabled by default
+"""
+class CSetpointShaper():
+
+	def __init__(self,id):
+		self.dev_id = id
+		self.cfg_grid_pow = 0 # quantization grid [W], 0: disabled
+		self.cfg_hyst_pow = 0 # hysteresis band [W], 0: disabled
+		self.cfg_slew_pow = 0 # max. change [W/s], 0: unlimited
+		self.cfg_dwell_sec = 0 # min. time [s] in a direction before reversing
+		self.pow_last = 0 # last passed setpoint [W]
+		self.ts_call = time.monotonic() # [s] time of the last call
+		self.dir_last = 0 # last direction 1:charge -1:discharge 0:none
+		self.ts_dir = self.ts_call # [s] start time of the last direction
+		self.cnt_in = 0 # setpoints of the charge control
+		self.cnt_suppressed = 0 # setpoints without a can write
+
+	"""
+	@param dbkey-int [DEVICE]Id/X/ShapeGridP def:0[W] quantize the charge power to this grid, 0: disabled
+	@param dbkey-int [DEVICE]Id/X/ShapeHystP def:0[W] skip changes smaller than this band, 0: disabled
+	@param dbkey-int [DEVICE]Id/X/ShapeSlewP def:0[W/s] max. change of the charge power per second, 0: unlimited
+	@param dbkey-int [DEVICE]Id/X/ShapeDwellSec def:0[s] min. time in a direction before reversing charge/discharge
+	"""
+	def cfg(self,ini,reload = False):
+		def kpfx(str_tail : str):
+			return "Id/{}/{}".format(self.dev_id,str_tail)
+
+		self.cfg_grid_pow = ini.get_int('DEVICE',kpfx('ShapeGridP'),self.cfg_grid_pow)
+		self.cfg_hyst_pow = ini.get_int('DEVICE',kpfx('ShapeHystP'),self.cfg_hyst_pow)
+		self.cfg_slew_pow = ini.get_int('DEVICE',kpfx('ShapeSlewP'),self.cfg_slew_pow)
+		self.cfg_dwell_sec = ini.get_int('DEVICE',kpfx('ShapeDwellSec'),self.cfg_dwell_sec)
+
+	""" shape a new setpoint
+		@return setpoint to write [W], None: suppressed
+	"""
+	def shape(self,pow_set : int):
+		self.cnt_in += 1
+		ts = time.monotonic()
+		dt = ts - self.ts_call
+		self.ts_call = ts
+
+		if pow_set == self.pow_last or (pow_set != 0 and abs(pow_set - self.pow_last) < self.cfg_hyst_pow):
+			self.cnt_suppressed += 1
+			return None
+
+		pow_target = pow_set
+		if self.cfg_slew_pow >0 and pow_set != 0:
+			step = self.cfg_slew_pow * dt
+			pow_set = min(max(pow_set,self.pow_last - step),self.pow_last + step)
+
+		# no reversal, stay at 0 until the dwell time of the last direction has passed
+		if (pow_set * self.dir_last) < 0 and (ts - self.ts_dir) < self.cfg_dwell_sec:
+			pow_set = 0
+
+		if self.cfg_grid_pow >0 and pow_set != 0:
+			pow_grid = round(pow_set / self.cfg_grid_pow) * self.cfg_grid_pow
+			pow_grid_target = round(pow_target / self.cfg_grid_pow) * self.cfg_grid_pow
+			if pow_grid == self.pow_last and pow_grid_target != self.pow_last:
+				# slew step smaller than the grid, one grid step towards the target
+				pow_grid += self.cfg_grid_pow if pow_grid_target > self.pow_last else -self.cfg_grid_pow
+			pow_set = pow_grid
+		pow_set = int(pow_set)
+
+		if pow_set == self.pow_last:
+			self.cnt_suppressed += 1
+			return None
+
+		if pow_set != 0:
+			dir_new = 1 if pow_set >0 else -1
+			if dir_new != self.dir_last:
+				self.dir_last = dir_new
+				self.ts_dir = ts
+		self.pow_last = pow_set
+		return pow_set
+
+	# the device was set without the shaper (idle), the next setpoint starts from pow_set now
+	def reset(self,pow_set=0):
+		self.pow_last = pow_set
+		self.ts_call = time.monotonic()
+
 """
 BIC Inverter Device Object:
  - config parameter
@@ -354,6 +453,8 @@ class CBicDevBase():
 
 
 	DEF_SATURATION_POW = 80 # gap between set power and real bat-power charging/discharging
+	PROBE_MIN_SEC = 2 # first interval of the liveness probe of an offline device
+	SCHED_CALL_TMO_SEC = 3 # max. wait of the mqtt and main thread for a can job [s]
 
 	def __init__(self,id : int,type : str):
 		self.id = id	# device-id from ini
@@ -363,11 +464,13 @@ class CBicDevBase():
 			self.type = type
 
 		self.bic = None
+		self.sched = None # CBicSched, all can requests of the running device
 		self.onl_mode = CBicDevBase.e_onl_mode_offline
 		self.system_voltage = 0 # needed for power calculation
 		self.top_inv = "" # MQTT_T_APP + '/inv/' + str(self.id)
 		self.cc = None	# charge control
 		self.sp = CSurplus(self.id) # surplus switch
+		self.shaper = CSetpointShaper(self.id) # setpoint shaper of the charge power
 		self.bat = self.bat = CBattery(self.id) # battery
 
 		self.info = {}
@@ -395,6 +498,7 @@ class CBicDevBase():
 		self.charge['dischargedKWh'] = 0 # discharged [kWh] per 24h
 		self.charge['surplusP'] = 0 # surplus [VA] pos: battery can't consume all the grid power
 		self.charge['surplusKWh'] = 0 # surplus summing [kWh] per 24h (only positve values will be appended)
+		self.charge['setSuppressed'] = 0 # setpoints of the charge control without a can write (shaper)
 		self.charge_pow_set = 0 # last setter of charge value from mqtt
 		#self.charge_pow_surplus = 0 # [W] surplus calculation
 		self.charge_saturation = 0 # [W] level of chagre saturation, gap between set power and charge power, always positve
@@ -403,9 +507,10 @@ class CBicDevBase():
 
 		self.fault = {} # dic of all fault-states
 
-		self.can_bit_rate = 0 # canbus baud-rate
+		self.can_bit_rate = 250000 # canbus baud-rate
 		self.can_adr = 0 # can address
 		self.can_chan_id = "can0" # can channel-id
+		self.cfg_can_if = "socketcan" # python-can interface type, "native": raw AF_CAN socket
 		self.cfg_max_vcharge100 = 0
 		self.cfg_min_vdischarge100 = 6000
 		self.cfg_max_ccharge100 = 0 # need to overwrite
@@ -415,6 +520,25 @@ class CBicDevBase():
 		self.cfg_min_ccharge100 = 90  # 0.9[A]
 		self.cfg_min_cdischarge100 = 90 # 0.9[A]
 
+		# eeprom write limiter
+		self.cfg_eeprom_path = "./" # path of the eeprom ledger file
+		self.cfg_info_path = "./" # path of the persisted device info file
+		self.cfg_eeprom_min_sec = 10 # [s] min. interval between two writes of the same register
+		self.cfg_eeprom_tol100 = 10 # [A*100] don't write values in tolerance of the running one
+		self.cfg_eeprom_budget_day = 2000 # max. eeprom writes per day, -1: unlimited
+		self.cfg_eeprom_budget_life = -1 # max. eeprom writes lifetime, -1: unlimited
+		self.cfg_can_rec_fname = "" # record the can transactions to this file, "": disabled
+		self.cfg_can_tmo_min_ms = 50 # floor of the adaptive can read timeout
+		self.cfg_can_tmo_max_ms = 500 # ceiling of the adaptive can read timeout
+		self.cfg_can_retry = 1 # max. repeated read requests without reply
+		self.cfg_offline_tmo_cnt = 3 # consecutive read timeouts until the device is offline
+		self.cfg_probe_max_sec = 60 # max. interval of the liveness probe
+		self.offline = False # circuit breaker open: only the liveness probe
+		self.offline_start = False # no reply at start, open the breaker at once
+		self.probe_sec = CBicDevBase.PROBE_MIN_SEC # interval of the liveness probe, doubled on each timeout
+		self.ts_probe = 0 # monotonic time of the next liveness probe
+		self.canbus_seq = 0 # last published can bus event (CCanHealth)
+
 		self.tmo_info_ms = 0 #timeslice update info
 		self.cfg_tmo_info_ms = 4000 #timeslice update info
 		self.tmo_state_ms =  0 #timeslice update state
@@ -426,10 +550,15 @@ class CBicDevBase():
 		return self.avg_pow.avg_get(minute*60*1000,-1)
 
 	# read from bic some common stuff
+	# 	@param refresh True: read all info from the device, False: validate the persisted info
 	# 	@topic-pub <main-app>/inv/<id>/info
-	def	update_info(self):
+	def	update_info(self,refresh = False):
 		if self.bic is not None:
-			dinf=self.bic.dump()
+			try:
+				dinf=self.bic.dump(refresh)
+			except CCanTimeoutError as err:
+				lg.warning("dev can't read info:" + str(err))
+				dinf = None
 			if dinf is not None:
 				self.info.update(dinf)
 				if self.cc is not None:
@@ -445,19 +574,27 @@ class CBicDevBase():
  	# @topic-pub <main-app>/inv/<id>/state
 	def update_state(self):
 
-
-		self.state['tempC'] = int(self.bic.tempread() / 10)
-		fan1,fan2 = self.bic.fanread(True)
-		self.state['fan'][0] = round(fan1,-2)
-		self.state['fan'][1] = round(fan2,-2)
-
-		op_mode = self.bic.operation_read()
+		try:
+			d_val = self.bic.reg_read([CBic.e_cmd_READ_TEMPERATURE_1,CBic.e_cmd_READ_FAN1,CBic.e_cmd_READ_FAN2,CBic.e_cmd_OPERATION,
+										CBic.e_cmd_READ_VOUT,CBic.e_cmd_READ_VIN])
+		except CCanTimeoutError as err:
+			d_val = err.d_val # the received values, None for the missing ones
+		temp = d_val[CBic.e_cmd_READ_TEMPERATURE_1]
+		if temp is not None:
+			self.state['tempC'] = int(temp)
+		self.state['fan'][0] = round(d_val[CBic.e_cmd_READ_FAN1] or 0,-2)
+		self.state['fan'][1] = round(d_val[CBic.e_cmd_READ_FAN2] or 0,-2)
+
+		op_mode = d_val[CBic.e_cmd_OPERATION]
 		if op_mode is None:
 			self.state['opMode'] = 0
 			self.onl_mode =  CBicDevBase.e_onl_mode_offline
 			self.state['onlMode'] = 0 # offline, read error
 		else:
 			self.state['opMode'] = op_mode
+			if self.onl_mode == CBicDevBase.e_onl_mode_offline and self.offline is False and self.sched is not None:
+				# single lost reply, the breaker is still closed
+				self.onl_mode = CBicDevBase.e_onl_mode_idle if op_mode == 0 else CBicDevBase.e_onl_mode_running
 
 		self.state['onlMode'] = CBicDevBase.s_onl_mode[self.onl_mode]
 
@@ -465,9 +602,8 @@ class CBicDevBase():
 
 		if self.onl_mode > CBicDevBase.e_onl_mode_init:
 			try:
-				volt = round(float(self.bic.vread()) / 100,2)
-				amp = round(float(self.bic.cread()) / 100,2)
-				ac_grid = round(float(self.bic.acvread()) / 10,0)
+				volt = float(d_val[CBic.e_cmd_READ_VOUT])
+				ac_grid = round(float(d_val[CBic.e_cmd_READ_VIN]),0)
 
 				self.state['acGridV'] = ac_grid	# grid-volatge [V]
 				self.state['dcBatV'] = volt 	# bat voltage DV [V]
@@ -480,10 +616,56 @@ class CBicDevBase():
 			self.state['acGridV'] = 0
 			self.state['dcBatV'] = 0
 
+		self.publish_state()
+
+	# @topic-pub <main-app>/inv/<id>/state
+	def publish_state(self):
 		jpl = json.dumps(self.state, sort_keys=False, indent=4)
 		global mqttc
 		mqttc.publish(MQTT_T_APP + '/inv/' + str(self.id) +  '/state',jpl,0,True) # retained
 
+	""" circuit breaker, open after OfflineTmoCnt read timeouts in a row or an offline start
+		publish the offline state once, then only a liveness probe with exponential backoff
+		@return True: breaker is open, skip the full polling
+	"""
+	def offline_check(self):
+		if self.offline is False:
+			if self.offline_start is False and self.bic.cnt_tmo_seq < self.cfg_offline_tmo_cnt:
+				return False
+			self.offline = True
+			self.offline_start = False
+			self.probe_sec = CBicDevBase.PROBE_MIN_SEC
+			self.ts_probe = time.monotonic() + self.probe_sec
+			self.onl_mode = CBicDevBase.e_onl_mode_offline
+			self.state['opMode'] = 0
+			self.state['onlMode'] = CBicDevBase.s_onl_mode[self.onl_mode]
+			self.state['acGridV'] = 0
+			self.state['dcBatV'] = 0
+			lg.warning("dev id:{} offline, read timeouts:{}".format(self.id,self.bic.cnt_tmo_seq))
+			self.publish_state()
+		elif time.monotonic() >= self.ts_probe:
+			self.ts_probe = math.inf # one probe in flight, set by offline_probe
+			self.sched_submit(CBicSched.e_prio_fast,self.offline_probe,key='probe')
+		return True
+
+	# single uncached read of the operation register, closes the breaker on the first reply
+	def offline_probe(self):
+		try:
+			op_mode = self.bic.can_read(CBic.e_cmd_OPERATION,CBic.d_cmd_dec[CBic.e_cmd_OPERATION],cached=False)
+		except CCanTimeoutError:
+			self.probe_sec = min(self.probe_sec * 2,self.cfg_probe_max_sec)
+			self.ts_probe = time.monotonic() + self.probe_sec
+			return
+		self.state['opMode'] = op_mode
+		if op_mode == 0:
+			self.onl_mode = CBicDevBase.e_onl_mode_idle
+		else:
+			self.onl_mode = CBicDevBase.e_onl_mode_running
+		self.offline = False
+		self.tmo_state_ms = -1 # full polling at the next timeslice
+		self.tmo_charge_ms = -1
+		lg.warning("dev id:{} online again, op:{}".format(self.id,op_mode))
+
 
 	"""	read from bic the charging/discharging parameter
  		@topic-pub <main-app>/inv/<id>/charge
@@ -491,16 +673,20 @@ class CBicDevBase():
 	def update_charge(self):
 		if self.onl_mode > CBicDevBase.e_onl_mode_init:
 			try:
-				volt = round(float(self.bic.vread()) / 100,2)
-				amp = round(float(self.bic.cread()) / 100,2)
+				# voltage and current sampled in one burst: consistent power value
+				# setpoints from the shadow registers of the write path, read from the device after CACHE_TTL_SHADOW
+				d_val = self.bic.reg_read([CBic.e_cmd_READ_VOUT,CBic.e_cmd_READ_IOUT,CBic.e_cmd_DIRECTION_CTRL,
+											CBic.e_cmd_IOUT_SET,CBic.e_cmd_REVERSE_IOUT_SET])
+				volt = float(d_val[CBic.e_cmd_READ_VOUT])
+				amp = float(d_val[CBic.e_cmd_READ_IOUT])
 				self.state['dcBatV'] = round(volt,1) 	# bat voltage DV [V]
 				self.charge['chargeA'] = round(amp,1)  	# bat [A] discharge[-] charge[+] ?
 				pow_w = round(amp * volt)
 				self.charge['chargeP'] = pow_w  # bat [VA] discharge[-] charge[+]
 
-				cdir = self.bic.BIC_chargemode_read()
+				cdir = d_val[CBic.e_cmd_DIRECTION_CTRL]
 				if cdir == CBic.e_charge_mode_charge:
-					amp = round((self.bic.charge_current(CBic.e_cmd_read) / 100),2)
+					amp = d_val[CBic.e_cmd_IOUT_SET]
 					self.avg_pow_charge.push_val(pow_w)
 					self.avg_pow_discharge.push_val(0)
 					self.charge_saturation = self.charge_pow_set - pow_w
@@ -520,7 +706,7 @@ class CBicDevBase():
 					self.avg_pow_charge.push_val(0)
 					self.avg_pow_surplus.push_val(0)
 					self.charge['dischargedKWh'] = round(self.avg_pow_discharge.sum_get(0,0) / (1E6*3600),1)
-					amp = round((self.bic.discharge_current(CBic.e_cmd_read) / 100) * (-1),2)
+					amp = -d_val[CBic.e_cmd_REVERSE_IOUT_SET]
 
 				self.charge['surplusP'] = self.pow_surplus
 				self.charge['chargeSetA'] = amp # [A] configured and readed value [A]
@@ -546,6 +732,20 @@ class CBicDevBase():
 		@param dbkey-int [DEVICE]Id/X/DischargeVoltage def:2520 volt*100
 		@param dbkey-int [DEVICE]Id/X/MaxChargeCurrent def:3500 volt*100
 		@param dbkey-int [DEVICE]Id/X/MaxDischargeCurrent def:2600 volt*100
+		@param dbkey-str [DEVICE]Id/X/EepromLedgerPath def:"./" path of the eeprom write ledger file
+		@param dbkey-int [DEVICE]Id/X/EepromWriteMinSec def:10[s] min. interval between two eeprom writes of the same register
+		@param dbkey-int [DEVICE]Id/X/EepromWriteTol def:10[A*100] skip eeprom writes in tolerance of the running value
+		@param dbkey-int [DEVICE]Id/X/EepromBudgetDay def:2000 max. eeprom writes per day, -1:unlimited
+		@param dbkey-int [DEVICE]Id/X/EepromBudgetLife def:-1 max. eeprom writes lifetime, -1:unlimited
+		@param dbkey-str [DEVICE]Id/X/InfoCachePath def:"./" path of the persisted device info file
+		@param dbkey-str [DEVICE]Id/X/CanRecFile def:"" record all can transactions to this file (replay: cbic2200.CCanReplayBus)
+		@param dbkey-int [DEVICE]Id/X/CanTmoMinMs def:50[ms] floor of the adaptive can read timeout
+		@param dbkey-int [DEVICE]Id/X/CanTmoMaxMs def:500[ms] ceiling of the adaptive can read timeout
+		@param dbkey-int [DEVICE]Id/X/CanRetry def:1 max. repeated read requests without reply
+		@param dbkey-str [DEVICE]Id/X/CanInterface def:"socketcan" python-can interface type, "native": raw AF_CAN socket without python-can,
+			"native-slcan": slcan adapter, CanChannel is the serial device e.g. "/dev/ttyACM0"
+		@param dbkey-int [DEVICE]Id/X/OfflineTmoCnt def:3 consecutive read timeouts until the device is offline
+		@param dbkey-int [DEVICE]Id/X/OfflineProbeMaxSec def:60[s] max. interval of the liveness probe of an offline device
 		@topic-sub <main-app>/inv/<id>/state/set [1,0] inverter operating mode
 	"""
 	def cfg(self,ini,reload = False):
@@ -560,22 +760,93 @@ class CBicDevBase():
 		self.cfg_max_cdischarge100 = ini.get_int('DEVICE',kpfx('MaxDischargeCurrent'),self.cfg_max_cdischarge100)
 		self.top_inv = MQTT_T_APP + '/inv/' + str(self.id)
 
+		self.cfg_eeprom_path = ini.get_str('DEVICE',kpfx('EepromLedgerPath'),self.cfg_eeprom_path)
+		self.cfg_info_path = ini.get_str('DEVICE',kpfx('InfoCachePath'),self.cfg_info_path)
+		self.cfg_eeprom_min_sec = ini.get_int('DEVICE',kpfx('EepromWriteMinSec'),self.cfg_eeprom_min_sec)
+		self.cfg_eeprom_tol100 = ini.get_int('DEVICE',kpfx('EepromWriteTol'),self.cfg_eeprom_tol100)
+		self.cfg_eeprom_budget_day = ini.get_int('DEVICE',kpfx('EepromBudgetDay'),self.cfg_eeprom_budget_day)
+		self.cfg_eeprom_budget_life = ini.get_int('DEVICE',kpfx('EepromBudgetLife'),self.cfg_eeprom_budget_life)
+		self.cfg_can_rec_fname = ini.get_str('DEVICE',kpfx('CanRecFile'),self.cfg_can_rec_fname)
+		self.cfg_can_tmo_min_ms = ini.get_int('DEVICE',kpfx('CanTmoMinMs'),self.cfg_can_tmo_min_ms)
+		self.cfg_can_tmo_max_ms = ini.get_int('DEVICE',kpfx('CanTmoMaxMs'),self.cfg_can_tmo_max_ms)
+		self.cfg_can_retry = ini.get_int('DEVICE',kpfx('CanRetry'),self.cfg_can_retry)
+		self.cfg_can_if = ini.get_str('DEVICE',kpfx('CanInterface'),self.cfg_can_if)
+		self.cfg_offline_tmo_cnt = ini.get_int('DEVICE',kpfx('OfflineTmoCnt'),self.cfg_offline_tmo_cnt)
+		self.cfg_probe_max_sec = ini.get_int('DEVICE',kpfx('OfflineProbeMaxSec'),self.cfg_probe_max_sec)
+		if self.bic is not None and self.bic.ledger is not None:
+			self.eeprom_ledger_cfg(self.bic.ledger)
+		if self.bic is not None:
+			self.bic.tmo_set(self.cfg_can_tmo_min_ms / 1000,self.cfg_can_tmo_max_ms / 1000,self.cfg_can_retry)
+
 		self.bat.cfg(ini,reload)
 		self.sp.cfg(ini,reload)
+		self.shaper.cfg(ini,reload)
 
 		lg.info("init " + str(self))
 		#dischargedelay = int(config.get('Settings', 'DischargeDelay'))
 
+	def eeprom_ledger_cfg(self,ledger):
+		ledger.budget_day = self.cfg_eeprom_budget_day
+		ledger.budget_life = self.cfg_eeprom_budget_life
+		ledger.min_interval_sec = self.cfg_eeprom_min_sec
+		ledger.tol = self.cfg_eeprom_tol100
+
+	# @topic-pub <main-app>/inv/<id>/eeprom
+	def update_eeprom(self):
+		if self.bic is not None and self.bic.ledger is not None:
+			jpl = json.dumps(self.bic.ledger.stat_get(), sort_keys=False, indent=4)
+			global mqttc
+			mqttc.publish(MQTT_T_APP + '/inv/' + str(self.id) +  '/eeprom',jpl,0,True) # retained
+
+	# @topic-pub <main-app>/inv/<id>/canstats
+	def update_canstats(self):
+		if self.bic is not None:
+			d_stat = self.bic.canstats_get()
+			if self.sched is not None:
+				d_stat['sched'] = self.sched.stat_get()
+			jpl = json.dumps(d_stat, sort_keys=False, indent=4)
+			global mqttc
+			mqttc.publish(MQTT_T_APP + '/inv/' + str(self.id) +  '/canstats',jpl,0,True) # retained
+
+	""" publish the new bus state events, a recovery starts the liveness probe of an offline device at once
+		@topic-pub <main-app>/inv/<id>/canbus
+	"""
+	def update_canbus(self):
+		seq,lst_evt = self.bic.health.events_get(self.canbus_seq)
+		self.canbus_seq = seq
+		for d_evt in lst_evt:
+			lg.warning("dev id:{} can bus:{}".format(self.id,d_evt))
+			if 'downSec' in d_evt and self.offline is True:
+				self.probe_sec = CBicDevBase.PROBE_MIN_SEC
+				self.ts_probe = 0
+			jpl = json.dumps(d_evt, sort_keys=False, indent=4)
+			global mqttc
+			mqttc.publish(MQTT_T_APP + '/inv/' + str(self.id) +  '/canbus',jpl,0,False) # not retained
+
 	def __str__(self):
 		return "dev id:{} cfg-cv:{} cfg-dv:{} cc:{} cfg-dc:{}".format(self.id,self.cfg_max_vcharge100,self.cfg_min_vdischarge100,self.cfg_max_ccharge100,self.cfg_max_cdischarge100)
 
 	def start(self):
 		lg.info('dev id:{} start'.format(self.id))
-		CBic.can_up(self.can_chan_id,250000)
-		self.bic = CBic(self.can_chan_id,self.can_adr)
+		if self.cfg_can_if != 'native-slcan':
+			CBic.can_up(self.can_chan_id,self.can_bit_rate)
+		self.bic = CBic(self.can_chan_id,self.can_adr,can_bus=CCanBus.get(self.can_chan_id,self.cfg_can_if,self.can_bit_rate),bit_rate=self.can_bit_rate)
 		if self.bic is None:
 			raise RuntimeError('dev init can at startup')
-		ret = self.bic.statusread()
+		self.bic.tmo_set(self.cfg_can_tmo_min_ms / 1000,self.cfg_can_tmo_max_ms / 1000,self.cfg_can_retry)
+		fname_ledger = os.path.join(self.cfg_eeprom_path,'eeprom_{}_{:08x}.json'.format(self.can_chan_id,self.can_adr))
+		ledger = CEepromLedger(fname_ledger)
+		self.eeprom_ledger_cfg(ledger)
+		self.bic.eeprom_ledger_set(ledger)
+		self.bic.info_cache_set(os.path.join(self.cfg_info_path,'info_{}_{:08x}.json'.format(self.can_chan_id,self.can_adr)))
+		if len(self.cfg_can_rec_fname) >0:
+			lg.info('dev id:{} record can transactions to:{}'.format(self.id,self.cfg_can_rec_fname))
+			self.bic.rec_start(self.cfg_can_rec_fname)
+		try:
+			ret = self.bic.statusread()
+		except CCanTimeoutError as err:
+			lg.error("dev can't read status:" + str(err))
+			ret = None
 		self.update_info()
 		if ret is None:
 			self.onl_mode = CBicDevBase.e_onl_mode_offline
@@ -584,15 +855,22 @@ class CBicDevBase():
 			self.onl_mode = CBicDevBase.e_onl_mode_init
 			# set the charge and discharge values of the battery
 			self.charge_set_idle()
-			self.bic.charge_voltage(CBic.e_cmd_write,self.cfg_max_vcharge100)
-			self.bic.discharge_current(CBic.e_cmd_write,self.cfg_min_cdischarge100)
-			self.bic.operation(1)
+			try:
+				self.bic.charge_voltage(CBic.e_cmd_write,self.cfg_max_vcharge100)
+				self.bic.discharge_current(CBic.e_cmd_write,self.cfg_min_cdischarge100)
+			except CCanTimeoutError as err:
+				lg.error("dev can't set init value:" + str(err))
+			self.operation_set(1)
 
-		op_mode = self.bic.operation_read()
+		try:
+			op_mode = self.bic.operation_read()
+		except CCanTimeoutError:
+			op_mode = None
 
 		if op_mode is None:
 			self.state['opMode'] = 0
 			self.state['onlMode'] = 0 # offline, read error
+			self.offline_start = self.onl_mode == CBicDevBase.e_onl_mode_offline
 		else:
 			self.state['opMode'] = op_mode
 			if op_mode ==0:
@@ -600,6 +878,7 @@ class CBicDevBase():
 			else:
 				self.onl_mode = CBicDevBase.e_onl_mode_running
 
+		self.sched = CBicSched(self.bic)
 		lg.info('dev id:{} started op:{} onl:{}'.format(self.id,op_mode,self.onl_mode))
 		#main_exit()
 
@@ -607,8 +886,28 @@ class CBicDevBase():
 		lg.warning("device stoped id:" + str(self.id))
 		self.charge_set_idle()
 		#self.bic.operation(0)
+		if self.sched is not None:
+			self.sched.stop(5) # run the pending jobs
+			self.sched = None
 		self.onl_mode = CBicDevBase.e_onl_mode_offline
 		self.update_state()
+		if self.bic.ledger is not None:
+			self.bic.ledger.flush() # eeprom write counters
+
+	""" queue a can job (CBicSched), direct call without scheduler
+		@param deadline_sec drop a read job that can't start in time
+		@param key replace a pending job with the same key
+	"""
+	def sched_submit(self,prio : int,func,*args,deadline_sec = None,key = None):
+		if self.sched is None:
+			return func(*args)
+		fut = self.sched.submit(prio,func,*args,deadline_sec=deadline_sec,key=key)
+		fut.add_done_callback(self.sched_done)
+		return fut
+
+	def sched_done(self,fut):
+		if fut.cancelled() is False and fut.exception() is not None:
+			lg.error("dev id:{} can job failed:{}".format(self.id,fut.exception()))
 
 	# poll values from bic/inverter
 	# @topic-pub <main-app>/inv/<id>/fault
@@ -619,7 +918,8 @@ class CBicDevBase():
 			os._exit(1)
 
 		def fault_check_update(force = False):
-			fault_update = self.bic.faultread()
+			self.bic.status_snapshot() # fault, status and operation in one burst
+			fault_update = self.bic.fault_changed
 			if fault_update is True or force == True:
 				jpl = json.dumps(self.bic.d_fault, sort_keys=False, indent=4)
 				global mqttc
@@ -627,16 +927,33 @@ class CBicDevBase():
 
 		self.sp.poll(self.pow_surplus,1)
 
+		if App.ts_1min == 2:
+			self.update_eeprom()
+
+		if App.ts_1min == 3:
+			self.update_canstats()
+
+		# bus-off without kernel restart or a dead socket
+		if self.bic.health.recover_due() is True:
+			self.sched_submit(CBicSched.e_prio_safety,self.bic.can_recover,key='canRecover')
+		self.update_canbus()
+
+		if self.offline_check() is True:
+			return
+
 		if App.ts_1min == 1:
-			fault_check_update(True)
+			self.sched_submit(CBicSched.e_prio_fast,fault_check_update,True,deadline_sec=1,key='faultForce')
 
 		if App.ts_6sec == 1:
-			fault_check_update()
+			self.sched_submit(CBicSched.e_prio_fast,fault_check_update,deadline_sec=1,key='fault')
 		elif App.ts_6sec == 2:
 			pass
 
+		if self.bic.eeprom_flush_due() is True:
+			self.sched_submit(CBicSched.e_prio_setpoint,self.bic.eeprom_flush,key='eepromFlush') # deferred eeprom writes
+
 		if (App.uptime_min % 60)==0:
-			self.update_info()
+			self.sched_submit(CBicSched.e_prio_diag,self.update_info,deadline_sec=60,key='info')
 
 		if self.tmo_info_ms >=0:
 			self.tmo_info_ms -= timeslive_ms
@@ -648,19 +965,22 @@ class CBicDevBase():
 			self.tmo_state_ms -= timeslive_ms
 		else:
 			self.tmo_state_ms = self.cfg_tmo_state_ms
-			self.update_state()
+			self.sched_submit(CBicSched.e_prio_slow,self.update_state,deadline_sec=self.cfg_tmo_state_ms / 1000,key='state')
 
 		if self.tmo_charge_ms >=0:
 			self.tmo_charge_ms -= timeslive_ms
 		else:
 			self.tmo_charge_ms = self.cfg_tmo_charge_ms
-			self.update_charge()
+			self.sched_submit(CBicSched.e_prio_fast,self.update_charge,deadline_sec=self.cfg_tmo_charge_ms / 1000,key='charge')
 
-	""" set a new charge value in [A]
+	""" set a new charge value in [A], queued before all telemetry reads
 		val >0 charging the bat
 		val <0 discharging the bat
 	"""
 	def charge_set_amp(self,val_amp : float):
+		self.sched_submit(CBicSched.e_prio_setpoint,self.charge_set_amp_run,val_amp,key='setpoint')
+
+	def charge_set_amp_run(self,val_amp : float):
 		if self.onl_mode >= CBicDevBase.e_onl_mode_idle:
 			try:
 				val_amp = round(val_amp,1)
@@ -675,8 +995,7 @@ class CBicDevBase():
 						lg.warning("dev max charge reached set charge value to:{}A".format(val_amp))
 					elif amp100 < self.cfg_min_ccharge100:
 						amp100=self.cfg_min_ccharge100
-					self.bic.BIC_chargemode(CBic.e_charge_mode_charge)
-					self.bic.charge_current(CBic.e_cmd_write,amp100)
+					self.bic.charge_set(CBic.e_charge_mode_charge,amp100)
 				elif amp100 < 0:
 					amp100 = abs(amp100)
 					if amp100 > self.cfg_max_cdischarge100:
@@ -684,8 +1003,7 @@ class CBicDevBase():
 						lg.warning("dev max discharge reached set discharge value to:{}A".format(-amp100 / 100))
 					elif amp100 < self.cfg_min_cdischarge100:
 						amp100=self.cfg_min_cdischarge100
-					self.bic.BIC_chargemode(CBic.e_charge_mode_discharge)
-					self.bic.discharge_current(CBic.e_cmd_write,amp100)
+					self.bic.charge_set(CBic.e_charge_mode_discharge,amp100)
 				return 0
 			except Exception as err:
 				lg.error("dev can't set charge value:" + str(err))
@@ -696,17 +1014,37 @@ class CBicDevBase():
 		return -1
 
 
-	# set charging to neutral position nearby 0.8A charging
+	""" switch the output on(1) off(0) or toggle(2)
+		@return operation mode, None if the device did not reply
+	"""
+	def operation_set(self,val : int):
+		try:
+			if self.sched is not None:
+				return self.sched.call(CBicSched.e_prio_safety,self.bic.operation,val,tmo=CBicDevBase.SCHED_CALL_TMO_SEC)
+			return self.bic.operation(val)
+		except CCanTimeoutError as err:
+			lg.error("dev can't set operation mode:" + str(err))
+		except FutureTimeoutError:
+			lg.error("dev can't set operation mode:{} can job timeout".format(val))
+		return None
+
+	# set charging to neutral position nearby 0.8A charging, replaces a pending setpoint
 	def charge_set_idle(self):
+		self.shaper.reset()
+		self.charge_pow_set = 0
+		self.sched_submit(CBicSched.e_prio_safety,self.charge_set_idle_run,key='setpoint')
+
+	def charge_set_idle_run(self):
 		try:
-			self.bic.charge_current(CBic.e_cmd_write,self.cfg_min_ccharge100)
-			self.bic.discharge_current(CBic.e_cmd_write,self.cfg_min_cdischarge100)
-			self.bic.BIC_chargemode(CBic.e_charge_mode_charge)
+			self.bic.write_many({CBic.e_cmd_IOUT_SET:self.cfg_min_ccharge100,CBic.e_cmd_REVERSE_IOUT_SET:self.cfg_min_cdischarge100,
+								CBic.e_cmd_DIRECTION_CTRL:CBic.e_charge_mode_charge},safety=True)
 		except Exception as err:
 			lg.error("dev can't set idle value:" + str(err))
 
 	def charge_set_pow(self,val_pow:int):
-		if self.charge_pow_set == val_pow:
+		val_pow = self.shaper.shape(val_pow)
+		self.charge['setSuppressed'] = self.shaper.cnt_suppressed
+		if val_pow is None or self.charge_pow_set == val_pow:
 			return
 		self.charge_pow_set = val_pow
 
@@ -739,6 +1077,8 @@ class CBicDev2200_24(CBicDevBase):
 
 	# special config
 	# @param dbkey-int [DEVICE]Id/X/CanBitrate def:250000
+	# @param dbkey-str [DEVICE]Id/X/CanChannel def:"can0"
+	# @param dbkey-int [DEVICE]Id/X/CanDevId def:X [0..7] device id (jumper block) on the can bus
 	def cfg(self,ini,reload = False):
 		def kpfx(str_tail : str):
 			return "Id/{}/{}".format(self.id,str_tail)
@@ -746,6 +1086,8 @@ class CBicDev2200_24(CBicDevBase):
 		super().cfg(ini)
 		if self.id >=0:
 			self.can_bit_rate = ini.get_int('DEVICE',kpfx("CanBitrate"),250000)
+			self.can_chan_id = ini.get_str('DEVICE',kpfx("CanChannel"),self.can_chan_id)
+			self.can_adr = 0x000C0300 + (ini.get_int('DEVICE',kpfx("CanDevId"),self.id) & 0x07)
 			return 0
 		else:
 			return -1
@@ -777,6 +1119,8 @@ class CBicDev2200_24(CBicDevBase):
 
 	# special config
 	# @param dbkey-int [DEVICE]Id/X/CanBitrate def:250000
+	# @param dbkey-str [DEVICE]Id/X/CanChannel def:"can0"
+	# @param dbkey-int [DEVICE]Id/X/CanDevId def:X [0..7] device id (jumper block) on the can bus
 	def cfg(self,ini,reload = False):
 		def kpfx(str_tail : str):
 			return "Id/{}/{}".format(self.id,str_tail)
@@ -784,6 +1128,8 @@ class CBicDev2200_24(CBicDevBase):
 		super().cfg(ini)
 		if self.id >=0:
 			self.can_bit_rate = ini.get_int('DEVICE',kpfx("CanBitrate"),250000)
+			self.can_chan_id = ini.get_str('DEVICE',kpfx("CanChannel"),self.can_chan_id)
+			self.can_adr = 0x000C0300 + (ini.get_int('DEVICE',kpfx("CanDevId"),self.id) & 0x07)
 			return 0
 		else:
 			return -1
@@ -1202,7 +1548,7 @@ class CChargeCtrlWinter(CChargeCtrlBase):
 			if self.check_delay_waiting() is True:
 				return
 			self.dev_bic.charge_set_pow(0)
-			self.dev_bic.bic.operation(0)
+			self.dev_bic.operation_set(0)
 			self.sm_tmo_delay_sec=2*60
 			self.sm = CChargeCtrlWinter.eSM_ChageCtrlCheckDelay
 		elif self.sm == CChargeCtrlWinter.eSM_ChageCtrlCheckDelay: # app start, check capacity of the bat first
@@ -1227,21 +1573,21 @@ class CChargeCtrlWinter(CChargeCtrlBase):
 
 			lg.info('bat cap:{}[%] min/max:{}/{} new state:{}'.format(cap_bat_pc,self.cfg_min_cap_pc,self.cfg_max_cap_pc,CChargeCtrlWinter.sCharge[self.sm]))
 			if new_calc_pow != 0:
-				self.dev_bic.bic.operation(1)
+				self.dev_bic.operation_set(1)
 			self.dev_bic.charge_set_pow(new_calc_pow)
 		elif self.sm == CChargeCtrlWinter.eSM_ChageCtrlCharge: # capacity is lower than maxCapacity
 			if (cap_bat_pc -10) >= self.cfg_max_cap_pc:
 				self.sm = CChargeCtrlWinter.eSM_ChageCtrlCheckDelay
 				lg.info('Stop charging reached:{}[%]'.format(cap_bat_pc))
 				self.dev_bic.charge_set_pow(0)
-				self.dev_bic.bic.operation(0)
+				self.dev_bic.operation_set(0)
 				self.sm_tmo_delay_sec=3600
 		elif self.sm == CChargeCtrlWinter.eSM_ChageCtrlDischarge: # capacity is lower than maxCapacity
 			if (cap_bat_pc-10) <= self.cfg_max_cap_pc:
 				self.sm = CChargeCtrlWinter.eSM_ChageCtrlCheckDelay
 				lg.info('Stop discharging reached:{}[%]'.format(cap_bat_pc))
 				self.dev_bic.charge_set_pow(0)
-				self.dev_bic.bic.operation(0)
+				self.dev_bic.operation_set(0)
 				self.sm_tmo_delay_sec=3600
 		elif self.sm == CChargeCtrlWinter.eSM_ChageCtrlStoped:	# capacity is between minCapacity and maxCapacity
 			if self.check_delay_waiting() is False:
@@ -1679,34 +2025,36 @@ class App:
 			self.ini.reload()
 			for dev in self.dev_bic.values():
 				dev.cfg(self.ini,True)
-				dev.cc.cfg(self.ini,True)
+				if dev.cc is not None:
+					dev.cc.cfg(self.ini,True)
 			return
 
-		# @future-use iterate over all bic's
-		id = 0
-		dev_type = ini.get_str('DEVICE','Id/{}/Type'.format(id),"")
-		if dev_type == 'BIC2200-24CAN':
-			dev = CBicDev2200_24(id)
+		# all bic's on the can bus: BIC-2200 device id 00-07
+		for id in range(8):
+			dev_type = ini.get_str('DEVICE','Id/{}/Type'.format(id),"")
+			if dev_type == 'BIC2200-24CAN':
+				dev = CBicDev2200_24(id)
+			else:
+				continue
 			dev.cfg(ini)
 			self.dev_bic[id] = dev
-			if len(self.dev_bic) >0:
-				lst_sub = ['charge/set','state/set','control/set']
-				for sub in lst_sub:
-					msg = CMQTT.CMSG(dev.top_inv + "/" + sub,"dummypl")
-					msg.cb = self.cb_mqtt_sub_event
-					msg.cb_user_data = dev
-					mqttc.append_subscribe(msg)
-
-		cc_type = ini.get_str('CHARGE_CONTROL','Id/{}/Type'.format(id),"PID").lower()
-		if cc_type == 'pid':
-			dev.cc = CChargeCtrlPID(dev)
-		elif cc_type == 'winter':
-			dev.cc = CChargeCtrlWinter(dev)
-			#dev.cc = CChargeCtrlSimple(dev)
-		else:
-			dev.cc = None
-		if dev.cc is not None:
-			dev.cc.cfg(ini)
+			lst_sub = ['charge/set','state/set','control/set']
+			for sub in lst_sub:
+				msg = CMQTT.CMSG(dev.top_inv + "/" + sub,"dummypl")
+				msg.cb = self.cb_mqtt_sub_event
+				msg.cb_user_data = dev
+				mqttc.append_subscribe(msg)
+
+			cc_type = ini.get_str('CHARGE_CONTROL','Id/{}/Type'.format(id),"PID").lower()
+			if cc_type == 'pid':
+				dev.cc = CChargeCtrlPID(dev)
+			elif cc_type == 'winter':
+				dev.cc = CChargeCtrlWinter(dev)
+				#dev.cc = CChargeCtrlSimple(dev)
+			else:
+				dev.cc = None
+			if dev.cc is not None:
+				dev.cc.cfg(ini)
 
 	""" set charging parameter
 		@topic-sub <main-app>/inv/<id>/charge/set {"var":[chargeA,chargeP],"val":[ampere or power]}
@@ -1725,15 +2073,20 @@ class App:
 						dev.charge_set_pow(dpl['val'])
 					elif dpl['var'] == 'cfgReload':
 						self.cfg(self.ini,True) # config reload
+					elif dpl['var'] == 'infoRefresh':
+						dev.sched_submit(CBicSched.e_prio_diag,dev.update_info,True,deadline_sec=60,key='info') # read the device info again
 			except:
 				pass
 		elif dev.top_inv + "/state/set" == mqtt_msg.topic:
 			if mqtt_msg.payload == '1':
-				dev.op_mode = dev.bic.operation(1) # on
+				op_mode = dev.operation_set(1) # on
 			elif mqtt_msg.payload == '2':
-				dev.op_mode = dev.bic.operation(2) # toggle
+				op_mode = dev.operation_set(2) # toggle
 			else:
-				dev.op_mode = dev.bic.operation(0)
+				op_mode = dev.operation_set(0)
+			if op_mode is None:
+				return
+			dev.op_mode = op_mode
 			dev.state['opMode'] = dev.op_mode
 			lg.info('set operation mode:' + str(dev.op_mode))
 			if dev.op_mode > 0:
@@ -11,7 +11,7 @@
 # - variables plausibility check
 # - programming missing functions
 # - current and voltage maximum settings
-VER = "0.2.791"
+VER = "0.3.03"
 # steve 08.06.2023  Version 0.2.1
 # steve 10.06.2023  Version 0.2.2
 # macGH 15.06.2023  Version 0.2.3
@@ -45,11 +45,58 @@ VER = "0.2.791"
 # hamstie 10.07.2024 Version 0.2.77 catch value error
 # hamstie 30.07.2024 Version 0.2.78 rs232-can device shutdown, wrong function was called
 # hamstie 28-09-2024 Version 0.2.791 fan read function (only working later "firmRev": "0xd0e")
+# hamstie 17.10.2026 Version 0.2.80 decode the received can frames binary (msg.data), check the echoed command
+#       - precomputed read request frames, signed current decoder
+# hamstie 17.10.2026 Version 0.2.81 socketcan filter for the response id of the device
+#       - match each reply by the echoed command, drop and count stale or foreign frames
+# hamstie 17.10.2026 Version 0.2.82 read_many() pipelined read of several commands, status_snapshot()
+# hamstie 17.10.2026 Version 0.2.83 AsyncCBic asyncio interface (python-can Notifier/AsyncBufferedReader)
+# hamstie 17.10.2026 Version 0.2.84 optional background receive thread CCanRx, drains the bus continuously
+# hamstie 17.10.2026 Version 0.2.85 read-through register cache with time to live for each command
+# hamstie 17.10.2026 Version 0.2.86 CEepromLedger persisted eeprom write counter, write budget and write limiter
+# hamstie 17.10.2026 Version 0.2.87 CCanBus one shared can bus per channel for several devices
+# hamstie 17.10.2026 Version 0.2.88 can interface type as parameter e.g. python-can 'virtual' (cbicsim.py)
+# hamstie 17.10.2026 Version 0.2.89 CCanRec can transaction recorder, CCanReplayBus replay of a recorded session
+# hamstie 17.10.2026 Version 0.2.90 adaptive read timeout of each command (CCanRtt), bounded read retries
+#       + CCanTimeoutError instead of None if the device did not reply
+# hamstie 17.10.2026 Version 0.2.91 CCanStat latency histogram of each command, frame counters and bus load, canstats_get()
+# hamstie 17.10.2026 Version 0.2.92 persisted device info, dump() validates it with the firmware revision
+# hamstie 17.10.2026 Version 0.2.93 serve: resident server with a unix socket json api, the command line verbs are forwarded to it
+# hamstie 17.10.2026 Version 0.2.94 CBicSched priority request scheduler, setpoint writes before telemetry reads
+# hamstie 17.10.2026 Version 0.2.95 write_many() shadow registers and one verify burst, charge_set() direction and current in one transaction
+# hamstie 17.10.2026 Version 0.2.96 watch: sample registers at a fixed rate, ndjson output
+# hamstie 17.10.2026 Version 0.2.97 scan: find all BIC-2200 and NPB devices on the bus in one round trip
+# hamstie 17.10.2026 Version 0.2.98 cnt_tmo_seq counter of consecutive reads without any reply
+# hamstie 17.10.2026 Version 0.2.99 CCanTxQueue bounded transmit queue with frame deadlines, short kernel queue (CAN_TXQUEUELEN)
+# hamstie 17.10.2026 Version 0.3.00 CCanHealth error frames, bus-off and socket errors, kernel restart-ms, can_recover()
+# hamstie 17.10.2026 Version 0.3.01 CCanSock native AF_CAN backend (CAN_INTERFACE 'native'), python-can is optional
+# hamstie 17.10.2026 Version 0.3.02 CCanSlcan slcan serial adapter without slcand (USE_RS232_CAN = 2), batched burst writes
+# hamstie 17.10.2026 Version 0.3.03 register map CBic.d_reg (CReg): width, sign, scale, unit, eeprom, access, device
+#       + reg_read()/reg_write() typed values, accessors from the map, signed temperature, NPB charge curve registers
 
 import os
-import can
 import sys
 import time
+import random
+import struct
+import threading
+import socket
+import socketserver
+import select
+import errno
+import termios
+import tty
+import contextlib
+import io
+import bisect
+import heapq
+from concurrent.futures import Future,TimeoutError as FutureTimeoutError
+import math
+import json
+from datetime import date
+from collections import deque
+can = None # python-can is optional, imported with the first python-can bus (can_import)
+asyncio = None # imported with the first AsyncCBic
 
 error = 0
 
@@ -67,6 +114,13 @@ CAN_ADR = 0x000C0300
 #
 #NPB-1200
 #CAN_ADR = 0x000C0103
+#
+#the device replies with ID bit 8 cleared: BIC-2200 0x000C02XX, NPB 0x000C00XX
+CAN_ADR_RSP_MASK = ~0x100
+#
+#base ids of the device types for the bus scan, BIC-2200 device id 0..7, NPB 0..3
+CAN_ADR_BIC = 0x000C0300
+CAN_ADR_NPB = 0x000C0100
 #########################
 
 #########################
@@ -74,9 +128,26 @@ CAN_ADR = 0x000C0300
 #e.g. USB-Tin www.fischl.de
 # If you use a CAN Hat (waveshare) set USE_RS232_CAN = 0
 #Add the rigth /dev/tty device here
+#USE_RS232_CAN = 2: the serial device is used directly with the slcan protocol (CCanSlcan), no slcand and no root
 USE_RS232_CAN = 0
 CAN_DEVICE = '/dev/ttyACM0'
 
+#python-can interface type, 'virtual' for the simulated device (cbicsim.py)
+#'native': raw AF_CAN socket without python-can (CCanSock), used for 'socketcan' if python-can is not installed
+CAN_INTERFACE = 'socketcan'
+
+#bit rate of the can bus
+CAN_BITRATE = 250000
+
+#kernel restart of the can controller after a bus-off [ms] (can_up), 0: no automatic restart
+CAN_RESTART_MS = 100
+
+#kernel transmit queue length (can_up), short: no stale backlog if the bus is unhealthy (CCanTxQueue)
+CAN_TXQUEUELEN = 16
+
+#unix socket of the resident server (cbic2200.py serve), the command line verbs are forwarded to it
+SERVE_SOCKET = '/tmp/cbic2200.sock'
+
 #########################
 
 def bic22_commands():
@@ -119,6 +190,16 @@ def bic22_commands():
     print("       can_down             -- shut can bus down")
     print("")
     print("       init_mode            -- init BIC-2200 bi-directional battery mode")
+    print("       scan                 -- find all BIC-2200 and NPB devices on the bus")
+    print("")
+    print("       regs                 -- list the register map with unit and access")
+    print("       reg <name> [value]   -- read or write a register in its unit e.g. reg VOUT_SET 27.5")
+    print("")
+    print("       watch --regs vread,cread [--hz 10] [--json] [--out file] [--count n]")
+    print("                            -- sample the registers at a fixed rate (read verbs or register names)")
+    print("")
+    print("       serve [socket]       -- keep the device open, serve the commands on a unix socket")
+    print("                               the commands above are forwarded to a running server")
     print("")
     print("       <value> = amps or volts * 100 --> 25,66V = 2566")
     print("")
@@ -140,6 +221,1067 @@ def get_high_low_byte(val: int):
     lb = int(val) & 0xff
     return (hb,lb)
 
+#########################################
+# can frame functions
+# request: [cmd_lb,cmd_hb,(val_lb,val_hb)], the reply echos the command [cmd_lb,cmd_hb,data...]
+_st_cmd = struct.Struct('<H')
+_st_cmd_byte = struct.Struct('<HB')
+_st_cmd_word = struct.Struct('<HH')
+_st_sword = struct.Struct('<h')
+_d_frame_read = {} # cmd -> read request frame, build once for each command
+
+def can_frame_read(cmd :int):
+    frame = _d_frame_read.get(cmd)
+    if frame is None:
+        frame = _d_frame_read[cmd] = _st_cmd.pack(cmd)
+    return frame
+
+# @param size 1:byte 2:word
+def can_frame_write(cmd :int,val :int,size=2):
+    if size == 1:
+        return _st_cmd_byte.pack(cmd,int(val) & 0xff)
+    return _st_cmd_word.pack(cmd,int(val) & 0xffff)
+
+# @return the echoed command of a reply frame
+def can_frame_cmd(data):
+    return _st_cmd.unpack_from(data)[0]
+
+# reply decoder, raise struct.error/IndexError for short frames
+def dec_word(data):
+    return _st_cmd.unpack_from(data,2)[0]
+
+def dec_sword(data):
+    return _st_sword.unpack_from(data,2)[0]
+
+def dec_byte(data):
+    return data[2]
+
+def dec_char(data):
+    if len(data) < 8:
+        raise IndexError('frame too short')
+    return bytes(data[2:8]).decode()
+
+#########################################
+# register map
+class CReg:
+    """ register of the BIC-2200/NPB, one entry of the register map CBic.d_reg
+        - the reply decoder and the read request frame are built once from width and signedness
+        - value(): register value -> value in the unit, raw(): value in the unit -> register value
+        @param width 1:byte 2:word 6:ascii chars
+        @param scale unit value of one register step e.g. 0.01 [V]
+        @param access 'r','rw'
+        @param ttl register cache time to live [s]
+        @param dev e_dev_bic, e_dev_npb or both
+    """
+    e_dev_bic = 0x01
+    e_dev_npb = 0x02
+    e_dev_all = 0x03
+    __slots__ = ('cmd','name','width','signed','scale','unit','eeprom','access','ttl','dev','dec','digits','frame_read')
+
+    def __init__(self,cmd :int,width=2,signed=False,scale=1,unit='',eeprom=False,access='r',ttl=0,dev=e_dev_all):
+        self.cmd = cmd
+        self.name = hex(cmd) # set with the register map (CBic.d_cmd_name)
+        self.width = width
+        self.signed = signed
+        self.scale = scale
+        self.unit = unit
+        self.eeprom = eeprom
+        self.access = access
+        self.ttl = ttl
+        self.dev = dev
+        if width == 1:
+            self.dec = dec_byte
+        elif width == 6:
+            self.dec = dec_char
+        else:
+            self.dec = dec_sword if signed else dec_word
+        self.digits = max(0,-math.floor(math.log10(scale))) if scale < 1 else 0
+        self.frame_read = can_frame_read(cmd)
+
+    # @return decoded register value in the unit (scale), None stays None
+    def value(self,raw):
+        if raw is None or self.width == 6 or self.scale == 1:
+            return raw
+        return round(raw * self.scale,self.digits)
+
+    # @return register value of a value in the unit
+    def raw(self,val):
+        return int(round(float(val) / self.scale))
+
+    def __str__(self):
+        return "{:<22} 0x{:04x} {} {:<6} {:<3} {}{}".format(self.name,self.cmd,self.access.ljust(2),self.scale,self.unit,
+            {CReg.e_dev_bic:'BIC',CReg.e_dev_npb:'NPB',CReg.e_dev_all:'BIC,NPB'}[self.dev],' eeprom' if self.eeprom else '')
+
+#########################################
+# read timeout
+class CCanTimeoutError(TimeoutError):
+    """ the device did not reply, raised by CBic.can_read() and CBic.read_many()
+        - lst_cmd: commands without a reply
+        - d_val: cmd -> decoded value of all requested commands, None for a missing reply
+    """
+    def __init__(self,can_adr :int,lst_cmd,d_val=None):
+        self.can_adr = can_adr
+        self.lst_cmd = lst_cmd
+        self.d_val = d_val if d_val is not None else dict.fromkeys(lst_cmd)
+        super().__init__('can read timeout adr:{} cmd:{}'.format(hex(can_adr),[hex(cmd) for cmd in lst_cmd]))
+
+#########################################
+# adaptive timeout
+class CCanRtt:
+    """ round trip time estimator for each command, the read timeout follows the measured latency
+        - smoothed round trip time and mean deviation (ewma, like the tcp retransmit timer rfc6298)
+        - timeout = srtt + 4*rttvar, limited to tmo_min..tmo_max
+        - a timeout doubles the timeout of the command (max. tmo_max), unknown commands use tmo_max
+    """
+    ALPHA = 0.125 # gain of the smoothed round trip time
+    BETA = 0.25 # gain of the mean deviation
+
+    def __init__(self,tmo_min=0.05,tmo_max=0.5):
+        self.tmo_min = tmo_min # [s]
+        self.tmo_max = tmo_max # [s]
+        self.d_rtt = {} # cmd -> [srtt,rttvar,tmo] [s]
+
+    def update(self,cmd :int,rtt :float):
+        e = self.d_rtt.get(cmd)
+        if e is None:
+            e = self.d_rtt[cmd] = [rtt,rtt / 2,0]
+        else:
+            e[1] = (1 - CCanRtt.BETA) * e[1] + CCanRtt.BETA * abs(e[0] - rtt)
+            e[0] = (1 - CCanRtt.ALPHA) * e[0] + CCanRtt.ALPHA * rtt
+        e[2] = min(max(e[0] + 4 * e[1],self.tmo_min),self.tmo_max)
+
+    def backoff(self,cmd :int):
+        e = self.d_rtt.get(cmd)
+        if e is not None:
+            e[2] = min(e[2] * 2,self.tmo_max)
+
+    # @return read timeout of the command [s]
+    def tmo_get(self,cmd :int):
+        e = self.d_rtt.get(cmd)
+        return self.tmo_max if e is None else e[2]
+
+    # @return dict command-name -> srtt and timeout [ms]
+    def stat_get(self):
+        return {CBic.d_cmd_name.get(cmd,hex(cmd)):{'rttMs':round(e[0] * 1000,1),'tmoMs':round(e[2] * 1000,1)} for cmd,e in self.d_rtt.items()}
+
+#########################################
+# can statistic
+class CCanStat:
+    """ latency histogram of each command, frame counters and bus load of the own can traffic
+        - fixed latency buckets, the last bucket counts the replies above HIST_BOUNDS_MS
+        - bus load: bits of the sent and received frames (without bit stuffing) per bit time
+    """
+    HIST_BOUNDS_MS = (1,2,5,10,20,50,100,200,500) # upper bounds of the latency buckets [ms]
+    FRAME_BITS_EXT = 67 # bits of an extended frame without data (sof,id,ctrl,crc,ack,eof,ifs)
+
+    class Cmd:
+        __slots__ = ('hist','tx','rx','tmo','retry')
+        def __init__(self):
+            self.hist = [0] * (len(CCanStat.HIST_BOUNDS_MS) + 1)
+            self.tx = 0 # read requests
+            self.rx = 0 # replies
+            self.tmo = 0 # requests without reply
+            self.retry = 0 # repeated requests
+
+    def __init__(self,bit_rate=CAN_BITRATE):
+        self.bit_rate = bit_rate
+        self.d_cmd = {} # cmd -> Cmd
+        self.tx_frames = 0
+        self.rx_frames = 0 # received replies
+        self.bits = 0 # bits since the last load_get()
+        self.ts_load = time.monotonic()
+
+    def cmd_get(self,cmd :int):
+        c = self.d_cmd.get(cmd)
+        if c is None:
+            c = self.d_cmd[cmd] = CCanStat.Cmd()
+        return c
+
+    def tx(self,dlc :int):
+        self.tx_frames += 1
+        self.bits += CCanStat.FRAME_BITS_EXT + 8 * dlc
+
+    def rx(self,cmd :int,dlc :int,latency :float):
+        self.rx_frames += 1
+        self.bits += CCanStat.FRAME_BITS_EXT + 8 * dlc
+        c = self.cmd_get(cmd)
+        c.rx += 1
+        c.hist[bisect.bisect_left(CCanStat.HIST_BOUNDS_MS,latency * 1000)] += 1
+
+    # @return bus load [%] of the own frames since the last call
+    def load_get(self):
+        t_now = time.monotonic()
+        t_diff = t_now - self.ts_load
+        load = 0 if t_diff <= 0 else 100 * self.bits / (self.bit_rate * t_diff)
+        self.bits = 0
+        self.ts_load = t_now
+        return round(load,2)
+
+    # @return dict with the frame counters, bus load and the histograms of each command-name
+    def stat_get(self):
+        d_stat = {}
+        d_stat['txFrames'] = self.tx_frames
+        d_stat['rxReplies'] = self.rx_frames
+        d_stat['bitRate'] = self.bit_rate
+        d_stat['busLoadPc'] = self.load_get()
+        d_stat['histBoundsMs'] = list(CCanStat.HIST_BOUNDS_MS)
+        d_cmd = {}
+        for cmd,c in self.d_cmd.items():
+            d_cmd[CBic.d_cmd_name.get(cmd,hex(cmd))] = {'tx':c.tx,'rx':c.rx,'tmo':c.tmo,'retry':c.retry,'hist':list(c.hist)}
+        d_stat['cmd'] = d_cmd
+        return d_stat
+
+#########################################
+# bus health
+class CCanHealth:
+    """ bus state from the socketcan error frames (enabled by python-can) and socket errors
+        - error warning/passive, bus-off, restart of the controller by the kernel (CAN_RESTART_MS)
+        - warning/passive follow the error frames of the controller, a received frame ends a bus-off/down only
+        - recover_due(): bus-off without kernel restart or a dead socket for RECOVER_SEC,
+          CBic.can_recover() restarts the controller or reopens the socket once,
+          the next attempt after twice the interval (max. RECOVER_MAX_SEC) while the bus stays off
+        - each state change is an event, recoveries with the downtime, the last EVENT_MAX are kept
+    """
+    # socketcan error class (can id of an error frame), controller state in data[1]
+    CAN_ERR_CRTL = 0x004
+    CAN_ERR_ACK = 0x020
+    CAN_ERR_BUSOFF = 0x040
+    CAN_ERR_RESTARTED = 0x100
+    CAN_ERR_CRTL_WARNING = 0x0c
+    CAN_ERR_CRTL_PASSIVE = 0x30
+    CAN_ERR_CRTL_ACTIVE = 0x40
+
+    e_state_active = 0
+    e_state_warning = 1
+    e_state_passive = 2
+    e_state_bus_off = 3
+    e_state_down = 4 # socket error e.g. interface down or removed
+    s_state = ['active','warning','passive','busOff','down']
+
+    RECOVER_SEC = 3
+    RECOVER_MAX_SEC = 300
+    EVENT_MAX = 16
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.state = CCanHealth.e_state_active
+        self.ts_down = None # monotonic time of the last bus-off/down, None: bus is up
+        self.ts_recover = -math.inf # monotonic time of the last recovery attempt
+        self.recover_sec = CCanHealth.RECOVER_SEC # interval of the recovery attempts, doubled on each attempt
+        self.cnt_event = 0 # sequence number of the last event
+        self.lst_event = deque(maxlen=CCanHealth.EVENT_MAX)
+        self.lst_cb_recover = [] # called after a recovery e.g. send the pending frames
+        self.d_stat = {}
+        self.d_stat['errFrames'] = 0 # received error frames
+        self.d_stat['errNoAck'] = 0 # frames without ack, e.g. all devices off
+        self.d_stat['busOff'] = 0
+        self.d_stat['sockErr'] = 0 # receive errors of the socket
+        self.d_stat['recoveries'] = 0
+        self.d_stat['downSecLast'] = 0 # downtime of the last bus-off/down [s]
+        self.d_stat['downSecMax'] = 0
+
+    def _state_set(self,state :int,cause :str):
+        if state == self.state:
+            return
+        d_evt = {'ts':round(time.time(),3),'state':CCanHealth.s_state[state],'prevState':CCanHealth.s_state[self.state],'cause':cause}
+        ts = time.monotonic()
+        if state >= CCanHealth.e_state_bus_off and self.ts_down is None:
+            self.ts_down = ts
+        elif state < CCanHealth.e_state_bus_off and self.ts_down is not None:
+            down_sec = round(ts - self.ts_down,3)
+            self.ts_down = None
+            self.recover_sec = CCanHealth.RECOVER_SEC
+            d_evt['downSec'] = down_sec
+            self.d_stat['recoveries'] += 1
+            self.d_stat['downSecLast'] = down_sec
+            self.d_stat['downSecMax'] = max(self.d_stat['downSecMax'],down_sec)
+        self.state = state
+        self.cnt_event += 1
+        self.lst_event.append((self.cnt_event,d_evt))
+        if 'downSec' in d_evt:
+            for cb in self.lst_cb_recover:
+                cb()
+
+    # error frame of the receive thread
+    def on_err_frame(self,msg):
+        err = msg.arbitration_id
+        with self.lock:
+            self.d_stat['errFrames'] += 1
+            if err & CCanHealth.CAN_ERR_ACK:
+                self.d_stat['errNoAck'] += 1
+            if err & CCanHealth.CAN_ERR_BUSOFF:
+                self.d_stat['busOff'] += 1
+                self._state_set(CCanHealth.e_state_bus_off,'busOff')
+            elif err & CCanHealth.CAN_ERR_RESTARTED:
+                self._state_set(CCanHealth.e_state_active,'restarted')
+            elif err & CCanHealth.CAN_ERR_CRTL and len(msg.data) >= 2 and self.state < CCanHealth.e_state_bus_off:
+                ctrl = msg.data[1]
+                if ctrl & CCanHealth.CAN_ERR_CRTL_PASSIVE:
+                    self._state_set(CCanHealth.e_state_passive,'errPassive')
+                elif ctrl & CCanHealth.CAN_ERR_CRTL_WARNING:
+                    self._state_set(CCanHealth.e_state_warning,'errWarning')
+                elif ctrl & CCanHealth.CAN_ERR_CRTL_ACTIVE:
+                    self._state_set(CCanHealth.e_state_active,'errActive')
+
+    # a valid frame was received, the bus is up again, error warning/passive ends with the error frame of the controller
+    def on_rx(self):
+        if self.state >= CCanHealth.e_state_bus_off:
+            with self.lock:
+                self._state_set(CCanHealth.e_state_active,'rx')
+
+    # receive error of the socket
+    def on_sock_err(self,exc):
+        with self.lock:
+            self.d_stat['sockErr'] += 1
+            self._state_set(CCanHealth.e_state_down,str(exc))
+
+    # the recovery (restart, reopen) was successful
+    def on_recover(self,cause :str):
+        with self.lock:
+            self._state_set(CCanHealth.e_state_active,cause)
+
+    # @return True if the bus is off or down without recovery for RECOVER_SEC and the backoff of the last attempt is over
+    def recover_due(self):
+        if self.ts_down is None:
+            return False
+        ts = time.monotonic()
+        return ts - self.ts_down >= CCanHealth.RECOVER_SEC and ts - self.ts_recover >= self.recover_sec
+
+    # a recovery attempt starts, the next one after twice the interval
+    def recover_start(self):
+        with self.lock:
+            self.ts_recover = time.monotonic()
+            self.recover_sec = min(self.recover_sec * 2,CCanHealth.RECOVER_MAX_SEC)
+
+    # @return sequence number of the last event, list of the events after seq
+    def events_get(self,seq=0):
+        with self.lock:
+            return self.cnt_event,[d_evt for n,d_evt in self.lst_event if n > seq]
+
+    def stat_get(self):
+        d_stat = dict(self.d_stat)
+        d_stat['busState'] = CCanHealth.s_state[self.state]
+        return d_stat
+
+#########################################
+# background receive
+class CCanRx:
+    """ receive dispatcher for a python-can Notifier thread
+        - drains the bus continuously, no stale backlog in the kernel queue
+        - hands each reply to the oldest request waiting for the (response-id,command)
+        - counts dropped (no reply frame) and orphaned (nobody is waiting) frames
+        - error frames and socket errors update the bus health (CCanHealth)
+    """
+
+    class Wait:
+        __slots__ = ('event','msg','ts')
+        def __init__(self):
+            self.event = threading.Event()
+            self.msg = None # received reply, msg.timestamp is the receive time
+            self.ts = 0 # monotonic dispatch time of the reply
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.d_wait = {} # (adr,cmd) -> deque of Wait
+        self.d_stat = {}
+        self.d_stat['rxFrames'] = 0 # all received frames
+        self.d_stat['rxDrop'] = 0 # error frames or frames without command
+        self.d_stat['rxOrphan'] = 0 # replies nobody is waiting for, e.g. after a timeout
+        self.ts_last = 0 # timestamp of the last received frame
+        self.health = CCanHealth()
+
+    # register a request before sending it, @return Wait object
+    def expect(self,adr :int,cmd :int):
+        w = CCanRx.Wait()
+        with self.lock:
+            self.d_wait.setdefault((adr,cmd),deque()).append(w)
+        return w
+
+    # remove a request after a timeout
+    def cancel(self,adr :int,cmd :int,w):
+        with self.lock:
+            q = self.d_wait.get((adr,cmd))
+            if q is not None and w in q:
+                q.remove(w)
+
+    # listener of the python-can Notifier
+    def __call__(self,msg):
+        self.on_message_received(msg)
+
+    def on_message_received(self,msg):
+        self.d_stat['rxFrames'] += 1
+        self.ts_last = msg.timestamp
+        data = msg.data
+        if msg.is_error_frame:
+            self.d_stat['rxDrop'] += 1
+            self.health.on_err_frame(msg)
+            return
+        self.health.on_rx()
+        if len(data) < 2:
+            self.d_stat['rxDrop'] += 1
+            return
+        w = None
+        with self.lock:
+            q = self.d_wait.get((msg.arbitration_id,can_frame_cmd(data)))
+            if q:
+                w = q.popleft()
+        if w is None:
+            self.d_stat['rxOrphan'] += 1
+            return
+        w.msg = msg
+        w.ts = time.monotonic()
+        w.event.set()
+
+    # socket error of the notifier thread, handled: the thread keeps running, throttled
+    def on_error(self,exc):
+        self.health.on_sock_err(exc)
+        time.sleep(0.1)
+
+#########################################
+# native socketcan backend
+class CCanFrame:
+    """ can frame of the native backend, the python-can Message attributes used by CBic """
+    __slots__ = ('arbitration_id','data','is_extended_id','is_error_frame','timestamp')
+
+    def __init__(self,arbitration_id=0,data=b'',is_extended_id=True,is_error_frame=False,timestamp=0.0):
+        self.arbitration_id = arbitration_id
+        self.data = data
+        self.is_extended_id = is_extended_id
+        self.is_error_frame = is_error_frame
+        self.timestamp = timestamp
+
+    def __repr__(self):
+        return "CCanFrame(id:{:08x} data:{} err:{})".format(self.arbitration_id,bytes(self.data).hex(),self.is_error_frame)
+
+
+class CCanSock:
+    """ raw AF_CAN socket without python-can, CAN_INTERFACE 'native'
+        - the python-can bus methods used by CBic: send, recv, set_filters, shutdown
+        - struct packed classic can frames, kernel filter CAN_RAW_FILTER
+        - error frames (CAN_RAW_ERR_FILTER) for CCanHealth, kernel receive time SO_TIMESTAMP
+    """
+    _st_frame = struct.Struct('=IB3x8s') # struct can_frame
+    _st_filter = struct.Struct('=II') # struct can_filter
+    _st_timeval = struct.Struct('@ll')
+    CAN_EFF_FLAG = 0x80000000
+    CAN_ERR_FLAG = 0x20000000
+    CAN_EFF_MASK = 0x1FFFFFFF
+    CAN_RAW_ERR_FILTER = 2 # linux/can/raw.h, not in the socket module
+    SO_TIMESTAMP = 29 # asm-generic/socket.h
+
+    def __init__(self,channel='can0',can_filters=None):
+        self.channel = channel
+        self.sock = socket.socket(socket.AF_CAN,socket.SOCK_RAW,socket.CAN_RAW)
+        self.sock.setsockopt(socket.SOL_CAN_RAW,CCanSock.CAN_RAW_ERR_FILTER,CCanSock.CAN_EFF_MASK)
+        self.sock.setsockopt(socket.SOL_SOCKET,CCanSock.SO_TIMESTAMP,1)
+        self.set_filters(can_filters)
+        self.sock.bind((channel,))
+        self.cmsg_size = socket.CMSG_SPACE(CCanSock._st_timeval.size)
+
+    # python-can filter dicts (can_id,can_mask,extended), None or empty: all frames
+    def set_filters(self,can_filters=None):
+        data = CCanSock._st_filter.pack(0,0)
+        if can_filters:
+            lst_data = []
+            for flt in can_filters:
+                can_id = flt['can_id']
+                can_mask = flt['can_mask']
+                if 'extended' in flt:
+                    can_mask |= CCanSock.CAN_EFF_FLAG
+                    if flt['extended']:
+                        can_id |= CCanSock.CAN_EFF_FLAG
+                lst_data.append(CCanSock._st_filter.pack(can_id,can_mask))
+            data = b''.join(lst_data)
+        self.sock.setsockopt(socket.SOL_CAN_RAW,socket.CAN_RAW_FILTER,data)
+
+    # @param timeout wait for the transmit queue [s], None: fail at once if it is full
+    def send(self,msg,timeout=None):
+        can_id = msg.arbitration_id
+        if msg.is_extended_id:
+            can_id |= CCanSock.CAN_EFF_FLAG
+        if not select.select([],[self.sock],[],timeout or 0)[1]:
+            raise OSError(errno.ENOBUFS,"transmit buffer full")
+        self.sock.send(CCanSock._st_frame.pack(can_id,len(msg.data),bytes(msg.data)))
+
+    # @return received CCanFrame, None after the timeout [s]
+    def recv(self,timeout=None):
+        if not select.select([self.sock],[],[],timeout)[0]:
+            return None
+        frame,ancdata,flags,addr = self.sock.recvmsg(CCanSock._st_frame.size,self.cmsg_size)
+        can_id,dlc,data = CCanSock._st_frame.unpack_from(frame)
+        ts = 0.0
+        for level,typ,cdata in ancdata:
+            if level == socket.SOL_SOCKET and typ == CCanSock.SO_TIMESTAMP:
+                sec,usec = CCanSock._st_timeval.unpack_from(cdata)
+                ts = sec + usec / 1000000
+        return CCanFrame(can_id & CCanSock.CAN_EFF_MASK,data[:dlc],bool(can_id & CCanSock.CAN_EFF_FLAG),
+                         bool(can_id & CCanSock.CAN_ERR_FLAG),ts or time.time())
+
+    def shutdown(self):
+        self.sock.close()
+
+
+class CCanNotifier:
+    """ receive thread of the native backend, used like the python-can Notifier
+        - on_message_received() of each listener, socket errors to on_error(), the thread keeps running
+    """
+    def __init__(self,bus,lst_listener,timeout=0.5):
+        self.bus = bus
+        self.lst_listener = list(lst_listener)
+        self.timeout = timeout
+        self.running = True
+        self.thread = threading.Thread(target=self._run,name='can-rx',daemon=True)
+        self.thread.start()
+
+    def _run(self):
+        while self.running:
+            try:
+                msg = self.bus.recv(self.timeout)
+            except (OSError,ValueError) as e:
+                if self.running is False:
+                    break # socket closed by stop
+                for listener in self.lst_listener:
+                    listener.on_error(e)
+                continue
+            if msg is not None:
+                for listener in self.lst_listener:
+                    listener.on_message_received(msg)
+
+    def stop(self,timeout=5):
+        self.running = False
+        if self.thread is not threading.current_thread():
+            self.thread.join(timeout)
+
+
+class CCanSlcan:
+    """ slcan (lawicel) adapter on a serial device without slcand, can interface 'native-slcan'
+        - the python-can bus methods used by CBic: send, recv, set_filters, shutdown
+        - raw tty (termios), the frames of a burst are written at once (batch), buffered reads
+        - filters in software, the adapter sends all frames of the bus
+    """
+    d_bitrate_cmd = {10000:b'S0',20000:b'S1',50000:b'S2',100000:b'S3',125000:b'S4',
+                     250000:b'S5',500000:b'S6',800000:b'S7',1000000:b'S8'}
+    SERIAL_BAUD = termios.B115200 # uart adapters, ignored by usb cdc devices
+
+    def __init__(self,channel=CAN_DEVICE,can_filters=None,bitrate=CAN_BITRATE):
+        self.channel = channel
+        self.lock = threading.Lock() # send and batch
+        self.buf_rx = bytearray()
+        self.q_rx = deque() # received frames, not yet returned by recv
+        self.buf_tx = None # bytearray while a batch is open
+        self.lst_filter = []
+        self.cnt_nack = 0 # commands refused by the adapter (BEL)
+        self.fd = os.open(channel,os.O_RDWR | os.O_NOCTTY | os.O_NONBLOCK)
+        try:
+            tty.setraw(self.fd)
+            attr = termios.tcgetattr(self.fd)
+            attr[4] = attr[5] = CCanSlcan.SERIAL_BAUD
+            termios.tcsetattr(self.fd,termios.TCSANOW,attr)
+            termios.tcflush(self.fd,termios.TCIOFLUSH)
+            self._write(b'C\r' + CCanSlcan.d_bitrate_cmd[bitrate] + b'\rO\r') # close, bit rate, open
+        except (OSError,termios.error,KeyError):
+            os.close(self.fd)
+            raise
+        self.set_filters(can_filters)
+
+    # python-can filter dicts (can_id,can_mask,extended), None or empty: all frames
+    def set_filters(self,can_filters=None):
+        self.lst_filter = [(flt['can_id'],flt['can_mask']) for flt in can_filters or []]
+
+    def _write(self,data):
+        while len(data) >0:
+            if not select.select([],[self.fd],[],1.0)[1]:
+                raise OSError(errno.ETIMEDOUT,"slcan write timeout")
+            data = data[os.write(self.fd,data):]
+
+    # collect the sent frames, one write at the end
+    @contextlib.contextmanager
+    def batch(self):
+        with self.lock:
+            self.buf_tx = bytearray()
+        try:
+            yield
+        finally:
+            with self.lock:
+                data = self.buf_tx
+                self.buf_tx = None
+                if len(data) >0:
+                    self._write(data)
+
+    def send(self,msg,timeout=None):
+        data = bytes(msg.data)
+        if msg.is_extended_id:
+            line = b'T%08X%d%s\r' % (msg.arbitration_id,len(data),data.hex().upper().encode())
+        else:
+            line = b't%03X%d%s\r' % (msg.arbitration_id,len(data),data.hex().upper().encode())
+        with self.lock:
+            if self.buf_tx is not None:
+                self.buf_tx += line
+                return
+            self._write(line)
+
+    # @return frame of a received line, None for adapter replies (z,Z,V...) and filtered frames
+    def _parse(self,line):
+        if line[:1] == b'T':
+            adr,pos,ext = int(line[1:9],16),9,True
+        elif line[:1] == b't':
+            adr,pos,ext = int(line[1:4],16),4,False
+        else:
+            return None
+        dlc = line[pos] - 0x30
+        data = bytes.fromhex(line[pos+1:pos+1+2*dlc].decode())
+        if len(self.lst_filter) >0 and not any((adr & mask) == (can_id & mask) for can_id,mask in self.lst_filter):
+            return None
+        return CCanFrame(adr,data,ext,False,time.time())
+
+    # @return received CCanFrame, None after the timeout [s]
+    def recv(self,timeout=None):
+        t_end = None if timeout is None else time.monotonic() + timeout
+        while len(self.q_rx) == 0:
+            t_wait = None if t_end is None else max(t_end - time.monotonic(),0)
+            if not select.select([self.fd],[],[],t_wait)[0]:
+                return None
+            data = os.read(self.fd,4096)
+            if len(data) == 0:
+                raise OSError(errno.EIO,"slcan device closed")
+            self.cnt_nack += data.count(b'\a')
+            self.buf_rx += data.replace(b'\a',b'\r')
+            *lst_line,rest = self.buf_rx.split(b'\r')
+            self.buf_rx = bytearray(rest)
+            for line in lst_line:
+                try:
+                    msg = self._parse(bytes(line))
+                except (ValueError,IndexError):
+                    continue # corrupt line
+                if msg is not None:
+                    self.q_rx.append(msg)
+        return self.q_rx.popleft()
+
+    def shutdown(self):
+        try:
+            self._write(b'C\r')
+        except OSError:
+            pass
+        os.close(self.fd)
+
+# send errors of all backends, python-can errors after can_import
+CAN_ERRORS = (OSError,)
+
+# import python-can on demand, its import (asyncio) is not needed for the native backend
+# @return python-can module
+def can_import():
+    global can,CAN_ERRORS
+    if can is None:
+        import can
+        CAN_ERRORS = (can.CanError,OSError)
+    return can
+
+""" open a can bus
+    @param can_if 'native': CCanSock, 'native-slcan': CCanSlcan on the serial device can_chan_id,
+           other: python-can interface type, 'socketcan' is native without python-can
+    @param bit_rate bit rate of the slcan adapter (python-can: interfaces with a bitrate argument), socketcan: can_up
+"""
+def can_bus_open(can_chan_id :str,can_if=CAN_INTERFACE,can_filters=None,bit_rate=CAN_BITRATE):
+    if can_if == 'native':
+        return CCanSock(can_chan_id,can_filters)
+    if can_if == 'native-slcan':
+        return CCanSlcan(can_chan_id,can_filters,bit_rate)
+    try:
+        can_import()
+    except ImportError:
+        if can_if == 'socketcan':
+            return CCanSock(can_chan_id,can_filters)
+        raise ImportError("python-can is needed for the can interface:" + str(can_if))
+    return can.interface.Bus(channel = can_chan_id, interface = can_if, can_filters = can_filters, bitrate = bit_rate)
+
+# @return receive thread of the bus, python-can Notifier for python-can buses
+def can_notifier(bus,lst_listener):
+    if isinstance(bus,(CCanSock,CCanSlcan,CCanReplayBus)):
+        return CCanNotifier(bus,lst_listener,timeout=0.5)
+    return can_import().Notifier(bus,lst_listener,timeout=0.5)
+
+# @return frame to send with the bus, no python-can Message for the native backend
+def can_msg_new(bus,adr :int,data):
+    if isinstance(bus,(CCanSock,CCanSlcan,CCanReplayBus)):
+        return CCanFrame(adr,data)
+    return can_import().Message(arbitration_id=adr, data=data, is_extended_id=True)
+
+#########################################
+# bounded transmit queue
+class CCanTxQueue:
+    """ bounded transmit path in front of the short kernel queue (CAN_TXQUEUELEN)
+        - each frame carries a deadline, expired frames are dropped before they hit the wire
+        - a write frame replaces a pending write of the same register (superseded setpoint)
+        - frames the bus doesn't accept (no ack, bus off) stay pending, oldest first, max. TXQ_MAX,
+          they are sent with the next frame or flush()
+        - on_sent(msg) of a frame is called when the bus accepted it, e.g. record and count it
+    """
+    TXQ_MAX = 32
+
+    def __init__(self,can_chan):
+        self.can_chan = can_chan
+        self.lock = threading.Lock()
+        self.lst_pend = [] # [deadline,key,msg,on_sent] of the waiting frames, oldest first
+        self.d_stat = {}
+        self.d_stat['txQueued'] = 0 # frames waiting for the bus
+        self.d_stat['txQueuedMax'] = 0 # max. waiting frames
+        self.d_stat['txExpired'] = 0 # frames dropped after their deadline
+        self.d_stat['txSuperseded'] = 0 # write frames replaced by a newer value of the same register
+        self.d_stat['txOverflow'] = 0 # oldest frames dropped, queue full
+        self.d_stat['txRefused'] = 0 # send attempts refused by the bus
+
+    """ queue a frame and send all pending frames
+        @param deadline monotonic time, drop the frame if the bus doesn't accept it before
+        @param key e.g. (can id,command) of a write, replaces a pending frame with the same key
+        @param on_sent called with the frame when the bus accepted it, now or with a later flush
+        @return True if the frame was handed to the bus, False if it is still pending
+    """
+    def send(self,msg,deadline :float,key=None,on_sent=None):
+        with self.lock:
+            if key is not None:
+                for i,pend in enumerate(self.lst_pend):
+                    if pend[1] == key:
+                        del self.lst_pend[i]
+                        self.d_stat['txSuperseded'] += 1
+                        break
+            pend = [deadline,key,msg,on_sent]
+            self.lst_pend.append(pend)
+            if len(self.lst_pend) > CCanTxQueue.TXQ_MAX:
+                del self.lst_pend[0]
+                self.d_stat['txOverflow'] += 1
+            self._flush()
+            return all(p is not pend for p in self.lst_pend)
+
+    # send the pending frames, e.g. after a bus recovery
+    def flush(self):
+        with self.lock:
+            self._flush()
+
+    # drop all pending frames
+    def clear(self):
+        with self.lock:
+            self.lst_pend.clear()
+            self.d_stat['txQueued'] = 0
+
+    def _flush(self):
+        ts = time.monotonic()
+        while len(self.lst_pend) >0:
+            deadline,key,msg,on_sent = self.lst_pend[0]
+            if ts > deadline:
+                del self.lst_pend[0]
+                self.d_stat['txExpired'] += 1
+                continue
+            try:
+                self.can_chan.send(msg)
+            except CAN_ERRORS:
+                self.d_stat['txRefused'] += 1
+                break
+            del self.lst_pend[0]
+            if on_sent is not None:
+                on_sent(msg)
+        self.d_stat['txQueued'] = len(self.lst_pend)
+        self.d_stat['txQueuedMax'] = max(self.d_stat['txQueuedMax'],len(self.lst_pend))
+
+    def stat_get(self):
+        return dict(self.d_stat)
+
+#########################################
+# shared can bus
+class CCanBus:
+    """ one can bus (socket) per channel shared by all devices on it
+        - one receive thread (CCanRx) demultiplexes the replies by response id and command
+        - kernel filter for the response ids of all attached devices
+        - the request bursts of the devices are sent one after another (lock_tx),
+          waiting for the replies is done in parallel
+        - one bounded transmit queue (CCanTxQueue) for all devices
+        - one bus health (CCanHealth), the pending frames are sent after a recovery
+    """
+    d_bus = {} # (can_chan_id,bit_rate) -> CCanBus
+    lock_bus = threading.Lock()
+
+    # @return the shared bus of the channel, open it on first use
+    @staticmethod
+    def get(can_chan_id='can0',can_if=CAN_INTERFACE,bit_rate=CAN_BITRATE):
+        with CCanBus.lock_bus:
+            bus = CCanBus.d_bus.get((can_chan_id,bit_rate))
+            if bus is None:
+                bus = CCanBus.d_bus[(can_chan_id,bit_rate)] = CCanBus(can_chan_id,can_if,bit_rate)
+            return bus
+
+    def __init__(self,can_chan_id='can0',can_if=CAN_INTERFACE,bit_rate=CAN_BITRATE):
+        self.can_chan_id = can_chan_id
+        self.can_if = can_if
+        self.bit_rate = bit_rate
+        self.lock_tx = threading.Lock()
+        self.lst_adr_rsp = [] # response ids of the attached devices
+        self.can_chan = can_bus_open(can_chan_id,can_if,[],bit_rate)
+        self.txq = CCanTxQueue(self.can_chan)
+        self.rx = CCanRx()
+        self.rx.health.lst_cb_recover.append(self.txq.flush)
+        self.notifier = can_notifier(self.can_chan,[self.rx])
+
+    # reopen the socket e.g. after the interface was removed, same receive dispatcher and filters
+    def reopen(self):
+        with CCanBus.lock_bus:
+            self.notifier.stop()
+            self.can_chan.shutdown()
+            self.can_chan = can_bus_open(self.can_chan_id,self.can_if,[],self.bit_rate)
+            self._filter_set()
+            self.txq.can_chan = self.can_chan
+            self.notifier = can_notifier(self.can_chan,[self.rx])
+
+    # attach a device, receive the replies of its response id
+    def attach(self,adr_rsp :int):
+        with CCanBus.lock_bus:
+            self.lst_adr_rsp.append(adr_rsp)
+            self._filter_set()
+
+    # detach a device, close the bus with the last one
+    def detach(self,adr_rsp :int):
+        with CCanBus.lock_bus:
+            if adr_rsp in self.lst_adr_rsp:
+                self.lst_adr_rsp.remove(adr_rsp)
+            if len(self.lst_adr_rsp) >0:
+                self._filter_set()
+                return
+            CCanBus.d_bus.pop((self.can_chan_id,self.bit_rate),None)
+        self.notifier.stop()
+        self.can_chan.shutdown()
+
+    def _filter_set(self):
+        self.can_chan.set_filters([{'can_id': adr, 'can_mask': 0x1FFFFFFF, 'extended': True} for adr in set(self.lst_adr_rsp)])
+
+#########################################
+# can transaction recorder and replay
+class CCanRec:
+    """ record the requests and the matched replies of a CBic in a compact binary file
+        - header REC_MAGIC
+        - record: monotonic time [s], direction, can id, dlc, data (22 bytes)
+    """
+    REC_MAGIC = b'BICREC01'
+    e_dir_tx = 0
+    e_dir_rx = 1
+    _st_rec = struct.Struct('<dBIB8s')
+
+    def __init__(self,fname :str):
+        self.fname = fname
+        self.lock = threading.Lock()
+        self.cnt = 0 # recorded frames
+        self.f = open(fname,'wb')
+        self.f.write(CCanRec.REC_MAGIC)
+
+    # @param ts monotonic send/receive time of the frame, None: now
+    def write(self,e_dir :int,adr :int,data,ts=None):
+        rec = CCanRec._st_rec.pack(time.monotonic() if ts is None else ts,e_dir,adr,len(data),bytes(data))
+        with self.lock:
+            if self.f is not None:
+                self.f.write(rec)
+                self.cnt += 1
+
+    def close(self):
+        with self.lock:
+            if self.f is not None:
+                self.f.close()
+                self.f = None
+
+    # @return list of the records (t,e_dir,adr,data)
+    @staticmethod
+    def read(fname :str):
+        lst_rec = []
+        with open(fname,'rb') as f:
+            if f.read(len(CCanRec.REC_MAGIC)) != CCanRec.REC_MAGIC:
+                raise ValueError("no can record file:" + fname)
+            for t,e_dir,adr,dlc,data in CCanRec._st_rec.iter_unpack(f.read()):
+                lst_rec.append((t,e_dir,adr,data[:dlc]))
+        return lst_rec
+
+
+class CCanReplayBus:
+    """ bus replaying a CCanRec file, use it as CBic(can_chan=CCanReplayBus(fname))
+        - the python-can bus methods used by CBic: send, recv, set_filters, shutdown (like CCanSock)
+        - each sent frame is matched with the next equal recorded request,
+          the recorded replies after it will be received
+        @param speed 1.0: recorded reply latency, 2.0: half of it ..., 0: as fast as possible
+    """
+    def __init__(self,fname :str,speed=1.0):
+        self.channel = fname
+        self.channel_info = 'replay:' + fname
+        self.lst_rec = CCanRec.read(fname)
+        self.idx = 0 # next record to match
+        self.speed = speed
+        self.q_rx = deque() # (due time,msg)
+        self.cond = threading.Condition()
+        self.cnt_miss = 0 # sent frames not found in the recording
+
+    def send(self,msg,timeout=None):
+        data = bytes(msg.data)
+        idx = self.idx
+        while idx < len(self.lst_rec):
+            t_tx,e_dir,adr,rdata = self.lst_rec[idx]
+            idx += 1
+            if e_dir == CCanRec.e_dir_tx and adr == msg.arbitration_id and rdata == data:
+                break
+        else:
+            self.cnt_miss += 1
+            return
+
+        t_now = time.monotonic()
+        with self.cond:
+            while idx < len(self.lst_rec) and self.lst_rec[idx][1] == CCanRec.e_dir_rx:
+                t_rx,e_dir,adr,rdata = self.lst_rec[idx]
+                msgr = CCanFrame(adr,rdata,timestamp=time.time())
+                t_due = t_now + (t_rx - t_tx) / self.speed if self.speed > 0 else t_now
+                self.q_rx.append((t_due,msgr))
+                idx += 1
+            self.idx = idx
+            self.cond.notify_all()
+
+    # @return next recorded reply when it is due, None after the timeout [s]
+    def recv(self,timeout=None):
+        t_end = None if timeout is None else time.monotonic() + timeout
+        with self.cond:
+            while True:
+                t_wait = None
+                if len(self.q_rx) >0:
+                    t_wait = self.q_rx[0][0] - time.monotonic()
+                    if t_wait <= 0:
+                        return self.q_rx.popleft()[1]
+                if t_end is not None:
+                    t_remain = t_end - time.monotonic()
+                    if t_remain <= 0:
+                        return None
+                    t_wait = t_remain if t_wait is None else min(t_wait,t_remain)
+                self.cond.wait(t_wait)
+
+    # only the recorded replies are received
+    def set_filters(self,can_filters=None):
+        pass
+
+    def shutdown(self):
+        with self.cond:
+            self.q_rx.clear()
+
+#########################################
+# eeprom write ledger
+class CEepromLedger:
+    """ persisted eeprom write counter for each register and write budget
+        - daily and lifetime budget for all eeprom writes, -1: unlimited
+        - min. interval between two writes of the same register, writes in between will be deferred
+        - skip writes within the tolerance of the stored value
+        - safe writes (a reduced current, idle/stop) are never skipped or deferred, only counted
+        - the counters are saved at most every SAVE_SEC and with save(), not with each write (sd card)
+    """
+    e_check_write = 0 # write the value
+    e_check_skip = 1 # value is in tolerance, don't write it
+    e_check_defer = 2 # write it later (interval or budget)
+
+    SAVE_SEC = 600
+
+    def __init__(self,fname :str,budget_day=-1,budget_life=-1,min_interval_sec=0,tol=0):
+        self.fname = fname
+        self.budget_day = budget_day
+        self.budget_life = budget_life
+        self.min_interval_sec = min_interval_sec
+        self.tol = tol
+        self.d_ts_write = {} # cmd -> monotonic time of the last write
+        self.cnt_skip = 0 # skipped writes (tolerance)
+        self.cnt_defer = 0 # deferred writes
+        self.d_led = {} # persisted data
+        self.ts_save = time.monotonic() # monotonic time of the last save
+        self.dirty = False # counters not saved yet
+        self.load()
+
+    def load(self):
+        try:
+            with open(self.fname,'r') as f:
+                self.d_led = json.load(f)
+        except (OSError,ValueError):
+            self.d_led = {}
+        self.d_led.setdefault('day',date.today().isoformat())
+        self.d_led.setdefault('cntDay',{})
+        self.d_led.setdefault('cntLife',{})
+
+    def save(self):
+        self.ts_save = time.monotonic()
+        self.dirty = False
+        try:
+            fname_tmp = self.fname + '.tmp'
+            with open(fname_tmp,'w') as f:
+                json.dump(self.d_led,f,indent=4)
+            os.replace(fname_tmp,self.fname)
+        except OSError as e:
+            print("eeprom ledger can't save:" + str(e))
+
+    def _day_check(self):
+        day = date.today().isoformat()
+        if self.d_led['day'] != day:
+            self.d_led['day'] = day
+            self.d_led['cntDay'] = {}
+
+    def writes_day(self):
+        self._day_check()
+        return sum(self.d_led['cntDay'].values())
+
+    def writes_life(self):
+        return sum(self.d_led['cntLife'].values())
+
+    """ check a new eeprom write
+        @param val_stored running value of the device, None: unknown
+        @param safe True: write it in any case e.g. a lower current
+        @return e_check_write, e_check_skip, e_check_defer
+    """
+    def check(self,cmd :int,val :int,val_stored=None,safe=False):
+        if safe is True:
+            return CEepromLedger.e_check_write
+
+        if val_stored is not None and abs(int(val) - int(val_stored)) <= self.tol:
+            self.cnt_skip += 1
+            return CEepromLedger.e_check_skip
+
+        if self.write_due(cmd) is False:
+            self.cnt_defer += 1
+            return CEepromLedger.e_check_defer
+        return CEepromLedger.e_check_write
+
+    # @return True if the interval of the register and the budget allow a write now, no counting
+    def write_due(self,cmd :int):
+        ts = self.d_ts_write.get(cmd)
+        if ts is not None and (time.monotonic() - ts) < self.min_interval_sec:
+            return False
+        if (self.budget_day >= 0 and self.writes_day() >= self.budget_day) or \
+           (self.budget_life >= 0 and self.writes_life() >= self.budget_life):
+            return False
+        return True
+
+    # count an eeprom write, save the ledger after SAVE_SEC
+    def count(self,cmd :int):
+        self._day_check()
+        key = CBic.d_cmd_name.get(cmd,hex(cmd))
+        self.d_led['cntDay'][key] = self.d_led['cntDay'].get(key,0) + 1
+        self.d_led['cntLife'][key] = self.d_led['cntLife'].get(key,0) + 1
+        self.d_ts_write[cmd] = time.monotonic()
+        self.dirty = True
+        if time.monotonic() - self.ts_save >= CEepromLedger.SAVE_SEC:
+            self.save()
+
+    # save the counters of the last writes
+    def flush(self):
+        if self.dirty is True:
+            self.save()
+
+    # @return dict of the budget consumption
+    def stat_get(self):
+        d_stat = {}
+        d_stat['writesDay'] = self.writes_day()
+        d_stat['budgetDay'] = self.budget_day
+        d_stat['writesLife'] = self.writes_life()
+        d_stat['budgetLife'] = self.budget_life
+        d_stat['skipped'] = self.cnt_skip
+        d_stat['deferred'] = self.cnt_defer
+        d_stat['cntDay'] = dict(self.d_led['cntDay'])
+        d_stat['cntLife'] = dict(self.d_led['cntLife'])
+        return d_stat
+
 #########################################
 # bic class
 class CBic:
@@ -166,11 +1308,88 @@ class CBic:
     e_cmd_DIRECTION_CTRL =      0x0100 # charge discharge direcrion control
     e_cmd_REVERSE_VOUT_SET =    0x0120 # @notice: eeprom write
     e_cmd_REVERSE_IOUT_SET =    0x0130 # @notice: eeprom write
+    e_cmd_MFR_MODEL_B0B5 =      0x0082 # model name part 1
+    e_cmd_MFR_MODEL_B6B11 =     0x0083 # model name part 2
+    e_cmd_FW_REVISION =         0x0084 # firmware revision mcu0 mcu1
+    e_cmd_MFR_DATE =            0x0086 # manufacture date
+    e_cmd_CURVE_CONFIG =        0x00B4 # NPB charge curve config
+    e_cmd_SYSTEM_STATUS =       0x00C1 # system status register
+    e_cmd_SYSTEM_CONFIG =       0x00C2 # system config register
+    e_cmd_BIDIRECTIONAL_CONFIG= 0x0140 # bidirectional battery mode config
+    e_cmd_CURVE_CC =            0x00B0 # NPB constant current of the charge curve
+    e_cmd_CURVE_CV =            0x00B1 # NPB constant voltage of the charge curve
+    e_cmd_CURVE_FV =            0x00B2 # NPB floating voltage of the charge curve
+    e_cmd_CHG_STATUS =          0x00B8 # NPB charge status register
     # ....
 
-    def __init__(self,can_chan_id='can0' ,can_adr=CAN_ADR):
+    CACHE_TTL_WRITE = math.inf # valid until written (or a read timeout)
+    CACHE_TTL_CTRL = 1 # control registers, changed by the front panel, another client on the bus or a device restart
+    CACHE_TTL_SHADOW = 10 # setpoints and config, fresh shadow register of a write without pre-read
+
+    # register map: width [byte], signed, scale, unit, eeprom, access, cache time to live [s], device
+    d_reg = {reg.cmd:reg for reg in (
+        CReg(e_cmd_OPERATION,           1,False,1,   '',   False,'rw',CACHE_TTL_CTRL),
+        CReg(e_cmd_VOUT_SET,            2,False,0.01,'V',  True, 'rw',CACHE_TTL_SHADOW),
+        CReg(e_cmd_IOUT_SET,            2,False,0.01,'A',  True, 'rw',CACHE_TTL_SHADOW),
+        CReg(e_cmd_FAULT_STATUS,        2,False,1,   '',   False,'r', 0),
+        CReg(e_cmd_READ_VIN,            2,False,0.1, 'V',  False,'r', 30),
+        CReg(e_cmd_READ_VOUT,           2,False,0.01,'V',  False,'r', 1),
+        CReg(e_cmd_READ_IOUT,           2,True, 0.01,'A',  False,'r', 0),
+        CReg(e_cmd_READ_TEMPERATURE_1,  2,True, 0.1, 'C',  False,'r', 30),
+        CReg(e_cmd_READ_FAN1,           2,False,1,   'rpm',False,'r', 30),
+        CReg(e_cmd_READ_FAN2,           2,False,1,   'rpm',False,'r', 30),
+        CReg(e_cmd_DIRECTION_CTRL,      1,False,1,   '',   False,'rw',CACHE_TTL_CTRL,   CReg.e_dev_bic),
+        CReg(e_cmd_REVERSE_VOUT_SET,    2,False,0.01,'V',  True, 'rw',CACHE_TTL_SHADOW, CReg.e_dev_bic),
+        CReg(e_cmd_REVERSE_IOUT_SET,    2,False,0.01,'A',  True, 'rw',CACHE_TTL_SHADOW, CReg.e_dev_bic),
+        CReg(e_cmd_MFR_MODEL_B0B5,      6,False,1,   '',   False,'r', CACHE_TTL_WRITE),
+        CReg(e_cmd_MFR_MODEL_B6B11,     6,False,1,   '',   False,'r', CACHE_TTL_WRITE),
+        CReg(e_cmd_FW_REVISION,         2,False,1,   '',   False,'r', CACHE_TTL_WRITE),
+        CReg(e_cmd_MFR_DATE,            6,False,1,   '',   False,'r', CACHE_TTL_WRITE),
+        CReg(e_cmd_CURVE_CC,            2,False,0.01,'A',  True, 'rw',CACHE_TTL_SHADOW, CReg.e_dev_npb),
+        CReg(e_cmd_CURVE_CV,            2,False,0.01,'V',  True, 'rw',CACHE_TTL_SHADOW, CReg.e_dev_npb),
+        CReg(e_cmd_CURVE_FV,            2,False,0.01,'V',  True, 'rw',CACHE_TTL_SHADOW, CReg.e_dev_npb),
+        CReg(e_cmd_CURVE_CONFIG,        2,False,1,   '',   False,'rw',0,                CReg.e_dev_npb),
+        CReg(e_cmd_CHG_STATUS,          2,False,1,   '',   False,'r', 0,                CReg.e_dev_npb),
+        CReg(e_cmd_SYSTEM_STATUS,       2,False,1,   '',   False,'r', 0),
+        CReg(e_cmd_SYSTEM_CONFIG,       2,False,1,   '',   False,'rw',CACHE_TTL_SHADOW),
+        CReg(e_cmd_BIDIRECTIONAL_CONFIG,2,False,1,   '',   False,'rw',CACHE_TTL_SHADOW, CReg.e_dev_bic),
+    )}
+
+    # parameter stored in the eeprom
+    s_cmd_eeprom = {cmd for cmd,reg in d_reg.items() if reg.eeprom}
+
+    # current setpoints, a lower value is the safe direction: never deferred by the eeprom limiter
+    s_cmd_current = {e_cmd_IOUT_SET,e_cmd_REVERSE_IOUT_SET,e_cmd_CURVE_CC}
+
+    # writable registers of the device info (dump), a write invalidates the info cache file
+    s_cmd_info = {e_cmd_SYSTEM_CONFIG,e_cmd_BIDIRECTIONAL_CONFIG}
+
+    # register cache time to live [s], not listed commands are not cached (0)
+    d_cache_ttl_def = {cmd:reg.ttl for cmd,reg in d_reg.items() if reg.ttl > 0}
+
+    # reply decoder of the commands, default: dec_word
+    d_cmd_dec = {cmd:reg.dec for cmd,reg in d_reg.items()}
+
+    """ @param rx_thread True: start a background receive thread (CCanRx)
+        @param can_bus shared bus (CCanBus) of the channel, None: open an own bus
+        @param can_if python-can interface type of the own bus
+        @param can_chan opened python-can bus to use e.g. CCanReplayBus, None: open an own bus
+        @param bit_rate bit rate of the bus: slcan adapter setting and bus load (CCanStat)
+    """
+    def __init__(self,can_chan_id='can0' ,can_adr=CAN_ADR,rx_thread=False,can_bus=None,can_if=CAN_INTERFACE,can_chan=None,bit_rate=CAN_BITRATE):
         self.can_chan = None
+        self.can_bus = can_bus
+        self.rx = None # background receive dispatcher
+        self.notifier = None
+        self.lock_tx = threading.Lock() # send a request burst without interrupts
+        self.txq = None # CCanTxQueue bounded transmit queue
+        self.tx_write_ttl_sec = 2.0 # drop a write the bus didn't accept within x [s], a newer setpoint follows
+        self.rec = None # CCanRec transaction recorder
         self.can_chan_id = can_chan_id
+        self.can_if = can_if
+        self.bit_rate = bit_rate
+        self.can_chan_ext = can_chan is not None # opened by the caller, no reopen
+        self.health = CCanHealth() # bus state, shared with the receive thread
         self.can_adr = can_adr
         self.persist = True # for command line switch  to true (another error handling for can read/write errors)
         self.fault_changed = True # fault was changed update fault if this flag was set
@@ -188,23 +1407,69 @@ class CBic:
         self.d_fault['can'] =    {'active':-1,'cnt':0,'desc':"can-com error / read-tmo"} # -1 change on startup
 
         self.write_cnt = 0 # write counter for persistent mode
+        self.ledger = None # CEepromLedger write limiter
+        self.d_eeprom_pending = {} # cmd -> deferred eeprom value
+        self.d_eeprom_pending_tx = {} # cmd -> transaction of the deferred value, written together (atomic)
         self.d_info = {} # modelName,firmRev....
+        self.info_fname = None # persisted device info (dump), None: always read from the device
+
+        self.can_adr_rsp = can_adr & CAN_ADR_RSP_MASK # response id of the device
+        self.d_can_stat = {} # can receive statistic
+        self.d_can_stat['rxTmo'] = 0 # read timeouts
+        self.d_can_stat['rxStale'] = 0 # late replies of a former request, dropped before sending a new one
+        self.d_can_stat['rxDrop'] = 0 # frames with another id or command, dropped while waiting for a reply
+        self.d_can_stat['cacheHit'] = 0 # reads served by the register cache
+        self.d_can_stat['cacheMiss'] = 0 # reads sent to the device
+        self.d_can_stat['txRetry'] = 0 # repeated read requests after a timeout
+
+        self.rtt = CCanRtt() # adaptive read timeout of each command
+        self.retry_max = 1 # repeat a read request without reply max. x times
+        self.retry_jitter_sec = 0.02 # random pause [0..x] before a repeated request [s]
+        self.retry_alive_sec = 10 # repeat only if the device has replied within x [s], no retries for an offline device
+        self.ts_rx_last = -math.inf # monotonic time of the last reply
+        self.cnt_tmo_seq = 0 # consecutive reads without any reply, e.g. device is offline
+        self.stat = CCanStat(bit_rate) # latency histograms, frame counters and bus load
+
+        self.d_cache_ttl = dict(CBic.d_cache_ttl_def) # cmd -> time to live [s]
+        self.d_cache = {} # cmd -> (monotonic read time, reply data)
+
+        if can_bus is not None:
+            can_bus.attach(self.can_adr_rsp)
+            self.can_chan = can_bus.can_chan
+            self.rx = can_bus.rx
+            self.lock_tx = can_bus.lock_tx
+            self.txq = can_bus.txq
+            self.health = can_bus.rx.health
+            return
 
         try:
-            self.can_chan = can.interface.Bus(channel = self.can_chan_id, bustype = 'socketcan')
+            # let the kernel drop all frames except the replies of this device
+            can_filters = [{'can_id': self.can_adr_rsp, 'can_mask': 0x1FFFFFFF, 'extended': True}]
+            if can_chan is not None:
+                self.can_chan = can_chan
+                self.can_chan.set_filters(can_filters)
+            else:
+                self.can_chan = can_bus_open(self.can_chan_id,can_if,can_filters,bit_rate)
         except Exception as e:
             print(e)
             print("CAN INTERFACE NOT FOUND. TRY TO BRING UP CAN DEVICE FIRST WITH -> can_up")
             sys.exit(2)
+        self.txq = CCanTxQueue(self.can_chan)
+
+        if rx_thread is True:
+            self.rx = CCanRx()
+            self.health = self.rx.health
+            self.notifier = can_notifier(self.can_chan,[self.rx])
+        self.health.lst_cb_recover.append(self.txq.flush)
 
     # init can device
     @staticmethod
-    def can_up(can_chan_id = 'can0',bit_rate = 250000):
+    def can_up(can_chan_id = 'can0',bit_rate = CAN_BITRATE):
         print('can up:{} bit-rate:{}'.format(can_chan_id,bit_rate))
-        os.system('sudo ip link set {} up type can bitrate {}'.format(can_chan_id,bit_rate))
-        os.system('sudo ifconfig {} txqueuelen 65536'.format(can_chan_id))
+        os.system('sudo ip link set {} up type can bitrate {} restart-ms {}'.format(can_chan_id,bit_rate,CAN_RESTART_MS))
+        os.system('sudo ifconfig {} txqueuelen {}'.format(can_chan_id,CAN_TXQUEUELEN))
 
-    # init serial can device
+    # init serial can device with slcand, not needed for USE_RS232_CAN = 2 (CCanSlcan)
     @staticmethod
     def can_up_serial(can_chan_id = 'can0',dev_node = CAN_DEVICE):
         os.system('sudo slcand -f -s5 -c -o ' + dev_node)
@@ -214,119 +1479,639 @@ class CBic:
     def can_down(can_chan_id = 'can0'):
         os.system('sudo ip link set {} down'.format(can_chan_id))
 
-    def can_shutdown_serial(self):
-        if self.can_chan is not None:
-            self.can_chan.shutdown()
+    # restart the can controller after a bus-off, only needed without restart-ms
+    @staticmethod
+    def can_restart(can_chan_id = 'can0'):
+        os.system('sudo ip link set {} type can restart'.format(can_chan_id))
+
+    """ recover from a bus-off without kernel restart or a dead socket (CCanHealth.recover_due)
+        - bus-off: restart the controller once, the kernel reports the restart with an error frame
+        - socket error: reopen the socket, the pending frames are sent (CCanTxQueue)
+        - no success: the next attempt after a backoff (CCanHealth.recover_start)
+        @return True if a recovery was started
+    """
+    def can_recover(self):
+        if self.health.recover_due() is False:
+            return False
+        self.health.recover_start()
+        if self.health.state == CCanHealth.e_state_bus_off:
+            print("can bus-off without restart:{} restart the controller".format(self.can_chan_id))
+            CBic.can_restart(self.can_chan_id)
+            return True
+        if self.can_chan_ext is True:
+            return False
+        print("can socket error:{} reopen the socket".format(self.can_chan_id))
+        try:
+            if self.can_bus is not None:
+                self.can_bus.reopen()
+                self.can_chan = self.can_bus.can_chan
+            else:
+                if self.notifier is not None:
+                    self.notifier.stop()
+                self.can_chan.shutdown()
+                can_filters = [{'can_id': self.can_adr_rsp, 'can_mask': 0x1FFFFFFF, 'extended': True}]
+                self.can_chan = can_bus_open(self.can_chan_id,self.can_if,can_filters,self.bit_rate)
+                self.txq.can_chan = self.can_chan
+                if self.rx is not None:
+                    self.notifier = can_notifier(self.can_chan,[self.rx])
+        except CAN_ERRORS as e:
+            print("can reopen failed:" + str(e))
+            return False
+        self.health.on_recover('reopen')
+        return True
 
-    def can_send_msg(self,lst_data):
-        msg = can.Message(arbitration_id=self.can_adr, data=lst_data, is_extended_id=True)
+    """ probe all BIC-2200 (id 0..7) and NPB (id 0..3) addresses
+        - one request to all addresses per round, max. 12 frames in the kernel queue (CAN_TXQUEUELEN)
+        - first round: model name to all addresses, wait tmo for the replies
+        - next rounds: the other commands only to the devices that replied, until all replied or tmo
+        - a frame the bus doesn't accept (e.g. ENOBUFS) is repeated after SCAN_TX_PAUSE_SEC
+        @param tmo deadline for the replies of a round [s]
+        @param can_chan opened bus to use (scan_bus), None: open an own bus
+        @return list of dict type,devId,canAdr,modelName,firmRev,latencyMs of each device that replied
+    """
+    SCAN_TX_RETRY = 5
+    SCAN_TX_PAUSE_SEC = 0.005
 
+    @staticmethod
+    def scan(can_chan_id='can0',tmo=0.1,can_if=CAN_INTERFACE,can_chan=None):
+        lst_cmd = [CBic.e_cmd_MFR_MODEL_B0B5,CBic.e_cmd_MFR_MODEL_B6B11,CBic.e_cmd_FW_REVISION]
+        d_dev = {} # response id -> device dict
+        for dev_type,adr_base,cnt in (('BIC',CAN_ADR_BIC,8),('NPB',CAN_ADR_NPB,4)):
+            for dev_id in range(cnt):
+                d_dev[(adr_base + dev_id) & CAN_ADR_RSP_MASK] = {'type':dev_type,'devId':dev_id,'canAdr':adr_base + dev_id,'d_data':{}}
+
+        def send(msg):
+            for retry in range(CBic.SCAN_TX_RETRY):
+                try:
+                    bus.send(msg)
+                    return
+                except CAN_ERRORS:
+                    time.sleep(CBic.SCAN_TX_PAUSE_SEC) # kernel queue full, let it drain
+
+        can_filters = [{'can_id': adr_rsp, 'can_mask': 0x1FFFFFFF, 'extended': True} for adr_rsp in d_dev]
+        bus = can_chan
+        if bus is None:
+            bus = can_bus_open(can_chan_id,can_if,can_filters)
+        else:
+            bus.set_filters(can_filters)
         try:
-            self.can_chan.send(msg)
-        except can.CanError:
-            print("CAN send error")
-            raise RuntimeError("can't send can message")
-
+            lst_dev_tx = list(d_dev.values())
+            for cmd in lst_cmd:
+                t_send = time.monotonic()
+                for dev in lst_dev_tx:
+                    send(can_msg_new(bus,dev['canAdr'],can_frame_read(cmd)))
+                set_open = {dev['canAdr'] & CAN_ADR_RSP_MASK for dev in lst_dev_tx}
+                t_end = time.monotonic() + tmo
+                while len(set_open) >0:
+                    msgr = bus.recv(max(t_end - time.monotonic(),0))
+                    if msgr is None:
+                        break
+                    dev = d_dev.get(msgr.arbitration_id)
+                    if dev is None or len(msgr.data) < 2:
+                        continue
+                    if len(dev['d_data']) == 0:
+                        dev['latencyMs'] = round((time.monotonic() - t_send) * 1000,1)
+                    dev['d_data'][can_frame_cmd(msgr.data)] = msgr.data # late replies of a former round too
+                    if can_frame_cmd(msgr.data) == cmd:
+                        set_open.discard(msgr.arbitration_id)
+                lst_dev_tx = [dev for dev in d_dev.values() if len(dev['d_data']) >0]
+                if len(lst_dev_tx) == 0:
+                    break
+        finally:
+            if can_chan is None:
+                bus.shutdown()
+
+        lst_dev = []
+        for dev in d_dev.values():
+            d_data = dev.pop('d_data')
+            if len(d_data) == 0:
+                continue
+            try:
+                dev['modelName'] = dec_char(d_data[CBic.e_cmd_MFR_MODEL_B0B5]) + dec_char(d_data[CBic.e_cmd_MFR_MODEL_B6B11])
+            except (KeyError,IndexError,UnicodeDecodeError):
+                dev['modelName'] = None
+            try:
+                dev['firmRev'] = hex(dec_word(d_data[CBic.e_cmd_FW_REVISION]))
+            except (KeyError,IndexError,struct.error):
+                dev['firmRev'] = None
+            lst_dev.append(dev)
+        return lst_dev
+
+    """ scan (CBic.scan) on the bus of this device, no second socket or tty
+        - the receive thread is stopped meanwhile, then the filters of the device or the shared bus are set again
+        @return list of the found devices
+    """
+    def scan_bus(self,tmo=0.1):
+        owner = self.can_bus if self.can_bus is not None else self # holds the receive thread
+        with self.lock_tx:
+            if owner.notifier is not None:
+                owner.notifier.stop()
+            try:
+                return CBic.scan(tmo=tmo,can_chan=self.can_chan)
+            finally:
+                if self.can_bus is not None:
+                    self.can_bus._filter_set()
+                else:
+                    self.can_chan.set_filters([{'can_id': self.can_adr_rsp, 'can_mask': 0x1FFFFFFF, 'extended': True}])
+                if owner.notifier is not None:
+                    owner.notifier = can_notifier(self.can_chan,[owner.rx])
 
-    """ receive 16Bit word from can
-        return default value on any read error
+    def can_shutdown_serial(self):
+        self.shutdown()
+
+    # stop the receive thread and close the bus
+    def shutdown(self):
+        self.rec_stop()
+        if self.ledger is not None:
+            self.ledger.flush()
+        if self.can_bus is not None:
+            self.can_bus.detach(self.can_adr_rsp)
+            self.can_bus = None
+            self.can_chan = None
+            return
+        if self.notifier is not None:
+            self.notifier.stop()
+            self.notifier = None
+        if self.can_chan is not None:
+            self.can_chan.shutdown()
+            self.can_chan = None
+
+    # @return dict with the can statistic, including the receive thread counters
+    def can_stat_get(self):
+        d_stat = dict(self.d_can_stat)
+        if self.rx is not None:
+            d_stat.update(self.rx.d_stat)
+        if self.txq is not None:
+            d_stat.update(self.txq.stat_get())
+        d_stat.update(self.health.stat_get())
+        return d_stat
+
+    """ @return dict with all can counters, the bus load since the last call,
+        the latency histogram and the adaptive timeout of each command
     """
-    def can_receive_word(self,e_cmd :int,default = None):
-        cmd_hb,cmd_lb = get_high_low_byte(e_cmd)
-        self.can_send_msg([cmd_lb,cmd_hb])
-        v=self.can_receive()
-        if v is None:
-            return default
-        return v
+    def canstats_get(self):
+        d_stat = self.stat.stat_get()
+        d_stat.update(self.can_stat_get())
+        d_rtt = self.rtt.stat_get()
+        for name,d_cmd in d_stat['cmd'].items():
+            d_cmd.update(d_rtt.get(name,{}))
+        return d_stat
+
+    """ send a frame via the bounded transmit queue
+        - a read request expires after the max. read timeout, a write after tx_write_ttl_sec
+        - a pending write is replaced by a newer one of the same register
+        @return True if the frame was handed to the bus, False if it is queued
+    """
+    def can_send_msg(self,lst_data):
+        msg = can_msg_new(self.can_chan,self.can_adr,lst_data)
+
+        key = None
+        ttl = self.rtt.tmo_max
+        if len(msg.data) > 2:
+            key = (self.can_adr,can_frame_cmd(msg.data))
+            ttl = self.tx_write_ttl_sec
+        return self.txq.send(msg,time.monotonic() + ttl,key,self._tx_sent)
+
+    # the bus accepted a frame of this device, at once or with a later flush of the transmit queue
+    def _tx_sent(self,msg):
+        self.stat.tx(len(msg.data))
+        if self.rec is not None:
+            self.rec.write(CCanRec.e_dir_tx,self.can_adr,msg.data)
+
+    # write the frames of a burst at once (CCanSlcan), nothing to do for the other buses
+    def tx_batch(self):
+        batch = getattr(self.can_chan,'batch',None)
+        if batch is None:
+            return contextlib.nullcontext()
+        return batch()
+
+    # record all requests and replies to a file (CCanRec)
+    def rec_start(self,fname :str):
+        self.rec_stop()
+        self.rec = CCanRec(fname)
+
+    def rec_stop(self):
+        if self.rec is not None:
+            self.rec.close()
+            self.rec = None
 
     """
     read a word if it is equal to val, do nothing (force is False)
     - send the value and read the returned value
     - raise exception if given and received value are not equal
-    - return True for success
+    - eeprom parameter: skip or defer the write (ledger)
+    - return True for success, False if the write was skipped or deferred
     """
     def can_send_receive_word(self,cmd :int,val:int,force=False):
-    
-        def eeprom_write_check(cmd):
-            if cmd == CBic.e_cmd_VOUT_SET or cmd == CBic.e_cmd_IOUT_SET: 
-                self.write_cnt+=1
-            elif cmd == CBic.e_cmd_REVERSE_VOUT_SET or cmd == CBic.e_cmd_REVERSE_IOUT_SET:
-                self.write_cnt+=1
-
-        cmd_hb,cmd_lb = get_high_low_byte(cmd)
-        val_hb,val_lb = get_high_low_byte(val)
-
-        # check running value
+        return self.write_many({cmd:val},force)[cmd]
+
+    """ write several registers as one transaction
+        - shadow registers: the running values come from the register cache (filled by reads and
+          verified writes, fresh for CACHE_TTL_SHADOW), only the unknown ones are read, all in one burst
+        - skip the registers with an equal running value (force is False)
+        - eeprom parameter: skip or defer the write (ledger), except a lower current or a safety write
+        - send all writes in the given order, verify all written values with one read burst
+        - raise exception if a given and received value are not equal
+        @param d_cmd_val cmd -> value, byte registers (d_reg) are written as byte
+        @param safety True: no eeprom limiter e.g. idle or stop
+        @param atomic True: all or nothing, a deferred eeprom value defers all writes of the transaction
+        @return dict cmd -> True for success, False if the write was skipped or deferred
+    """
+    def write_many(self,d_cmd_val :dict,force=False,safety=False,atomic=False):
+        d_cmd_val = {cmd:int(val) for cmd,val in d_cmd_val.items()}
+        d_ret = {}
+        d_write = {}
         if force is False:
-            self.can_send_msg([cmd_lb,cmd_hb])
-            vr=self.can_receive()
-            if vr == val:
-                #print("skip vr:{} val:{}".format(vr,val))   
-                return True
-
-        # set new value
-        self.can_send_msg([cmd_lb,cmd_hb,val_lb,val_hb])
-        eeprom_write_check(cmd)
-
-        # check if value was set
-        self.can_send_msg([cmd_lb,cmd_hb])
-        vr=self.can_receive()
-        #print("vr:{} val:{}".format(vr,val))        
-        if vr != val:
-            raise RuntimeError("can't set value command:{} vr:{} val:{}".format(hex(cmd),vr,val))
-        
-        return True
-
-    #@return list of values
-    def can_rcv_raw(self, tmo=0.5):
-        msgr = self.can_chan.recv(tmo)
-        if msgr is None:
-            print('Timeout occurred, no message.')
-            if self.persist is False:
-                sys.exit(2)
-            raise TimeoutError()
-        return str(msgr).split()
-
-    
-    # receive function @reurn int value
-    def can_receive(self):
-        try:
-            msgr_split = self.can_rcv_raw()
-        except TimeoutError:
-            return None
-        if len(msgr_split) < 12:
+            d_vr = self.read_many(list(d_cmd_val))
+        else:
+            d_vr = {cmd:self.cache_peek(cmd) for cmd in d_cmd_val} # limiter only, unknown is not safe
+
+        lst_defer = []
+        for cmd,val in d_cmd_val.items():
+            vr = d_vr[cmd]
+            if vr == val and force is False:
+                self._pending_drop(cmd)
+                d_ret[cmd] = True
+                continue
+
+            # eeprom write limiter, the last deferred value will be written with eeprom_flush()
+            if self.ledger is not None and cmd in CBic.s_cmd_eeprom:
+                safe = safety or (cmd in CBic.s_cmd_current and vr is not None and val < vr)
+                chk = self.ledger.check(cmd,val,vr,safe)
+                if chk == CEepromLedger.e_check_defer:
+                    self.d_eeprom_pending[cmd] = val
+                    self.d_eeprom_pending_tx[cmd] = d_cmd_val if atomic else {cmd:val}
+                    lst_defer.append(cmd)
+                    d_ret[cmd] = False
+                    continue
+                self._pending_drop(cmd)
+                if chk == CEepromLedger.e_check_skip:
+                    d_ret[cmd] = False
+                    continue
+            d_write[cmd] = val
+
+        # all or nothing, the transaction is written with the deferred value (eeprom_flush)
+        if atomic is True and len(lst_defer) >0:
+            for cmd in d_write:
+                d_ret[cmd] = False
+            return d_ret
+
+        if len(d_write) == 0:
+            self._pending_outdated(d_cmd_val,d_ret)
+            return d_ret
+
+        # set new values
+        with self.lock_tx,self.tx_batch():
+            for cmd,val in d_write.items():
+                self.can_write(cmd,val,CBic.d_reg[cmd].width if cmd in CBic.d_reg else 2)
+                if cmd in CBic.s_cmd_eeprom or cmd == CBic.e_cmd_DIRECTION_CTRL:
+                    self.write_cnt+=1
+                if cmd in CBic.s_cmd_eeprom and self.ledger is not None:
+                    self.ledger.count(cmd)
+
+        # check if the values were set, the verified values are the new shadow registers
+        d_vr = self.read_many(list(d_write))
+        for cmd,val in d_write.items():
+            if d_vr[cmd] != val:
+                raise RuntimeError("can't set value command:{} vr:{} val:{}".format(hex(cmd),d_vr[cmd],val))
+            d_ret[cmd] = True
+        self._pending_outdated(d_cmd_val,d_ret)
+        return d_ret
+
+    # drop the deferred transactions with another value of a register set by this one
+    def _pending_outdated(self,d_cmd_val :dict,d_ret :dict):
+        d_set = {cmd:val for cmd,val in d_cmd_val.items() if d_ret.get(cmd) is True}
+        for cmd,d_tx in list(self.d_eeprom_pending_tx.items()):
+            if any(d_set.get(cmd_tx,val) != val for cmd_tx,val in d_tx.items() if cmd_tx != cmd):
+                self._pending_drop(cmd)
+
+    # forget the deferred value of a register
+    def _pending_drop(self,cmd :int):
+        self.d_eeprom_pending.pop(cmd,None)
+        self.d_eeprom_pending_tx.pop(cmd,None)
+
+    """ set the direction and the current of the direction in one transaction
+        - the current is not written without its direction
+        - a direction change is never blocked: with a deferred rising current (eeprom limiter) the direction
+          is switched with the stored lower current of the new direction, the new current follows with eeprom_flush()
+        @param mode e_charge_mode_charge, e_charge_mode_discharge
+        @param val current [A*100]
+    """
+    def charge_set(self,mode :int,val :int):
+        cmd = CBic.e_cmd_IOUT_SET if mode == CBic.e_charge_mode_charge else CBic.e_cmd_REVERSE_IOUT_SET
+        d_ret = self.write_many({CBic.e_cmd_DIRECTION_CTRL:mode,cmd:int(val)},atomic=True)
+        if d_ret[CBic.e_cmd_DIRECTION_CTRL] is False and cmd in self.d_eeprom_pending:
+            d_ret.update(self.write_many({CBic.e_cmd_DIRECTION_CTRL:mode}))
+        return d_ret
+
+    # enable the eeprom write limiter
+    def eeprom_ledger_set(self,ledger :CEepromLedger):
+        self.ledger = ledger
+
+    # write the deferred eeprom values with the other registers of their transaction, call it if eeprom_flush_due()
+    def eeprom_flush(self):
+        for cmd,val in list(self.d_eeprom_pending.items()):
+            d_tx = self.d_eeprom_pending_tx.get(cmd)
+            if d_tx is None:
+                continue # dropped by the former transaction
+            self.write_many(d_tx,atomic=True)
+        if self.ledger is not None:
+            self.ledger.flush()
+
+    # @return True if a deferred eeprom value can be written now (interval and budget of the ledger)
+    def eeprom_flush_due(self):
+        if self.ledger is None:
+            return len(self.d_eeprom_pending) >0
+        return any(self.ledger.write_due(cmd) for cmd in self.d_eeprom_pending)
+
+    # set the cache time to live [s] of a command, 0: disable caching, CACHE_TTL_WRITE: until written
+    def cache_ttl_set(self,cmd :int,ttl :float):
+        self.d_cache_ttl[cmd] = ttl
+        self.d_cache.pop(cmd,None)
+
+    # @return last received value of a command (any age, shadow register), None: unknown
+    def cache_peek(self,cmd :int):
+        entry = self.d_cache.get(cmd)
+        if entry is None:
             return None
-        #print(msgr_split)
         try:
-        #print (str(hexval))
-            hexval = int((msgr_split[11] + msgr_split[10]),16)
-        except (AttributeError, ValueError):
+            return CBic.d_cmd_dec.get(cmd,dec_word)(entry[1])
+        except (IndexError,struct.error,UnicodeDecodeError):
             return None
-        return hexval
 
-    # receive function
-    def can_receive_byte(self):
+    # invalidate one command or the whole cache (cmd is None)
+    def cache_clear(self,cmd=None):
+        if cmd is None:
+            self.d_cache.clear()
+        else:
+            self.d_cache.pop(cmd,None)
+
+    # send a new value and invalidate the cached one
+    # @param size 1:byte 2:word
+    def can_write(self,cmd :int,val :int,size=2):
+        self.d_cache.pop(cmd,None)
+        if cmd in CBic.s_cmd_info:
+            self.info_cache_clear()
+        self.can_send_msg(can_frame_write(cmd,val,size))
+
+    # persist the device info (dump) to this file, one file for each device (channel and address)
+    def info_cache_set(self,fname :str):
+        self.info_fname = fname
+
+    # @return the persisted device info of this device, None if there is none
+    def info_cache_load(self):
+        if self.info_fname is None:
+            return None
         try:
-            msgr_split = self.can_rcv_raw()
-        except TimeoutError:
+            with open(self.info_fname,'r') as f:
+                d_file = json.load(f)
+        except (OSError,ValueError):
             return None
-        if len(msgr_split) < 11:
+        if d_file.get('canChan') != self.can_chan_id or d_file.get('canAdr') != self.can_adr:
             return None
-        hexval = (msgr_split[10])
-        #print (int(hexval,16))
-        return int(hexval,16)
+        return d_file.get('info')
 
+    def info_cache_save(self,d_info :dict):
+        if self.info_fname is None:
+            return
+        d_file = {'canChan':self.can_chan_id,'canAdr':self.can_adr,'info':d_info}
+        try:
+            fname_tmp = self.info_fname + '.tmp'
+            with open(fname_tmp,'w') as f:
+                json.dump(d_file,f,indent=4)
+            os.replace(fname_tmp,self.info_fname)
+        except OSError as e:
+            print("device info can't save:" + str(e))
+
+    def info_cache_clear(self):
+        if self.info_fname is not None and os.path.exists(self.info_fname):
+            try:
+                os.remove(self.info_fname)
+            except OSError as e:
+                print("device info can't remove:" + str(e))
+
+    # drop all received and not yet read frames, e.g. a reply after a timeout
+    def can_rcv_flush(self):
+        while self.can_chan.recv(0) is not None:
+            self.d_can_stat['rxStale'] += 1
+
+    # set the limits of the adaptive read timeout [s] and the number of retries
+    def tmo_set(self,tmo_min :float,tmo_max :float,retry_max=1):
+        self.rtt.tmo_min = tmo_min
+        self.rtt.tmo_max = tmo_max
+        self.retry_max = retry_max
+
+    """ send the read requests as a burst and collect the tagged replies into d_data
+        - the round trip time of each reply updates the timeout estimator
+        @param tmo deadline for all replies [s]
+    """
+    def can_read_burst(self,lst_cmd,tmo,d_data):
+        t_send = time.monotonic()
+        t_end = t_send + tmo
+        if self.rx is not None:
+            # the receive thread dispatches the replies
+            d_wait = {}
+            try:
+                with self.lock_tx,self.tx_batch():
+                    for cmd in lst_cmd:
+                        d_wait[cmd] = self.rx.expect(self.can_adr_rsp,cmd)
+                        self.can_send_msg(can_frame_read(cmd))
+                        self.stat.cmd_get(cmd).tx += 1
+                for cmd,w in d_wait.items():
+                    if w.event.wait(max(t_end - time.monotonic(),0)):
+                        d_data[cmd] = w.msg.data
+                        self.rtt.update(cmd,w.ts - t_send)
+                        self.stat.rx(cmd,len(w.msg.data),w.ts - t_send)
+                        self.ts_rx_last = w.ts
+            finally:
+                for cmd,w in d_wait.items():
+                    if w.msg is None:
+                        self.rx.cancel(self.can_adr_rsp,cmd,w)
+            if self.rec is not None:
+                # replies with the dispatch time of the receive thread, in the order of arrival
+                for w in sorted((w for w in d_wait.values() if w.msg is not None),key=lambda w: w.ts):
+                    self.rec.write(CCanRec.e_dir_rx,self.can_adr_rsp,w.msg.data,w.ts)
+        else:
+            self.can_rcv_flush()
+            with self.tx_batch():
+                for cmd in lst_cmd:
+                    self.can_send_msg(can_frame_read(cmd))
+                    self.stat.cmd_get(cmd).tx += 1
+            set_open = set(lst_cmd)
+            while len(set_open) >0:
+                msgr = self.can_chan.recv(max(t_end - time.monotonic(),0))
+                if msgr is None:
+                    break
+                if msgr.is_error_frame:
+                    self.health.on_err_frame(msgr)
+                    self.d_can_stat['rxDrop'] += 1
+                    continue
+                self.health.on_rx()
+                data = msgr.data
+                if msgr.arbitration_id == self.can_adr_rsp and len(data) >= 2:
+                    cmd = can_frame_cmd(data)
+                    if cmd in set_open:
+                        set_open.discard(cmd)
+                        d_data[cmd] = data
+                        self.ts_rx_last = time.monotonic()
+                        self.rtt.update(cmd,self.ts_rx_last - t_send)
+                        self.stat.rx(cmd,len(data),self.ts_rx_last - t_send)
+                        if self.rec is not None:
+                            self.rec.write(CCanRec.e_dir_rx,self.can_adr_rsp,data,self.ts_rx_last)
+                        continue
+                self.d_can_stat['rxDrop'] += 1
+
+    """ send the read requests of all commands as a burst and collect the tagged replies
+        - frames of other devices or replies to other commands will be dropped
+        - requests without reply are repeated (retry_max) after a random pause, if the device is alive
+        @param tmo deadline for all replies of a burst [s], None: adaptive timeout of the commands (CCanRtt)
+        @return dict cmd -> reply data, None if there was no reply
+    """
+    def can_read_data(self,lst_cmd,tmo=None,cached=True):
+        d_data = dict.fromkeys(lst_cmd)
+        t_now = time.monotonic()
+
+        # served by the register cache
+        lst_cmd = []
+        for cmd in d_data:
+            entry = self.d_cache.get(cmd) if cached else None
+            if entry is not None and (t_now - entry[0]) < self.d_cache_ttl.get(cmd,0):
+                d_data[cmd] = entry[1]
+                self.d_can_stat['cacheHit'] += 1
+            else:
+                lst_cmd.append(cmd)
+                self.d_can_stat['cacheMiss'] += 1
+        if len(lst_cmd) == 0:
+            return d_data
+
+        lst_open = lst_cmd
+        retry = 0
+        while True:
+            tmo_burst = tmo if tmo is not None else max(self.rtt.tmo_get(cmd) for cmd in lst_open)
+            self.can_read_burst(lst_open,tmo_burst,d_data)
+            lst_open = [cmd for cmd in lst_open if d_data[cmd] is None]
+            if len(lst_open) == 0:
+                break
+            for cmd in lst_open:
+                self.rtt.backoff(cmd)
+            if retry >= self.retry_max or (time.monotonic() - self.ts_rx_last) > self.retry_alive_sec:
+                break
+            retry += 1
+            self.d_can_stat['txRetry'] += len(lst_open)
+            for cmd in lst_open:
+                self.stat.cmd_get(cmd).retry += 1
+            time.sleep(random.uniform(0,self.retry_jitter_sec))
+
+        t_now = time.monotonic()
+        for cmd in lst_cmd:
+            data = d_data[cmd]
+            if data is None:
+                self.d_can_stat['rxTmo'] += 1
+                self.stat.cmd_get(cmd).tmo += 1
+            elif self.d_cache_ttl.get(cmd,0) > 0:
+                self.d_cache[cmd] = (t_now,data)
+
+        # the device may be restarted with its eeprom values, don't trust the cache anymore
+        if len(lst_open) >0:
+            self.d_cache.clear()
+        if len(lst_open) == len(lst_cmd):
+            self.cnt_tmo_seq += 1
+        else:
+            self.cnt_tmo_seq = 0
+        return d_data
 
-    # receive function
-    def can_receive_char(self):
+    """ send the read request for the command and decode the reply
+        - raise CCanTimeoutError if the device did not reply
+        @param dec decoder for the reply data: dec_word, dec_sword, dec_byte, dec_char
+        @return decoded value, default for an invalid reply
+    """
+    def can_read(self,cmd :int,dec=dec_word,default=None,cached=True):
+        data = self.can_read_data([cmd],cached=cached)[cmd]
+        if data is None:
+            if self.persist is False:
+                print('Timeout occurred, no message.')
+                sys.exit(2)
+            raise CCanTimeoutError(self.can_adr,[cmd])
         try:
-            msgr_split = self.can_rcv_raw()
-            s = bytearray.fromhex(msgr_split[10]+msgr_split[11]+msgr_split[12]+msgr_split[13]+msgr_split[14]+msgr_split[15]).decode()
-        except (TimeoutError,IndexError):
-            return None
+            return dec(data)
+        except (IndexError,struct.error,UnicodeDecodeError):
+            return default
 
-        #print(s)
-        return s
+    """ pipelined read: send the read requests of all commands as a burst
+        and collect the tagged replies in one pass
+        - raise CCanTimeoutError if a reply is missing, err.d_val holds the received values
+        @param tmo deadline for all replies [s], None: adaptive timeout
+        @return dict cmd -> decoded value (d_cmd_dec), None for an invalid reply
+    """
+    def read_many(self,lst_cmd,tmo=None,cached=True):
+        d_val = self.can_read_data(lst_cmd,tmo,cached)
+        lst_tmo = [cmd for cmd,data in d_val.items() if data is None]
+        for cmd,data in d_val.items():
+            if data is not None:
+                try:
+                    d_val[cmd] = CBic.d_cmd_dec.get(cmd,dec_word)(data)
+                except (IndexError,struct.error,UnicodeDecodeError):
+                    d_val[cmd] = None
+        if len(lst_tmo) >0:
+            if self.persist is False:
+                print('Timeout occurred, no message.')
+                sys.exit(2)
+            raise CCanTimeoutError(self.can_adr,lst_tmo,d_val)
+        return d_val
+
+    """ receive 16Bit word from can
+        return default value for an invalid reply, raise CCanTimeoutError without reply
+    """
+    def can_receive_word(self,e_cmd :int,default = None):
+        return self.can_read(e_cmd,dec_word,default)
+
+    # receive signed 16Bit word e.g. current
+    def can_receive_sword(self,e_cmd :int,default = None):
+        return self.can_read(e_cmd,dec_sword,default)
+
+    def can_receive_byte(self,e_cmd :int,default = None):
+        return self.can_read(e_cmd,dec_byte,default)
+
+    # receive 6 ascii chars
+    def can_receive_char(self,e_cmd :int,default = None):
+        return self.can_read(e_cmd,dec_char,default)
+
+    # @return register value with the decoder of the register map
+    def reg_get(self,cmd :int,default = None):
+        return self.can_read(cmd,CBic.d_cmd_dec.get(cmd,dec_word),default)
+
+    # read (e_cmd_read) or write and verify (e_cmd_write) a register value, @return the value
+    def reg_rw(self,cmd :int,rw,val=0):
+        if rw == CBic.e_cmd_read:
+            return self.reg_get(cmd)
+        val = int(val)
+        self.can_send_receive_word(cmd,val)
+        return val
+
+    """ typed read of several registers in one burst (read_many)
+        - raise CCanTimeoutError if a reply is missing, err.d_val holds the received values in the unit
+        @return dict cmd -> value in the unit of the register (CReg.scale), str for char registers
+    """
+    def reg_read(self,lst_cmd,tmo=None,cached=True):
+        try:
+            d_val = self.read_many(lst_cmd,tmo,cached)
+        except CCanTimeoutError as err:
+            err.d_val = {cmd:CBic.d_reg[cmd].value(val) for cmd,val in err.d_val.items()}
+            raise
+        return {cmd:CBic.d_reg[cmd].value(val) for cmd,val in d_val.items()}
+
+    """ typed write of several registers in one transaction (write_many)
+        @param d_cmd_val cmd -> value in the unit of the register e.g. 27.5 [V]
+        @return dict cmd -> True for success, False if the write was skipped or deferred
+    """
+    def reg_write(self,d_cmd_val :dict,force=False):
+        d_raw = {}
+        for cmd,val in d_cmd_val.items():
+            reg = CBic.d_reg[cmd]
+            if 'w' not in reg.access:
+                raise ValueError("register is read only:" + reg.name)
+            d_raw[cmd] = reg.raw(val)
+        return self.write_many(d_raw,force)
 
     # Operation function
     # @return read value from bic
@@ -336,166 +2121,57 @@ class CBic:
 
         if val == 2:
             val = self.operation_read()
-            val = not val 
-        else:        
+            val = not val
+        else:
             val = val & 0x01
-        
-        commandhighbyte = 0x00
-        commandlowbyte = 0x00
-        self.can_send_msg([commandlowbyte, commandhighbyte,val])
+
+        self.can_write(CBic.e_cmd_OPERATION,val,1)
         val = self.operation_read()
         return val
 
     def operation_read(self):
-        # print (Read status "output on/off")
-        # Command Code 0x0000
-        commandhighbyte = 0x00
-        commandlowbyte = 0x00
+        return self.reg_get(CBic.e_cmd_OPERATION)
 
-        self.can_send_msg([commandlowbyte, commandhighbyte])
-        v = self.can_receive_byte()
-        return v
-
-    # charge voltage, max. volatge level of battery
+    # charge voltage, max. volatge level of battery [V*100], EEPROM write !!!
     def charge_voltage(self,rw,val=0):
-        # print ("read/set charge voltage")
-        # Command Code 0x0020 e_cmd_VOUT_SET
-        # Read Charge Voltage
-        commandhighbyte = 0x00
-        commandlowbyte = 0x20
-
-        if rw==CBic.e_cmd_read:
-            self.can_send_msg([commandlowbyte, commandhighbyte])
-            return self.can_receive()
-        else:
-            val=int(val)
-            self.can_send_receive_word(CBic.e_cmd_VOUT_SET,val)
-            return val
+        return self.reg_rw(CBic.e_cmd_VOUT_SET,rw,val)
 
+    # charge current [A*100], EEPROM write !!!
     def charge_current(self,rw,val=0): #0=read, 1=set
-        # print ("read/set charge current")
-        # Command Code 0x0030 IOUT_SET EEPROM write !!!
-        # Read Charge Voltage
-        commandhighbyte = 0x00
-        commandlowbyte = 0x30
-
-        if rw==CBic.e_cmd_read:
-            self.can_send_msg([commandlowbyte,commandhighbyte])
-            return self.can_receive()
-        else:
-            val=int(val)
-            self.can_send_receive_word(CBic.e_cmd_IOUT_SET,val)
-            return val
+        return self.reg_rw(CBic.e_cmd_IOUT_SET,rw,val)
 
-   
-            
-    # set the minimum volatage of the bat in discharge mode
+    # set the minimum volatage of the bat in discharge mode [V*100], EEPROM write !!!
     def discharge_voltage(self,rw,val=0): #0=read, 1=set
-        # print ("read/set discharge voltage")
-        # Command Code 0x0120 REVERSE_VOUT_SET EPPROM write !!!
-        # Read Charge Voltage
-        commandhighbyte = 0x01
-        commandlowbyte = 0x20
-
-        if rw==CBic.e_cmd_read:
-            self.can_send_msg([commandlowbyte,commandhighbyte])
-            return self.can_receive()
-        else:
-            val=int(val)
-            self.can_send_receive_word(CBic.e_cmd_REVERSE_VOUT_SET,val)
-            return val
+        return self.reg_rw(CBic.e_cmd_REVERSE_VOUT_SET,rw,val)
 
+    # discharge current [A*100], EEPROM write !!!
     def discharge_current(self,rw,val=0): #0=read, 1=set
-        # print ("read/set charge current")
-        # Command Code 0x0130 REVERSE_IOUT_SET EEPROM set !!
-        # Read Charge Voltage
-        commandhighbyte = 0x01
-        commandlowbyte = 0x30
-
-        if rw==CBic.e_cmd_read:
-            self.can_send_msg([commandlowbyte,commandhighbyte])
-            return self.can_receive()
-        else:
-            val = int(val)
-            self.can_send_receive_word(CBic.e_cmd_REVERSE_IOUT_SET,val)
-            """
-            valhighbyte = int(val) >> 8
-            vallowbyte  = int(val) & 0xFF
-            v=val
-            self.can_send_msg([commandlowbyte,commandhighbyte,vallowbyte,valhighbyte])
-            """
-            return int(val)
-
+        return self.reg_rw(CBic.e_cmd_REVERSE_IOUT_SET,rw,val)
 
     def vread(self):
-        # print ("read dc voltage")
-        # Command Code 0x0060
-        # Read DC Voltage
-
-        commandhighbyte = 0x00
-        commandlowbyte = 0x60
-        self.can_send_msg([commandlowbyte,commandhighbyte])
-        return self.can_receive()
+        return self.reg_get(CBic.e_cmd_READ_VOUT)
 
+    # @return signed dc current, negative value if the battery is discharging
     def cread(self):
-        # print ("read dc current")
-        # Command Code 0x0061
-        # Read DC Current
-
-        commandhighbyte = 0x00
-        commandlowbyte = 0x61
-
-        self.can_send_msg([commandlowbyte,commandhighbyte])
-
-        msgr_split = self.can_rcv_raw()
-        if msgr_split is None:
-            return None
-
-        hexval = (msgr_split[11]+ msgr_split[10])
-
-        # quick and primitive solution to determine the
-        # negative charging current when discharging the battery
-
-        cval = (int(hexval,16))
-        if cval > 20000 :
-            cval = cval - 65536
-
-        #print (cval)
-        return cval
-
+        return self.reg_get(CBic.e_cmd_READ_IOUT)
 
     def acvread(self):
-        # print ("read ac voltage")
-        # Command Code 0x0050
-        # Read AC Voltage
-
-        commandhighbyte = 0x00
-        commandlowbyte = 0x50
-
-        self.can_send_msg([commandlowbyte,commandhighbyte])
-        return self.can_receive()
-
+        return self.reg_get(CBic.e_cmd_READ_VIN)
 
     # sys config: check(and set) eeprom write flag
     # battery-mode: check and set birirect-mode
     def init_mode(self):
 
-        self.can_send_msg([0xC2,0x00]) #  SYS-Config
-        sys_cfg = self.can_receive()
-        
-        if sys_cfg is None:
-            print("ERROR ini_mode")
-            return None
+        sys_cfg = self.can_receive_word(CBic.e_cmd_SYSTEM_CONFIG)
 
         print('syscfg:' + hex(sys_cfg))
-        sys_cfg_h = int(sys_cfg) >> 8
-        sys_cfg_l  = int(sys_cfg) & 0xFF
+        sys_cfg_h,sys_cfg_l = get_high_low_byte(sys_cfg)
 
         flag_can_ctrl = get_normalized_bit(int(sys_cfg_l), bit_index=0)
         if flag_can_ctrl == 0:
             sys_cfg_l = set_bit(sys_cfg_l,0)
-            print('ini_mode can control disabled -> enabled') 
-            self.can_send_msg([0xC2,0x00,sys_cfg_l,sys_cfg_h])
+            print('ini_mode can control disabled -> enabled')
+            self.can_write(CBic.e_cmd_SYSTEM_CONFIG,(sys_cfg_h << 8) | sys_cfg_l)
             time.sleep(1)
 
         # (only working later "firmRev": "0xd0e")
@@ -505,74 +2181,49 @@ class CBic:
             print('ini_mode write parameter to eeprom enabled -> disabled')
             #sys_cfg_h = sys_cfg_h  & ~(1 << 2) # clear bit 10
             sys_cfg_h = set_bit(sys_cfg_h,2)
-            self.can_send_msg([0xC2,0x00,sys_cfg_l,sys_cfg_h])
+            self.can_write(CBic.e_cmd_SYSTEM_CONFIG,(sys_cfg_h << 8) | sys_cfg_l)
             time.sleep(1)
 
-
-        self.can_send_msg([0x040,0x01]) # bidirectional battery mode config
-        cfg_bm = self.can_receive()
-
-        if cfg_bm is None:
-            print("ERROR can't init mode")
-            return None
+        cfg_bm = self.can_receive_word(CBic.e_cmd_BIDIRECTIONAL_CONFIG) # bidirectional battery mode config
 
         flag_bidirect = get_normalized_bit(int(cfg_bm), bit_index=0)
         if flag_bidirect ==0:
             print('ini_mode enable bidirect mode, need repowering !!!')
             #cfg_bm = cfg_bm | 0x01 # set bit 0
             cfg_bm = set_bit(cfg_bm,0)
-            cfg_bm_h = int(cfg_bm) >> 8
-            cfg_bm_l  = int(cfg_bm) & 0xFF
-            self.can_send_msg([0x40,0x01,cfg_bm_l,cfg_bm_h])
+            self.can_write(CBic.e_cmd_BIDIRECTIONAL_CONFIG,cfg_bm)
             time.sleep(1)
             #exit(0)
 
-
         if self.persist is False:
             print("init_mode done")
         return 0
 
-
     def BIC_chargemode(self,val): #0=charge, 1=discharge
         # print ("set charge/discharge")
         # Command Code 0x0100
-        # Set Direction Charge
-
         val = int(val)
 
-        cmd_hb,cmd_lb = get_high_low_byte(CBic.e_cmd_DIRECTION_CTRL)    
         # check running value
-        self.can_send_msg([cmd_lb,cmd_hb])
-        vr=self.can_receive_byte()
+        vr=self.can_receive_byte(CBic.e_cmd_DIRECTION_CTRL)
         if vr == val:
-            #print("skip vr:{} val:{}".format(vr,val))   
+            #print("skip vr:{} val:{}".format(vr,val))
             return val
 
         # set new value
-        self.can_send_msg([cmd_lb,cmd_hb,val])
+        self.can_write(CBic.e_cmd_DIRECTION_CTRL,val,1)
         self.write_cnt+=1
         return val
 
     def BIC_chargemode_read(self):
-        # print ("read charge/discharge mode")
-        # Command Code 0x0100
-        # Read Direction charge/discharge
-        cmd_hb,cmd_lb = get_high_low_byte(CBic.e_cmd_DIRECTION_CTRL)    
-
-        self.can_send_msg([cmd_lb, cmd_hb])
-        v = self.can_receive_byte()
-        return v
-
+        return self.reg_get(CBic.e_cmd_DIRECTION_CTRL)
 
     def NPB_chargemode(self,rw, val=0xFF):
         # print ("Set PSU or Charger Mode to NPB Device")
         # Command Code 0x00B4
-        commandhighbyte = 0x00
-        commandlowbyte = 0xB4
 
         #first Read the current value
-        self.can_send_msg([commandlowbyte, commandhighbyte])
-        v = int(self.can_receive(),16)
+        v = self.can_receive_word(CBic.e_cmd_CURVE_CONFIG)
 
         if rw==CBic.e_cmd_write: #0=read, 1=write
             #modify Bit 7 of Lowbyte
@@ -582,52 +2233,45 @@ class CBic:
             else:
                 v = clear_bit(v,7)
 
-            valhighbyte = v >> 8
-            vallowbyte = v & 0xFF
-
             #send to device
-            self.can_send_msg([commandlowbyte,commandhighbyte,vallowbyte,valhighbyte])
-            self.e_cmd_write += 1
+            self.can_write(CBic.e_cmd_CURVE_CONFIG,v)
+            self.write_cnt += 1
             #check the current value
-            self.can_send_msg([commandlowbyte,commandhighbyte])
-            v = int(self.can_receive(),16)
+            v = self.can_receive_word(CBic.e_cmd_CURVE_CONFIG)
 
         return v
 
-    def dump(self):
-
-        commandhighbyte = 0x00
-        commandlowbyte = 0x82
-
-        self.can_send_msg([commandlowbyte,commandhighbyte])
-        s1 = self.can_receive_char()
-
-        commandlowbyte = 0x83
-        self.can_send_msg([commandlowbyte,commandhighbyte])
-        s2 = self.can_receive_char()
-
-        if s1 is None or s2 is None:
+    """ read the device info: model name, firmware, system config, manufacture date
+        - with an info cache file (info_cache_set) only the firmware revision is read,
+          all info is read again if it differs from the persisted one or refresh is True
+        @return dict with the device info, None for an invalid reply, raise CCanTimeoutError without reply
+    """
+    def dump(self,refresh=False):
+
+        d_file = None if refresh else self.info_cache_load()
+        if d_file is not None:
+            firm_rev = self.can_receive_word(CBic.e_cmd_FW_REVISION)
+            if firm_rev is not None and d_file.get('firmRev') == hex(firm_rev):
+                self.d_info.update(d_file)
+                self.d_info['cntWrite'] = self.write_cnt
+                return self.d_info
+
+        s = self.typeread()
+        if s is None:
             return None
-
-        s=s1+s2
         self.d_info['modelName'] = s
 
         # firmware version
 
         try:
-            self.can_send_msg([0x84,0x00])
-            self.d_info['firmRev'] = hex(self.can_receive()) # to bytes hexvalue mcu0 and mcu1
-
-            self.can_send_msg([0xC2,0x00])
-            self.d_info['sysCfg'] = hex(self.can_receive()) # to bytes hexvalue mcu0 and mcu1
-
-            self.can_send_msg([0x40,0x01])
-            self.d_info['sysCfgBDir'] = hex(self.can_receive()) # bdir config bit 1
-        except (AttributeError, ValueError):
+            self.d_info['firmRev'] = hex(self.can_receive_word(CBic.e_cmd_FW_REVISION)) # to bytes hexvalue mcu0 and mcu1
+            self.d_info['sysCfg'] = hex(self.can_receive_word(CBic.e_cmd_SYSTEM_CONFIG)) # to bytes hexvalue mcu0 and mcu1
+            self.d_info['sysCfgBDir'] = hex(self.can_receive_word(CBic.e_cmd_BIDIRECTIONAL_CONFIG)) # bdir config bit 1
+        except (TypeError, ValueError):
             return None
 
-        self.can_send_msg([0x86,0x00])
-        self.d_info['manDate'] = str(self.can_receive_char()) # manufac. date
+        self.d_info['manDate'] = str(self.can_receive_char(CBic.e_cmd_MFR_DATE)) # manufac. date
+        self.info_cache_save({k:v for k,v in self.d_info.items() if k != 'cntWrite'})
 
         self.d_info['cntWrite'] = self.write_cnt
 
@@ -640,17 +2284,8 @@ class CBic:
         # print ("read power supply type")
         # Command Code 0x0082
         # Command Code 0x0083
-        # Read Type of PSU
-
-        commandhighbyte = 0x00
-        commandlowbyte = 0x82
-
-        self.can_send_msg([commandlowbyte,commandhighbyte])
-        s1 = self.can_receive_char()
-
-        commandlowbyte = 0x83
-        self.can_send_msg([commandlowbyte,commandhighbyte])
-        s2 = self.can_receive_char()
+        s1 = self.can_receive_char(CBic.e_cmd_MFR_MODEL_B0B5)
+        s2 = self.can_receive_char(CBic.e_cmd_MFR_MODEL_B6B11)
 
         if s1 is None or s2 is None:
             return None
@@ -658,8 +2293,9 @@ class CBic:
         #print(s)
         return s
 
+    # @return signed temperature [C*10]
     def tempread(self):
-        return self.can_receive_word(CBic.e_cmd_READ_TEMPERATURE_1,-278 * 10)
+        return self.reg_get(CBic.e_cmd_READ_TEMPERATURE_1,-278 * 10)
 
     # @eturn fan1,fan2 speed
     def fanread(self,silence = False):
@@ -678,11 +2314,7 @@ class CBic:
         # Command Code 0x00C1
         # Read System Status
 
-        commandhighbyte = 0x00
-        commandlowbyte = 0xC1
-
-        self.can_send_msg([commandlowbyte,commandhighbyte])
-        sval = self.can_receive()
+        sval = self.can_receive_word(CBic.e_cmd_SYSTEM_STATUS)
 
         if sval is None:
             return None
@@ -744,18 +2376,11 @@ class CBic:
             return self.fault_changed
         return False
 
-    """ Read System Fault Status
-        Command Code 0x0040
-        - set and count faults
+    """ decode the fault status register
+        - set and count faults, sval None: can read error
         @return true if something has changed
     """
-    def faultread(self):
-        self.fault_changed = False
-        commandhighbyte = 0x00
-        commandlowbyte = 0x40
-
-        self.can_send_msg([commandlowbyte,commandhighbyte])
-        sval = self.can_receive()
+    def fault_decode(self,sval):
         if sval is None:
             return self.fault_update('can',1)
         else:
@@ -785,72 +2410,639 @@ class CBic:
 
         s = get_normalized_bit(int(sval), bit_index=7)
         self.fault_update('otpHi',s)
-        s = get_normalized_bit(int(sval), bit_index=8) 
+        s = get_normalized_bit(int(sval), bit_index=8)
         self.fault_update('ovpHi',s)
+        return self.fault_changed
+
+    """ Read System Fault Status
+        Command Code 0x0040
+        - set and count faults
+        @return true if something has changed
+    """
+    def faultread(self):
+        self.fault_changed = False
+        try:
+            sval = self.can_receive_word(CBic.e_cmd_FAULT_STATUS)
+        except CCanTimeoutError:
+            sval = None # can fault
+        self.fault_decode(sval)
         if self.persist is False:
             for fault in self.d_fault.values():
                 print(str(fault))
 
         return self.fault_changed
 
+    """ read fault, system status and operation in one burst
+        - set and count faults like faultread(), eeprom fault from the system status
+        - a read timeout is the can fault, no exception
+        @return dict fault,status,opMode (None for a read error), fault_changed is set
+    """
+    def status_snapshot(self,tmo=None):
+        self.fault_changed = False
+        try:
+            d_val = self.read_many([CBic.e_cmd_FAULT_STATUS,CBic.e_cmd_SYSTEM_STATUS,CBic.e_cmd_OPERATION],tmo)
+        except CCanTimeoutError as err:
+            d_val = err.d_val
+        self.fault_decode(d_val[CBic.e_cmd_FAULT_STATUS])
+        sval = d_val[CBic.e_cmd_SYSTEM_STATUS]
+        if sval is not None:
+            self.fault_update('eeprom',get_normalized_bit(int(sval), bit_index=5))
+
+        d_snap = {}
+        d_snap['fault'] = d_val[CBic.e_cmd_FAULT_STATUS]
+        d_snap['status'] = sval
+        d_snap['opMode'] = d_val[CBic.e_cmd_OPERATION]
+        return d_snap
+
+
+# cmd -> name e.g. 0x0030:'IOUT_SET'
+CBic.d_cmd_name = {v:k[6:] for k,v in vars(CBic).items() if k.startswith('e_cmd_') and k[6:].isupper()}
+for _reg in CBic.d_reg.values():
+    _reg.name = CBic.d_cmd_name[_reg.cmd]
+
+#########################################
+# request scheduler
+class CBicSched:
+    """ priority scheduler for the device requests, one worker thread owns the device (CBic)
+        - the lowest class first, fifo within a class: a setpoint is not queued behind telemetry reads
+        - reads (class >= e_prio_fast) with a deadline are dropped if they can't start in time
+        - jobs with the same key are coalesced, a pending job is replaced by the newer one
+        usage:
+            sched = CBicSched(bic)
+            fut = sched.submit(CBicSched.e_prio_slow,bic.tempread,deadline_sec=2,key='temp')
+            sched.call(CBicSched.e_prio_setpoint,bic.charge_current,CBic.e_cmd_write,1200)
+    """
+    e_prio_safety = 0   # idle and off writes
+    e_prio_setpoint = 1 # setpoint writes
+    e_prio_fast = 2     # fast telemetry: voltage, current, faults
+    e_prio_slow = 3     # slow telemetry: temperature, fans, ac voltage
+    e_prio_diag = 4     # diagnostics: device info
+    s_prio = ('safety','setpoint','fast','slow','diag')
+
+    class Job:
+        __slots__ = ('prio','seq','deadline','ts','func','args','fut','key')
+        def __lt__(self,other):
+            return (self.prio,self.seq) < (other.prio,other.seq)
+
+    def __init__(self,bic):
+        self.bic = bic
+        self.cond = threading.Condition()
+        self.heap = [] # Job
+        self.d_key = {} # key -> pending Job
+        self.seq = 0
+        self.running = True
+        self.d_stat = {'jobs':0,'drop':0,'coalesced':0,'err':0}
+        self.lst_wait_max = [0.0] * len(CBicSched.s_prio) # max. queue time of each class [s]
+        self.thread = threading.Thread(target=self._run,name='bic-sched',daemon=True)
+        self.thread.start()
+
+    """ queue a job, func(*args) will be called by the worker thread
+        @param deadline_sec drop a read job that can't start within x [s], None: never
+        @param key coalesce with a pending job of the same key
+        @return Future of the job, cancelled if the job was dropped or replaced or the scheduler is stopped
+    """
+    def submit(self,prio :int,func,*args,deadline_sec=None,key=None):
+        job = CBicSched.Job()
+        job.prio = prio
+        job.ts = time.monotonic()
+        job.deadline = None if (deadline_sec is None or prio < CBicSched.e_prio_fast) else job.ts + deadline_sec
+        job.func = func
+        job.args = args
+        job.fut = Future()
+        job.key = key
+        with self.cond:
+            if self.running is False:
+                job.fut.cancel() # stopped, no worker anymore
+                return job.fut
+            job.seq = self.seq
+            self.seq += 1
+            if key is not None:
+                job_old = self.d_key.get(key)
+                if job_old is not None and job_old.fut.cancel():
+                    self.d_stat['coalesced'] += 1
+                self.d_key[key] = job
+            heapq.heappush(self.heap,job)
+            self.cond.notify()
+        return job.fut
+
+    """ run func(*args) in the worker thread and wait for the result, direct call inside the worker
+        - raise FutureTimeoutError after tmo [s], the job is cancelled if it isn't running yet
+    """
+    def call(self,prio :int,func,*args,tmo=None):
+        if threading.current_thread() is self.thread:
+            return func(*args)
+        fut = self.submit(prio,func,*args)
+        try:
+            return fut.result(tmo)
+        except FutureTimeoutError:
+            fut.cancel()
+            raise
+
+    def _run(self):
+        while True:
+            with self.cond:
+                while self.running and len(self.heap) == 0:
+                    self.cond.wait()
+                if len(self.heap) == 0:
+                    return
+                job = heapq.heappop(self.heap)
+                if job.key is not None and self.d_key.get(job.key) is job:
+                    del self.d_key[job.key]
+            if job.fut.cancelled():
+                continue
+            t_now = time.monotonic()
+            if job.deadline is not None and t_now > job.deadline:
+                job.fut.cancel()
+                self.d_stat['drop'] += 1
+                continue
+            if job.fut.set_running_or_notify_cancel() is False:
+                continue
+            self.lst_wait_max[job.prio] = max(self.lst_wait_max[job.prio],t_now - job.ts)
+            self.d_stat['jobs'] += 1
+            try:
+                job.fut.set_result(job.func(*job.args))
+            except Exception as e:
+                self.d_stat['err'] += 1
+                job.fut.set_exception(e)
+
+    # @return number of the pending jobs
+    def pending(self):
+        with self.cond:
+            return sum(1 for job in self.heap if not job.fut.cancelled())
+
+    # run the pending jobs and stop the worker thread
+    def stop(self,tmo=None):
+        with self.cond:
+            self.running = False
+            self.cond.notify()
+        self.thread.join(tmo)
+
+    # @return dict with the job counters and the max. queue time [ms] of each class
+    def stat_get(self):
+        d_stat = dict(self.d_stat)
+        d_stat['pending'] = self.pending()
+        d_stat['waitMaxMs'] = {name:round(self.lst_wait_max[i] * 1000,1) for i,name in enumerate(CBicSched.s_prio)}
+        return d_stat
+
+#########################################
+# asyncio bic class
+class AsyncCBic:
+    """ asyncio variant of CBic, uses the same frames and reply decoders
+        - one receive task dispatches the replies by the echoed command to the waiting requests
+        - concurrent requests of different commands share one round trip
+        usage:
+            bic = AsyncCBic()
+            await bic.start()
+            v,a = await asyncio.gather(bic.vread(),bic.cread())
+            await bic.shutdown()
+    """
 
-def command_line_argument(bic):
+    def __init__(self,can_chan_id='can0' ,can_adr=CAN_ADR,tmo=0.5,can_if=CAN_INTERFACE):
+        global asyncio
+        if asyncio is None:
+            import asyncio
+        self.can_chan = None
+        self.can_chan_id = can_chan_id
+        self.can_if = can_if
+        self.can_adr = can_adr
+        self.can_adr_rsp = can_adr & CAN_ADR_RSP_MASK # response id of the device
+        self.tmo = tmo # default timeout of a request [s]
+        self.write_cnt = 0 # eeprom write counter
+        self.d_wait = {} # cmd -> deque of futures waiting for a reply
+        self.d_can_stat = {'rxTmo':0,'rxStale':0,'rxDrop':0} # same keys as CBic
+        self.reader = None
+        self.notifier = None
+        self.task_rx = None
+
+    # open the bus and start the receive task, call it inside the running loop
+    async def start(self):
+        can_import()
+        can_filters = [{'can_id': self.can_adr_rsp, 'can_mask': 0x1FFFFFFF, 'extended': True}]
+        self.can_chan = can.interface.Bus(channel = self.can_chan_id, interface = self.can_if, can_filters = can_filters)
+        self.reader = can.AsyncBufferedReader()
+        self.notifier = can.Notifier(self.can_chan,[self.reader],loop=asyncio.get_running_loop())
+        self.task_rx = asyncio.create_task(self._rx_loop())
+
+    async def shutdown(self):
+        if self.task_rx is not None:
+            self.task_rx.cancel()
+            try:
+                await self.task_rx
+            except asyncio.CancelledError:
+                pass
+            self.task_rx = None
+        if self.notifier is not None:
+            self.notifier.stop()
+            self.notifier = None
+        if self.can_chan is not None:
+            self.can_chan.shutdown()
+            self.can_chan = None
+
+    # dispatch the received replies to the waiting requests
+    async def _rx_loop(self):
+        while True:
+            msgr = await self.reader.get_message()
+            data = msgr.data
+            if msgr.arbitration_id == self.can_adr_rsp and len(data) >= 2:
+                q = self.d_wait.get(can_frame_cmd(data))
+                if q:
+                    q.popleft().set_result(data)
+                    continue
+                self.d_can_stat['rxStale'] += 1 # nobody is waiting (late reply)
+            else:
+                self.d_can_stat['rxDrop'] += 1
+
+    def can_send_msg(self,lst_data):
+        msg = can.Message(arbitration_id=self.can_adr, data=lst_data, is_extended_id=True)
+        try:
+            self.can_chan.send(msg)
+        except can.CanError:
+            raise RuntimeError("can't send can message")
+
+    """ send the read request and wait for the reply
+        @param dec reply decoder, None: decoder of the command (CBic.d_cmd_dec)
+        @return decoded value, default on timeout or invalid reply
+    """
+    async def read(self,cmd :int,tmo=None,dec=None,default=None):
+        if dec is None:
+            dec = CBic.d_cmd_dec.get(cmd,dec_word)
+        fut = asyncio.get_running_loop().create_future()
+        q = self.d_wait.setdefault(cmd,deque())
+        q.append(fut)
+        try:
+            self.can_send_msg(can_frame_read(cmd))
+            data = await asyncio.wait_for(fut,self.tmo if tmo is None else tmo)
+            return dec(data)
+        except asyncio.TimeoutError:
+            self.d_can_stat['rxTmo'] += 1
+            return default
+        except (IndexError,struct.error,UnicodeDecodeError):
+            return default
+        finally:
+            if fut in q:
+                q.remove(fut)
+
+    # @return dict cmd -> decoded value, all requests are running concurrently
+    async def read_many(self,lst_cmd,tmo=None):
+        lst_cmd = list(dict.fromkeys(lst_cmd))
+        lst_val = await asyncio.gather(*[self.read(cmd,tmo) for cmd in lst_cmd])
+        return dict(zip(lst_cmd,lst_val))
+
+    """ write a value, same sequence as CBic.can_send_receive_word
+        - skip the write if the running value is equal (force is False)
+        - raise exception if given and received value are not equal
+        @param size 1:byte 2:word
+    """
+    async def write(self,cmd :int,val :int,size=2,force=False,tmo=None):
+        val = int(val)
+        if force is False:
+            vr = await self.read(cmd,tmo)
+            if vr == val:
+                return True
+
+        self.can_send_msg(can_frame_write(cmd,val,size))
+        if cmd in CBic.s_cmd_eeprom:
+            self.write_cnt += 1
+
+        vr = await self.read(cmd,tmo)
+        if vr != val:
+            raise RuntimeError("can't set value command:{} vr:{} val:{}".format(hex(cmd),vr,val))
+        return True
+
+    async def operation(self,val): #0=off, 1=on
+        self.can_send_msg(can_frame_write(CBic.e_cmd_OPERATION,val & 0x01,1))
+        return await self.operation_read()
+
+    async def operation_read(self):
+        return await self.read(CBic.e_cmd_OPERATION)
+
+    async def vread(self):
+        return await self.read(CBic.e_cmd_READ_VOUT)
+
+    async def cread(self):
+        return await self.read(CBic.e_cmd_READ_IOUT)
+
+    async def acvread(self):
+        return await self.read(CBic.e_cmd_READ_VIN)
+
+    async def tempread(self):
+        return await self.read(CBic.e_cmd_READ_TEMPERATURE_1,default=-278 * 10)
+
+    async def charge_current(self,rw,val=0):
+        if rw==CBic.e_cmd_read:
+            return await self.read(CBic.e_cmd_IOUT_SET)
+        await self.write(CBic.e_cmd_IOUT_SET,val)
+        return int(val)
+
+    async def discharge_current(self,rw,val=0):
+        if rw==CBic.e_cmd_read:
+            return await self.read(CBic.e_cmd_REVERSE_IOUT_SET)
+        await self.write(CBic.e_cmd_REVERSE_IOUT_SET,val)
+        return int(val)
+
+    async def BIC_chargemode(self,val): #0=charge, 1=discharge
+        await self.write(CBic.e_cmd_DIRECTION_CTRL,val,1)
+        return int(val)
+
+    async def BIC_chargemode_read(self):
+        return await self.read(CBic.e_cmd_DIRECTION_CTRL)
+
+
+#########################################
+# resident server
+class CBicServer(socketserver.ThreadingMixIn,socketserver.UnixStreamServer):
+    """ keeps one CBic open and serves line-delimited json requests on a unix socket
+        - {"argv":["ccset","1200"]} -> {"ret":0,"out":""} command line verb, same output and exit code
+        - {"read":["READ_VOUT","READ_IOUT"]} -> {"ret":0,"val":{"READ_VOUT":2650,...}} pipelined read
+        - one request at a time on the device, each connection may send several requests
+        - a stale socket file is removed, raise OSError EADDRINUSE if a server answers on it
+    """
+    daemon_threads = True
+
+    class Handler(socketserver.StreamRequestHandler):
+        def handle(self):
+            for line in self.rfile:
+                try:
+                    d_req = json.loads(line)
+                    d_rsp = self.server.request(d_req)
+                except ValueError as e:
+                    d_rsp = {'ret':1,'err':'invalid request:' + str(e)}
+                self.wfile.write((json.dumps(d_rsp) + '\n').encode())
+
+    def __init__(self,bic,fname=SERVE_SOCKET):
+        self.bic = bic
+        self.fname = fname
+        self.lock = threading.Lock()
+        self.d_cmd = {name:cmd for cmd,name in CBic.d_cmd_name.items()} # name -> cmd
+        if os.path.exists(fname):
+            with socket.socket(socket.AF_UNIX,socket.SOCK_STREAM) as sock:
+                try:
+                    sock.connect(fname)
+                except ConnectionRefusedError:
+                    os.remove(fname) # stale socket of a former server
+                else:
+                    raise OSError(errno.EADDRINUSE,"server is already running",fname)
+        super().__init__(fname,CBicServer.Handler)
+
+    def request(self,d_req :dict):
+        with self.lock:
+            if 'argv' in d_req:
+                if len(d_req['argv']) == 0 or d_req['argv'][0] in ['watch','serve']:
+                    return {'ret':1,'err':'no server command'}
+                out = io.StringIO()
+                persist = self.bic.persist # the command line exits on a read timeout, the json reads raise
+                with contextlib.redirect_stdout(out):
+                    try:
+                        ret = command_line_argument(self.bic,[sys.argv[0]] + [str(v) for v in d_req['argv']])
+                    except SystemExit as e:
+                        ret = e.code # read timeout
+                    except Exception as e:
+                        print(e)
+                        ret = 1
+                    finally:
+                        self.bic.persist = persist
+                return {'ret':ret,'out':out.getvalue()}
+            if 'read' in d_req:
+                try:
+                    lst_cmd = [self.d_cmd[name] for name in d_req['read']]
+                except KeyError as e:
+                    return {'ret':1,'err':'unknown register:' + str(e)}
+                try:
+                    d_val = self.bic.read_many(lst_cmd)
+                    ret = 0
+                except CCanTimeoutError as e:
+                    d_val = e.d_val
+                    ret = 2
+                return {'ret':ret,'val':{CBic.d_cmd_name[cmd]:val for cmd,val in d_val.items()}}
+        return {'ret':1,'err':'unknown request'}
+
+    def server_close(self):
+        super().server_close()
+        if os.path.exists(self.fname):
+            os.remove(self.fname)
+
+# command line read verb -> registers of the watch command
+d_watch_verb = {
+    'outputread':   [CBic.e_cmd_OPERATION],
+    'cvread':       [CBic.e_cmd_VOUT_SET],
+    'ccread':       [CBic.e_cmd_IOUT_SET],
+    'dvread':       [CBic.e_cmd_REVERSE_VOUT_SET],
+    'dcread':       [CBic.e_cmd_REVERSE_IOUT_SET],
+    'vread':        [CBic.e_cmd_READ_VOUT],
+    'cread':        [CBic.e_cmd_READ_IOUT],
+    'acvread':      [CBic.e_cmd_READ_VIN],
+    'dirread':      [CBic.e_cmd_DIRECTION_CTRL],
+    'tempread':     [CBic.e_cmd_READ_TEMPERATURE_1],
+    'fanread':      [CBic.e_cmd_READ_FAN1,CBic.e_cmd_READ_FAN2],
+    'statusread':   [CBic.e_cmd_SYSTEM_STATUS],
+    'faultread':    [CBic.e_cmd_FAULT_STATUS],
+}
+
+""" sample registers at a fixed rate with one pipelined read per sample, until ctrl-c or count
+    - one line per sample: {"t":monotonic,"ts":wall time,"<reg>":value,...,"tmo":[regs without reply]}
+    @param lst_arg watch --regs vread,cread,READ_VIN [--hz 10] [--json] [--out file] [--count n]
+    @return exit code
+"""
+def cli_watch(bic,lst_arg):
+    import argparse
+    parser = argparse.ArgumentParser(prog=sys.argv[0] + ' watch')
+    parser.add_argument('--regs',required=True,help='comma separated read verbs or register names')
+    parser.add_argument('--hz',type=float,default=1.0,help='samples per second')
+    parser.add_argument('--json',action='store_true',help='ndjson output')
+    parser.add_argument('--out',default=None,help='output file, default stdout')
+    parser.add_argument('--count',type=int,default=0,help='number of samples, 0: endless')
+    args = parser.parse_args(lst_arg)
+
+    d_reg_cmd = {name:cmd for cmd,name in CBic.d_cmd_name.items()}
+    lst_col = [] # (column name,cmd)
+    for reg in args.regs.split(','):
+        if reg in d_watch_verb:
+            lst_cmd = d_watch_verb[reg]
+            lst_col += [(reg if len(lst_cmd) == 1 else '{}{}'.format(reg,i + 1),cmd) for i,cmd in enumerate(lst_cmd)]
+        elif reg.upper() in d_reg_cmd:
+            lst_col.append((reg.upper(),d_reg_cmd[reg.upper()]))
+        else:
+            print("unknown register '{}'".format(reg))
+            return 1
+    lst_cmd = [cmd for name,cmd in lst_col]
+
+    bic.persist = True # a read timeout is a sample without value
+    f = sys.stdout if args.out is None else open(args.out,'a')
+    period = 1.0 / args.hz
+    cnt = 0
+    t_next = time.monotonic()
+    try:
+        while args.count <= 0 or cnt < args.count:
+            t = time.monotonic()
+            ts = time.time()
+            lst_tmo = []
+            try:
+                d_val = bic.read_many(lst_cmd,cached=False)
+            except CCanTimeoutError as e:
+                d_val = e.d_val
+                lst_tmo = [CBic.d_cmd_name.get(cmd,hex(cmd)) for cmd in e.lst_cmd]
+            if args.json:
+                d_out = {'t':round(t,4),'ts':round(ts,4)}
+                for name,cmd in lst_col:
+                    d_out[name] = d_val[cmd]
+                if len(lst_tmo) >0:
+                    d_out['tmo'] = lst_tmo
+                f.write(json.dumps(d_out) + '\n')
+            else:
+                f.write('{:.3f} '.format(ts) + ' '.join('{}:{}'.format(name,d_val[cmd]) for name,cmd in lst_col) + '\n')
+            f.flush()
+            cnt += 1
+
+            # fixed rate, skip the missed slots of a slow sample
+            t_next += period
+            t_now = time.monotonic()
+            if t_next < t_now:
+                t_next = t_now
+            time.sleep(t_next - t_now)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        if f is not sys.stdout:
+            f.close()
+    return 0
+
+""" forward the command line verb to a running server (CBicServer)
+    @return exit code, None if there is no server
+"""
+def cli_client(lst_arg,fname=SERVE_SOCKET):
+    if not os.path.exists(fname):
+        return None
+    try:
+        with socket.socket(socket.AF_UNIX,socket.SOCK_STREAM) as sock:
+            sock.connect(fname)
+            sock.sendall((json.dumps({'argv':lst_arg}) + '\n').encode())
+            with sock.makefile('r') as f:
+                d_rsp = json.loads(f.readline())
+    except (OSError,ValueError):
+        return None
+    print(d_rsp.get('out',''),end='')
+    return d_rsp.get('ret',1)
+
+""" read or write one register of the register map in its unit
+    @param lst_arg <name> [value]
+    @return exit code
+"""
+def cli_reg(bic,lst_arg):
+    d_reg_cmd = {reg.name:cmd for cmd,reg in CBic.d_reg.items()}
+    if len(lst_arg) == 0 or lst_arg[0].upper() not in d_reg_cmd:
+        print("unknown register '{}'".format(lst_arg[0] if len(lst_arg) > 0 else ''))
+        return 1
+    reg = CBic.d_reg[d_reg_cmd[lst_arg[0].upper()]]
+    if len(lst_arg) >= 2:
+        try:
+            bic.reg_write({reg.cmd:float(lst_arg[1])},force=True)
+        except ValueError as e:
+            print(str(e))
+            return 1
+    val = bic.reg_read([reg.cmd],cached=False)[reg.cmd]
+    print("{} {}{}".format(reg.name,val,reg.unit))
+    return 0
+
+def command_line_argument(bic,argv=None):
 
     def pp(str_out : str):
         print(str(str_out))
 
-    if len (sys.argv) == 1:
+    if argv is None:
+        argv = sys.argv
+    error = 0
+
+    if len (argv) == 1:
         print ("")
         print ("Error: First command line argument missing.")
         bic22_commands()
         error = 1
-        return
+        return error
 
     bic.persist = False
 
-    if   sys.argv[1] in ['on']:        bic.operation(1)
-    elif sys.argv[1] in ['off']:       bic.operation(0)
-    elif sys.argv[1] in ['outputread']:pp(bic.operation_read())
-    elif sys.argv[1] in ['cvread']:    pp(bic.charge_voltage(CBic.e_cmd_read,None))
-    elif sys.argv[1] in ['cvset']:     bic.charge_voltage(CBic.e_cmd_write,sys.argv[2])
-    elif sys.argv[1] in ['ccread']:    pp(bic.charge_current(CBic.e_cmd_read))
-    elif sys.argv[1] in ['ccset']:     bic.charge_current(CBic.e_cmd_write,sys.argv[2])
-    elif sys.argv[1] in ['dvread']:    pp(bic.discharge_voltage(CBic.e_cmd_read))
-    elif sys.argv[1] in ['dvset']:     bic.discharge_voltage(CBic.e_cmd_write,sys.argv[2])
-    elif sys.argv[1] in ['dcread']:    pp(bic.discharge_current(CBic.e_cmd_read))
-    elif sys.argv[1] in ['dcset']:     bic.discharge_current(CBic.e_cmd_write,sys.argv[2])
-    elif sys.argv[1] in ['vread']:     pp(bic.vread())
-    elif sys.argv[1] in ['cread']:     pp(bic.cread())
-    elif sys.argv[1] in ['acvread']:   pp(bic.acvread())
-    elif sys.argv[1] in ['charge']:    bic.BIC_chargemode(CBic.e_charge_mode_charge)
-    elif sys.argv[1] in ['discharge']: bic.BIC_chargemode(CBic.e_charge_mode_discharge)
-    elif sys.argv[1] in ['dirread']:   pp(bic.BIC_chargemode_read())
-    elif sys.argv[1] in ['tempread']:  pp(bic.tempread())
-    elif sys.argv[1] in ['fanread']:   bic.fanread()
-    elif sys.argv[1] in ['typeread']:  pp(bic.typeread())
-    elif sys.argv[1] in ['dump']:      bic.dump()
-    elif sys.argv[1] in ['statusread']:bic.statusread()
-    elif sys.argv[1] in ['faultread']: bic.faultread()
-    elif sys.argv[1] in ['can_up']:    CBic.can_up()
-    elif sys.argv[1] in ['can_down']:  CBic.can_down()
-    elif sys.argv[1] in ['init_mode']: bic.init_mode()
-    elif sys.argv[1] in ['NPB_chargemode']: bic.NPB_chargemode(int(sys.argv[2]))
+    if   argv[1] in ['on']:        bic.operation(1)
+    elif argv[1] in ['off']:       bic.operation(0)
+    elif argv[1] in ['outputread']:pp(bic.operation_read())
+    elif argv[1] in ['cvread']:    pp(bic.charge_voltage(CBic.e_cmd_read,None))
+    elif argv[1] in ['cvset']:     bic.charge_voltage(CBic.e_cmd_write,argv[2])
+    elif argv[1] in ['ccread']:    pp(bic.charge_current(CBic.e_cmd_read))
+    elif argv[1] in ['ccset']:     bic.charge_current(CBic.e_cmd_write,argv[2])
+    elif argv[1] in ['dvread']:    pp(bic.discharge_voltage(CBic.e_cmd_read))
+    elif argv[1] in ['dvset']:     bic.discharge_voltage(CBic.e_cmd_write,argv[2])
+    elif argv[1] in ['dcread']:    pp(bic.discharge_current(CBic.e_cmd_read))
+    elif argv[1] in ['dcset']:     bic.discharge_current(CBic.e_cmd_write,argv[2])
+    elif argv[1] in ['vread']:     pp(bic.vread())
+    elif argv[1] in ['cread']:     pp(bic.cread())
+    elif argv[1] in ['acvread']:   pp(bic.acvread())
+    elif argv[1] in ['charge']:    bic.BIC_chargemode(CBic.e_charge_mode_charge)
+    elif argv[1] in ['discharge']: bic.BIC_chargemode(CBic.e_charge_mode_discharge)
+    elif argv[1] in ['dirread']:   pp(bic.BIC_chargemode_read())
+    elif argv[1] in ['tempread']:  pp(bic.tempread())
+    elif argv[1] in ['fanread']:   bic.fanread()
+    elif argv[1] in ['typeread']:  pp(bic.typeread())
+    elif argv[1] in ['dump']:      bic.dump()
+    elif argv[1] in ['statusread']:bic.statusread()
+    elif argv[1] in ['faultread']: bic.faultread()
+    elif argv[1] in ['can_up']:    CBic.can_up()
+    elif argv[1] in ['can_down']:  CBic.can_down()
+    elif argv[1] in ['init_mode']: bic.init_mode()
+    elif argv[1] in ['scan']:
+        lst_dev = bic.scan_bus()
+        for dev in lst_dev:
+            print('{} id:{} adr:{} model:{} firmRev:{} latency:{}[ms]'.format(dev['type'],dev['devId'],hex(dev['canAdr']),dev['modelName'],dev['firmRev'],dev['latencyMs']))
+        if len(lst_dev) == 0:
+            print('no device found')
+    elif argv[1] in ['watch']:     error = cli_watch(bic,argv[2:])
+    elif argv[1] in ['regs']:
+        for reg in CBic.d_reg.values():
+            pp(reg)
+    elif argv[1] in ['reg']:       error = cli_reg(bic,argv[2:])
+    elif argv[1] in ['NPB_chargemode']: bic.NPB_chargemode(int(argv[2]),int(argv[3]) if len(argv) >= 4 else 0xFF)
     else:
         print("")
-        print("Unknown first argument '" + sys.argv[1] + "'")
+        print("Unknown first argument '" + argv[1] + "'")
         bic22_commands()
         error = 1
-        return
+    return error
 
 #### Main
 if __name__ == "__main__":
+    d_can = {} # default can0 socketcan
     if USE_RS232_CAN == 1:
         if sys.argv[1] in ['can_up']:
             CBic.can_up_serial()
             sys.exit(0)
+    elif USE_RS232_CAN == 2:
+        d_can = {'can_chan_id':CAN_DEVICE,'can_if':'native-slcan'}
+        if sys.argv[1] in ['can_up','can_down']:
+            print("serial can device {} is used directly, nothing to do".format(CAN_DEVICE))
+            sys.exit(0)
 
-    bic = CBic()
-    command_line_argument(bic)
+    if len(sys.argv) >= 2 and sys.argv[1] == 'serve':
+        bic = CBic(rx_thread=True,**d_can)
+        try:
+            server = CBicServer(bic,sys.argv[2] if len(sys.argv) >= 3 else SERVE_SOCKET)
+        except OSError as e:
+            print(e)
+            bic.shutdown()
+            sys.exit(1)
+        print("cbic2200 {} serving on {}".format(VER,server.fname))
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        server.server_close()
+        bic.shutdown()
+        sys.exit(0)
+
+    if len(sys.argv) >= 2 and sys.argv[1] not in ['can_up','can_down','watch']:
+        ret = cli_client(sys.argv[1:])
+        if ret is not None:
+            sys.exit(ret)
+
+    bic = CBic(**d_can)
+    error = command_line_argument(bic)
 
     if USE_RS232_CAN == 1:
         #shutdown CAN Bus
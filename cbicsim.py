@@ -0,0 +1,191 @@
+#!/usr/bin/env python3
+VER_CBICSIM = '0.1'
+
+import can
+import sys
+import time
+import random
+import struct
+import threading
+
+from cbic2200 import CBic,CAN_ADR,CAN_ADR_RSP_MASK,can_frame_cmd
+
+"""
+ - simulated Mean Well BIC-2200 for a python-can virtual or vcan channel
+   hamstie fst:17.10.2026 lst:17.10.2026
+   + answers the commands used by CBic, register state, eeprom write counter
+   + injectable latency, dropped replies and fault bits
+ usage:
+   ./cbicsim.py vcan0 socketcan 0 1    # two devices on vcan0 (other processes can use it)
+   ./cbicsim.py bench                  # round trip and poll cycle benchmark on a virtual bus
+"""
+class CBicSim(can.Listener):
+
+	# model name, firmware and manufacture date of the simulated device
+	MODEL_NAME = b'BIC-2200-24-CAN '
+	FW_REVISION = 0x0d0e
+	MFR_DATE = b'240401'
+
+	def __init__(self,bus,dev_id=0):
+		self.bus = bus
+		self.dev_id = dev_id
+		self.can_adr = CAN_ADR + dev_id
+		self.can_adr_rsp = self.can_adr & CAN_ADR_RSP_MASK
+
+		self.latency_sec = 0.0 # reply latency [s]
+		self.jitter_sec = 0.0 # random additional latency [0..jitter] [s]
+		self.drop_rate = 0.0 # [0..1.0] probability of a dropped reply
+		self.online = True # False: no replies (powered off)
+
+		self.cnt_rx = 0 # received requests
+		self.cnt_tx = 0 # sent replies
+		self.cnt_drop = 0 # dropped replies
+		self.d_eeprom_cnt = {} # cmd -> eeprom write counter
+
+		# register state, word values like the real device
+		self.d_reg = {}
+		self.d_reg[CBic.e_cmd_OPERATION] = 1
+		self.d_reg[CBic.e_cmd_VOUT_SET] = 2750
+		self.d_reg[CBic.e_cmd_IOUT_SET] = 90
+		self.d_reg[CBic.e_cmd_FAULT_STATUS] = 0
+		self.d_reg[CBic.e_cmd_READ_VIN] = 2300 # 230.0[V]
+		self.d_reg[CBic.e_cmd_READ_TEMPERATURE_1] = 350 # 35.0[C]
+		self.d_reg[CBic.e_cmd_READ_FAN1] = 2800
+		self.d_reg[CBic.e_cmd_READ_FAN2] = 2900
+		self.d_reg[CBic.e_cmd_DIRECTION_CTRL] = CBic.e_charge_mode_charge
+		self.d_reg[CBic.e_cmd_REVERSE_VOUT_SET] = 2520
+		self.d_reg[CBic.e_cmd_REVERSE_IOUT_SET] = 90
+		self.d_reg[CBic.e_cmd_FW_REVISION] = CBicSim.FW_REVISION
+		self.d_reg[CBic.e_cmd_SYSTEM_STATUS] = 0x0016 # dc ok, pfc ok, not in init
+		self.d_reg[CBic.e_cmd_SYSTEM_CONFIG] = 0x0401 # can control, eeprom write disabled
+		self.d_reg[CBic.e_cmd_BIDIRECTIONAL_CONFIG] = 0x0001
+		self.d_reg[CBic.e_cmd_CURVE_CONFIG] = 0x0000
+		self.bat_volt100 = 2600 # open circuit voltage of the battery [V*100]
+
+		self.d_char = {} # ascii registers, 6 chars
+		self.d_char[CBic.e_cmd_MFR_MODEL_B0B5] = CBicSim.MODEL_NAME[0:6]
+		self.d_char[CBic.e_cmd_MFR_MODEL_B6B11] = CBicSim.MODEL_NAME[6:12]
+		self.d_char[CBic.e_cmd_MFR_DATE] = CBicSim.MFR_DATE
+
+	# set or clear fault status bits (CBic.fault_decode)
+	def fault_set(self,bits :int):
+		self.d_reg[CBic.e_cmd_FAULT_STATUS] = bits & 0xffff
+
+	# @return signed dc current [A*100] of the running direction
+	def iout_get(self):
+		if self.d_reg[CBic.e_cmd_OPERATION] == 0:
+			return 0
+		if self.d_reg[CBic.e_cmd_DIRECTION_CTRL] == CBic.e_charge_mode_charge:
+			return self.d_reg[CBic.e_cmd_IOUT_SET]
+		return -self.d_reg[CBic.e_cmd_REVERSE_IOUT_SET]
+
+	# @return reply data of a read request, None for unknown commands
+	def reply_get(self,cmd :int):
+		if cmd in self.d_char:
+			return struct.pack('<H',cmd) + self.d_char[cmd]
+		if cmd == CBic.e_cmd_READ_IOUT:
+			return struct.pack('<Hh',cmd,self.iout_get())
+		if cmd == CBic.e_cmd_READ_VOUT:
+			return struct.pack('<HH',cmd,self.bat_volt100 + self.iout_get() // 100)
+		if cmd in self.d_reg and CBic.d_reg[cmd].width == 1:
+			return struct.pack('<HB',cmd,self.d_reg[cmd])
+		if cmd in self.d_reg:
+			return struct.pack('<HH',cmd,self.d_reg[cmd])
+		return None
+
+	def reply_send(self,data):
+		self.cnt_tx += 1
+		self.bus.send(can.Message(arbitration_id=self.can_adr_rsp,data=data,is_extended_id=True))
+
+	def on_message_received(self,msg):
+		if msg.arbitration_id != self.can_adr or msg.is_error_frame or len(msg.data) < 2:
+			return
+		self.cnt_rx += 1
+		if self.online is False:
+			return
+
+		cmd = can_frame_cmd(msg.data)
+		if len(msg.data) > 2:
+			# write, the device sends no reply
+			if cmd in self.d_reg and cmd not in (CBic.e_cmd_FAULT_STATUS,CBic.e_cmd_SYSTEM_STATUS):
+				self.d_reg[cmd] = int.from_bytes(msg.data[2:4],'little')
+				if cmd in CBic.s_cmd_eeprom:
+					self.d_eeprom_cnt[cmd] = self.d_eeprom_cnt.get(cmd,0) + 1
+			return
+
+		data = self.reply_get(cmd)
+		if data is None:
+			return
+		if self.drop_rate > 0 and random.random() < self.drop_rate:
+			self.cnt_drop += 1
+			return
+
+		latency = self.latency_sec
+		if self.jitter_sec > 0:
+			latency += random.uniform(0,self.jitter_sec)
+		if latency > 0:
+			threading.Timer(latency,self.reply_send,(data,)).start()
+		else:
+			self.reply_send(data)
+
+	def __str__(self):
+		return "sim dev:{} rx:{} tx:{} drop:{} eeprom:{}".format(self.dev_id,self.cnt_rx,self.cnt_tx,self.cnt_drop,
+			{CBic.d_cmd_name.get(k,hex(k)):v for k,v in self.d_eeprom_cnt.items()})
+
+	""" round trip and poll cycle benchmark on a python-can virtual bus
+		@param latency_sec simulated device latency [s]
+	"""
+	@staticmethod
+	def bench(loops=200,latency_sec=0.0):
+		bus_sim = can.interface.Bus(channel='bicsim',interface='virtual')
+		sim = CBicSim(bus_sim)
+		sim.latency_sec = latency_sec
+		notifier = can.Notifier(bus_sim,[sim],timeout=0.1)
+
+		bic = CBic('bicsim',CAN_ADR,rx_thread=True,can_if='virtual')
+		lst_cycle = [CBic.e_cmd_READ_TEMPERATURE_1,CBic.e_cmd_READ_FAN1,CBic.e_cmd_READ_FAN2,CBic.e_cmd_OPERATION,
+					CBic.e_cmd_READ_VOUT,CBic.e_cmd_READ_IOUT,CBic.e_cmd_READ_VIN,CBic.e_cmd_DIRECTION_CTRL]
+
+		def measure(name,func):
+			t_start = time.perf_counter()
+			for i in range(loops):
+				func()
+			t_ms = (time.perf_counter() - t_start) * 1000 / loops
+			print("bench {:<24} {:8.3f}[ms]".format(name,t_ms))
+
+		measure('read single',lambda: bic.can_read(CBic.e_cmd_READ_IOUT,cached=False))
+		measure('poll cycle sequential',lambda: [bic.can_read(cmd,cached=False) for cmd in lst_cycle])
+		measure('poll cycle read_many',lambda: bic.read_many(lst_cycle,cached=False))
+		measure('poll cycle cached',lambda: bic.read_many(lst_cycle))
+		print(str(sim))
+		print('can-stat:' + str(bic.can_stat_get()))
+
+		bic.shutdown()
+		notifier.stop()
+		bus_sim.shutdown()
+
+
+#### Main
+if __name__ == "__main__":
+	if len(sys.argv) >= 2 and sys.argv[1] == 'bench':
+		CBicSim.bench(latency_sec=float(sys.argv[2]) if len(sys.argv) >= 3 else 0.0)
+		sys.exit(0)
+
+	chan = sys.argv[1] if len(sys.argv) >= 2 else 'vcan0'
+	interface = sys.argv[2] if len(sys.argv) >= 3 else 'socketcan'
+	lst_dev_id = [int(v) for v in sys.argv[3:]] or [0]
+
+	bus = can.interface.Bus(channel=chan,interface=interface)
+	lst_sim = [CBicSim(bus,dev_id) for dev_id in lst_dev_id]
+	notifier = can.Notifier(bus,lst_sim,timeout=0.1)
+	print("bic sim {} running on {} ({}) dev:{}".format(VER_CBICSIM,chan,interface,lst_dev_id))
+	try:
+		while True:
+			time.sleep(10)
+			for sim in lst_sim:
+				print(str(sim))
+	except KeyboardInterrupt:
+		pass
+	notifier.stop()
+	bus.shutdown()
+	sys.exit(0)
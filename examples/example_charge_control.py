@@ -6,6 +6,8 @@ import sys
 import time
 import json
 import subprocess
+import socket
+import os
 import requests
 import datetime
 import configparser
@@ -37,6 +39,22 @@ lastchargetime = time.time()     # Startzeit zur Berechnung der Einspeiseverzög
 BICAPP = "../bic2200.py" # the original one
 BICAPP = "../cbic2200.py" # the new one from this fork
 
+BICSOCK = "/tmp/cbic2200.sock" # resident server: ../cbic2200.py serve &
+
+# run a command of BICAPP, use the resident server if it is running (no new process for each command)
+# @return output of the command
+def bic_run(lst_arg):
+    if os.path.exists(BICSOCK):
+        try:
+            with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+                sock.connect(BICSOCK)
+                sock.sendall((json.dumps({"argv": lst_arg}) + "\n").encode())
+                with sock.makefile("r") as f:
+                    return json.loads(f.readline()).get("out", "")
+        except (OSError, ValueError):
+            pass
+    return subprocess.run([BICAPP] + lst_arg, capture_output=True, text=True).stdout
+
 # Init CAN Bus
 p = subprocess.run([BICAPP , "can_up"])
 
@@ -56,8 +74,8 @@ if ChargeVoltage > SafeChargeVoltage:
 if DischargeVoltage < SafeDischargeVoltage:
     DischargeVoltage = SafeDischargeVoltage
     
-p = subprocess.run([BICAPP, "cvset", str(ChargeVoltage)])
-p = subprocess.run([BICAPP, "dvset", str(DischargeVoltage)])
+p = bic_run(["cvset", str(ChargeVoltage)])
+p = bic_run(["dvset", str(DischargeVoltage)])
 
 def control_power():
 
@@ -97,10 +115,8 @@ def control_power():
         Power = 20000
 
     #-------------------------------------------------------------- Read BIC-2200
-    volt = subprocess.run([BICAPP, "vread"], capture_output=True, text=True)
-    volt_now = float(volt.stdout)
-    amp = subprocess.run([BICAPP, "cread"], capture_output=True, text=True)
-    amp_now = float(amp.stdout)
+    volt_now = float(bic_run(["vread"]))
+    amp_now = float(bic_run(["cread"]))
     print ("BIC-2200 Volt: ", volt_now/100," Ampere: ", amp_now/100)
     
     #-------------------------------------------------------------- Charge / Discharge
@@ -119,8 +135,8 @@ def control_power():
             IntCurrent = MaxChargeCurrent
             
 
-        p = subprocess.run([BICAPP , "charge"])
-        c = subprocess.run([BICAPP , "ccset" ,  str(IntCurrent)]) 
+        p = bic_run(["charge"])
+        c = bic_run(["ccset", str(IntCurrent)])
 
     if Current < -10:
         dischargetime = time.time()
@@ -140,8 +156,8 @@ def control_power():
             OutCurrent = 0
 
 
-        p = subprocess.run([BICAPP , "discharge"])
-        c = subprocess.run([BICAPP , "dcset", str(OutCurrent)]) 
+        p = bic_run(["discharge"])
+        c = bic_run(["dcset", str(OutCurrent)])
 
              
 
@@ -0,0 +1,41 @@
+#!/usr/bin/env python3
+"""
+ - shared setup of the tests: simulated BIC-2200 devices (cbicsim.CBicSim) on a python-can virtual bus
+   + an own virtual channel for each test
+   + optional CBic with the receive thread on the channel
+"""
+import os
+import sys
+import unittest
+
+sys.path.insert(0,os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import can
+from cbic2200 import CBic,CAN_ADR
+from cbicsim import CBicSim
+
+class CSimCase(unittest.TestCase):
+	""" test case with the simulated devices, self.sim is the first one
+		- sim_cls, lst_dev_id: class and device ids of the simulated devices
+		- latency_sec: reply latency of the simulated devices [s]
+		- bic_new True: self.bic is a CBic with the receive thread on the channel, False: self.bic is None
+	"""
+	sim_cls = CBicSim
+	lst_dev_id = (0,)
+	latency_sec = 0.0
+	bic_new = True
+
+	def setUp(self):
+		self.chan = self.id()
+		self.bus_sim = can.interface.Bus(channel=self.chan,interface='virtual')
+		self.lst_sim = [self.sim_cls(self.bus_sim,dev_id) for dev_id in self.lst_dev_id]
+		for sim in self.lst_sim:
+			sim.latency_sec = self.latency_sec
+		self.sim = self.lst_sim[0]
+		self.notifier = can.Notifier(self.bus_sim,self.lst_sim,timeout=0.1)
+		self.addCleanup(self.bus_sim.shutdown)
+		self.addCleanup(self.notifier.stop)
+		self.bic = None
+		if self.bic_new is True:
+			self.bic = CBic(self.chan,CAN_ADR,rx_thread=True,can_if='virtual')
+			self.addCleanup(self.bic.shutdown)
@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+"""
+ - AsyncCBic against the simulated BIC-2200 (cbicsim.CBicSim) on a python-can virtual bus
+   + concurrent reads share one round trip
+   + same values as the sync CBic
+"""
+import os
+import sys
+import time
+import asyncio
+import unittest
+
+sys.path.insert(0,os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from simcase import CSimCase
+from cbic2200 import CBic,AsyncCBic,CAN_ADR
+
+LATENCY_SEC = 0.1 # simulated reply latency [s]
+
+class TestAsyncCBic(CSimCase):
+	latency_sec = LATENCY_SEC
+	bic_new = False
+
+	def test_concurrent_reads_one_round_trip(self):
+		lst_cmd = [CBic.e_cmd_READ_VOUT,CBic.e_cmd_READ_IOUT,CBic.e_cmd_READ_VIN,CBic.e_cmd_READ_TEMPERATURE_1,
+					CBic.e_cmd_READ_FAN1,CBic.e_cmd_READ_FAN2,CBic.e_cmd_OPERATION,CBic.e_cmd_DIRECTION_CTRL]
+
+		async def run():
+			bic = AsyncCBic(self.chan,CAN_ADR,tmo=1.0,can_if='virtual')
+			await bic.start()
+			try:
+				t_start = time.monotonic()
+				d_val = await bic.read_many(lst_cmd)
+				return d_val,time.monotonic() - t_start
+			finally:
+				await bic.shutdown()
+
+		d_val,t_sec = asyncio.run(run())
+		self.assertEqual(len(d_val),len(lst_cmd))
+		self.assertNotIn(None,d_val.values())
+		self.assertEqual(self.sim.cnt_rx,len(lst_cmd))
+		# sequential reads would need len(lst_cmd) round trips
+		self.assertLess(t_sec,LATENCY_SEC * 2)
+
+	def test_same_values_as_cbic(self):
+		lst_cmd = [CBic.e_cmd_VOUT_SET,CBic.e_cmd_IOUT_SET,CBic.e_cmd_READ_IOUT,CBic.e_cmd_OPERATION,CBic.e_cmd_MFR_DATE]
+
+		async def run():
+			bic = AsyncCBic(self.chan,CAN_ADR,tmo=1.0,can_if='virtual')
+			await bic.start()
+			try:
+				await bic.charge_current(CBic.e_cmd_write,1200)
+				return await bic.read_many(lst_cmd)
+			finally:
+				await bic.shutdown()
+
+		d_async = asyncio.run(run())
+		self.assertEqual(self.sim.d_reg[CBic.e_cmd_IOUT_SET],1200)
+
+		bic = CBic(self.chan,CAN_ADR,can_if='virtual')
+		try:
+			d_sync = bic.read_many(lst_cmd,tmo=1.0,cached=False)
+		finally:
+			bic.shutdown()
+		self.assertEqual(d_async,d_sync)
+
+	def test_timeout_default(self):
+		self.sim.online = False
+
+		async def run():
+			bic = AsyncCBic(self.chan,CAN_ADR,tmo=0.05,can_if='virtual')
+			await bic.start()
+			try:
+				return await bic.read(CBic.e_cmd_READ_VOUT,default=-1),bic.d_can_stat['rxTmo']
+			finally:
+				await bic.shutdown()
+
+		self.assertEqual(asyncio.run(run()),(-1,1))
+
+
+if __name__ == '__main__':
+	unittest.main()
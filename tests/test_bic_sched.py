@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+"""
+ - priority scheduler of the device requests (CBicSched)
+   + a setpoint is not queued behind telemetry reads, fifo within a class
+   + jobs with the same key are coalesced, reads after their deadline are dropped
+   + an exception of a job is passed to its Future
+   + stop runs the pending jobs, later jobs are cancelled
+"""
+import os
+import sys
+import threading
+import time
+import unittest
+
+sys.path.insert(0,os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from cbic2200 import CBicSched
+
+class TestBicSched(unittest.TestCase):
+
+	def setUp(self):
+		self.sched = CBicSched(None)
+		self.addCleanup(self.sched.stop,1)
+		self.lst_run = []
+		self.evt = threading.Event()
+
+	def job(self,name):
+		self.lst_run.append(name)
+		return name
+
+	# the worker waits in a job until release()
+	def block(self):
+		self.sched.submit(CBicSched.e_prio_safety,self.evt.wait,5)
+		while self.sched.pending() > 0:
+			time.sleep(0.001)
+
+	def release(self):
+		self.evt.set()
+		self.sched.call(CBicSched.e_prio_diag,lambda: None,tmo=5)
+
+	def test_priority(self):
+		self.block()
+		self.sched.submit(CBicSched.e_prio_slow,self.job,'temp')
+		self.sched.submit(CBicSched.e_prio_fast,self.job,'vout')
+		self.sched.submit(CBicSched.e_prio_fast,self.job,'iout')
+		fut = self.sched.submit(CBicSched.e_prio_setpoint,self.job,'iout_set')
+		self.release()
+		self.assertEqual(self.lst_run,['iout_set','vout','iout','temp'])
+		self.assertEqual(fut.result(),'iout_set')
+
+	def test_coalesce(self):
+		self.block()
+		fut_old = self.sched.submit(CBicSched.e_prio_setpoint,self.job,1000,key='iout_set')
+		self.sched.submit(CBicSched.e_prio_fast,self.job,'vout')
+		fut = self.sched.submit(CBicSched.e_prio_setpoint,self.job,1200,key='iout_set')
+		self.release()
+		self.assertTrue(fut_old.cancelled())
+		self.assertEqual(fut.result(),1200)
+		self.assertEqual(self.lst_run,[1200,'vout'])
+		self.assertEqual(self.sched.d_stat['coalesced'],1)
+
+	def test_deadline(self):
+		self.block()
+		fut = self.sched.submit(CBicSched.e_prio_fast,self.job,'vout',deadline_sec=0.01)
+		fut_set = self.sched.submit(CBicSched.e_prio_setpoint,self.job,'iout_set',deadline_sec=0.01) # no deadline for writes
+		time.sleep(0.05)
+		self.release()
+		self.assertTrue(fut.cancelled())
+		self.assertEqual(fut_set.result(),'iout_set')
+		self.assertEqual(self.sched.d_stat['drop'],1)
+
+	def test_exception(self):
+		fut = self.sched.submit(CBicSched.e_prio_fast,lambda: 1 // 0)
+		self.assertIsInstance(fut.exception(5),ZeroDivisionError)
+		with self.assertRaises(ZeroDivisionError):
+			self.sched.call(CBicSched.e_prio_fast,lambda: 1 // 0,tmo=5)
+		self.assertEqual(self.sched.d_stat['err'],2)
+		self.assertEqual(self.sched.call(CBicSched.e_prio_fast,self.job,'vout',tmo=5),'vout') # worker still alive
+
+	def test_stop(self):
+		self.block()
+		lst_fut = [self.sched.submit(CBicSched.e_prio_fast,self.job,n) for n in range(3)]
+		self.evt.set()
+		self.sched.stop(5)
+		self.assertFalse(self.sched.thread.is_alive())
+		self.assertEqual([fut.result(0) for fut in lst_fut],[0,1,2])
+		fut = self.sched.submit(CBicSched.e_prio_fast,self.job,'late')
+		self.assertTrue(fut.cancelled())
+		self.assertEqual(self.lst_run,[0,1,2])
+
+
+if __name__ == '__main__':
+	unittest.main()
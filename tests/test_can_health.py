@@ -0,0 +1,63 @@
+#!/usr/bin/env python3
+"""
+ - bus health (CCanHealth) from the socketcan error frames
+   + error warning/passive follow the controller, a received frame ends a bus-off only
+   + a bus-off without kernel restart: one restart of the controller, then a backoff
+"""
+import os
+import sys
+import unittest
+from unittest import mock
+
+sys.path.insert(0,os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import can
+from simcase import CSimCase
+from cbic2200 import CBic,CCanHealth
+
+# error frame of the controller state (CAN_ERR_CRTL) or a bus-off
+def err_frame(err :int,ctrl=0):
+	return can.Message(arbitration_id=err,is_error_frame=True,data=bytes([0,ctrl,0,0,0,0,0,0]))
+
+class TestCanHealth(unittest.TestCase):
+
+	def test_passive_on_rx(self):
+		health = CCanHealth()
+		health.on_err_frame(err_frame(CCanHealth.CAN_ERR_CRTL,CCanHealth.CAN_ERR_CRTL_PASSIVE))
+		seq,lst_evt = health.events_get()
+		health.on_rx() # error passive still receives frames
+		self.assertEqual(health.stat_get()['busState'],'passive')
+		self.assertEqual(health.events_get(seq)[1],[])
+		health.on_err_frame(err_frame(CCanHealth.CAN_ERR_CRTL,CCanHealth.CAN_ERR_CRTL_ACTIVE))
+		self.assertEqual(health.stat_get()['busState'],'active')
+
+	def test_bus_off_on_rx(self):
+		health = CCanHealth()
+		health.on_err_frame(err_frame(CCanHealth.CAN_ERR_BUSOFF))
+		self.assertEqual(health.stat_get()['busState'],'busOff')
+		health.on_rx()
+		self.assertEqual(health.stat_get()['busState'],'active')
+		self.assertIn('downSec',health.events_get()[1][-1])
+
+class TestCanRecover(CSimCase):
+
+	def test_recover_backoff(self):
+		bic = self.bic
+		bic.health.on_err_frame(err_frame(CCanHealth.CAN_ERR_BUSOFF))
+		bic.health.ts_down -= CCanHealth.RECOVER_SEC
+		with mock.patch.object(CBic,'can_restart') as restart:
+			self.assertTrue(bic.can_recover())
+			self.assertFalse(bic.can_recover()) # still off, backoff
+			self.assertEqual(restart.call_count,1)
+			bic.health.ts_recover -= CCanHealth.RECOVER_SEC
+			self.assertFalse(bic.health.recover_due()) # twice the interval
+			bic.health.ts_recover -= CCanHealth.RECOVER_SEC
+			self.assertTrue(bic.can_recover())
+			self.assertEqual(restart.call_count,2)
+			self.assertEqual(bic.health.recover_sec,CCanHealth.RECOVER_SEC * 4)
+		bic.health.on_err_frame(err_frame(CCanHealth.CAN_ERR_RESTARTED))
+		self.assertEqual(bic.health.recover_sec,CCanHealth.RECOVER_SEC)
+
+
+if __name__ == '__main__':
+	unittest.main()
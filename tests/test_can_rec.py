@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+"""
+ - can transaction recorder (CCanRec) and replay bus (CCanReplayBus), simulated BIC-2200 on a python-can virtual bus
+   + the replies are recorded with their receive time
+   + a replayed session returns the recorded values
+"""
+import os
+import sys
+import time
+import tempfile
+import unittest
+
+sys.path.insert(0,os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from simcase import CSimCase
+from cbic2200 import CBic,CCanRec,CCanReplayBus,CAN_ADR
+from cbicsim import CBicSim
+
+SLOW_SEC = 0.2 # reply latency of the slow register
+
+# device with one slow register
+class CBicSimSlow(CBicSim):
+	def reply_get(self,cmd :int):
+		if cmd == CBic.e_cmd_READ_VIN:
+			time.sleep(SLOW_SEC)
+		return super().reply_get(cmd)
+
+class TestCanRec(CSimCase):
+	sim_cls = CBicSimSlow
+	bic_new = False
+
+	def setUp(self):
+		super().setUp()
+		self.dir = tempfile.TemporaryDirectory()
+		self.fname = os.path.join(self.dir.name,'bic.rec')
+		self.lst_cmd = [CBic.e_cmd_READ_VOUT,CBic.e_cmd_READ_IOUT,CBic.e_cmd_READ_VIN]
+
+	def tearDown(self):
+		self.dir.cleanup()
+
+	def record(self,rx_thread):
+		bic = CBic(self.chan,CAN_ADR,rx_thread=rx_thread,can_if='virtual')
+		try:
+			bic.rec_start(self.fname)
+			d_val = bic.read_many(self.lst_cmd,tmo=1.0,cached=False)
+			bic.rec_stop()
+		finally:
+			bic.shutdown()
+		return d_val
+
+	def check_latency(self):
+		lst_rec = CCanRec.read(self.fname)
+		t_tx = max(t for t,e_dir,adr,data in lst_rec if e_dir == CCanRec.e_dir_tx)
+		d_lat = {CBic.d_cmd_name[data[0] | data[1] << 8]:t - t_tx for t,e_dir,adr,data in lst_rec if e_dir == CCanRec.e_dir_rx}
+		self.assertLess(d_lat['READ_VOUT'],SLOW_SEC / 2)
+		self.assertLess(d_lat['READ_IOUT'],SLOW_SEC / 2)
+		self.assertGreaterEqual(d_lat['READ_VIN'],SLOW_SEC)
+
+	def test_rx_time_direct(self):
+		self.record(False)
+		self.check_latency()
+
+	def test_rx_time_rx_thread(self):
+		self.record(True)
+		self.check_latency()
+
+	def test_replay(self):
+		d_val = self.record(True)
+		bic = CBic('replay',CAN_ADR,can_chan=CCanReplayBus(self.fname,speed=0))
+		try:
+			self.assertEqual(bic.read_many(self.lst_cmd,tmo=1.0,cached=False),d_val)
+		finally:
+			bic.shutdown()
+
+
+if __name__ == '__main__':
+	unittest.main()
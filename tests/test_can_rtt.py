@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+"""
+ - adaptive read timeout (CCanRtt) and the repeated read requests of CBic
+   + first sample, convergence of the smoothed round trip time, timeout limited to tmo_min..tmo_max
+   + a timeout doubles the timeout of the command
+   + requests without reply are repeated max. retry_max times, only if the device is alive
+"""
+import os
+import sys
+import unittest
+
+sys.path.insert(0,os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from simcase import CSimCase
+from cbic2200 import CBic,CCanRtt
+from cbicsim import CBicSim
+
+CMD = CBic.e_cmd_READ_VIN
+
+# device without reply to the next cnt_lost requests of CMD
+class CBicSimLost(CBicSim):
+	def __init__(self,bus,dev_id=0):
+		super().__init__(bus,dev_id)
+		self.cnt_lost = 0
+		self.cnt_req = 0 # requests of CMD
+
+	def reply_get(self,cmd :int):
+		if cmd == CMD:
+			self.cnt_req += 1
+			if self.cnt_lost > 0:
+				self.cnt_lost -= 1
+				return None
+		return super().reply_get(cmd)
+
+class TestCanRtt(unittest.TestCase):
+
+	def setUp(self):
+		self.rtt = CCanRtt(tmo_min=0.05,tmo_max=0.5)
+
+	def test_first_sample(self):
+		self.assertEqual(self.rtt.tmo_get(CMD),0.5) # unknown command
+		self.rtt.update(CMD,0.02)
+		srtt,rttvar,tmo = self.rtt.d_rtt[CMD]
+		self.assertEqual((srtt,rttvar),(0.02,0.01))
+		self.assertAlmostEqual(tmo,0.02 + 4 * 0.01)
+
+	def test_convergence(self):
+		self.rtt.tmo_min = 0.001
+		self.rtt.update(CMD,0.2)
+		for i in range(100):
+			self.rtt.update(CMD,0.01)
+		srtt,rttvar,tmo = self.rtt.d_rtt[CMD]
+		self.assertAlmostEqual(srtt,0.01,places=4)
+		self.assertLess(rttvar,0.001)
+		self.assertAlmostEqual(self.rtt.tmo_get(CMD),0.01,delta=0.003)
+
+	def test_clamp(self):
+		self.rtt.update(CMD,0.001)
+		self.assertEqual(self.rtt.tmo_get(CMD),0.05)
+		self.rtt.update(CBic.e_cmd_READ_VOUT,2.0)
+		self.assertEqual(self.rtt.tmo_get(CBic.e_cmd_READ_VOUT),0.5)
+
+	def test_backoff(self):
+		self.rtt.update(CMD,0.03) # timeout 0.09
+		self.rtt.backoff(CMD)
+		self.assertAlmostEqual(self.rtt.tmo_get(CMD),0.18)
+		for i in range(4):
+			self.rtt.backoff(CMD)
+		self.assertEqual(self.rtt.tmo_get(CMD),0.5)
+		self.rtt.backoff(CBic.e_cmd_READ_VOUT) # unknown command keeps tmo_max
+		self.assertEqual(self.rtt.tmo_get(CBic.e_cmd_READ_VOUT),0.5)
+
+class TestReadRetry(CSimCase):
+	sim_cls = CBicSimLost
+
+	def setUp(self):
+		super().setUp()
+		self.bic.tmo_set(0.02,0.05,retry_max=2)
+		self.bic.retry_jitter_sec = 0
+		self.bic.can_read_data([CMD],cached=False) # device is alive
+
+	# @return reply data, None without reply
+	def read(self):
+		self.sim.cnt_req = 0
+		return self.bic.can_read_data([CMD],cached=False)[CMD]
+
+	def test_retry(self):
+		data = self.sim.reply_get(CMD)
+		self.sim.cnt_lost = 2
+		self.assertEqual(self.read(),data)
+		self.assertEqual(self.sim.cnt_req,3)
+		self.assertEqual(self.bic.d_can_stat['txRetry'],2)
+		self.assertEqual(self.bic.stat.cmd_get(CMD).retry,2)
+		self.assertEqual(self.bic.stat.cmd_get(CMD).tmo,0)
+
+	def test_retry_max(self):
+		self.sim.cnt_lost = 5
+		self.assertIsNone(self.read())
+		self.assertEqual(self.sim.cnt_req,3) # request and retry_max repeats
+		self.assertEqual(self.bic.d_can_stat['txRetry'],2)
+		self.assertEqual(self.bic.stat.cmd_get(CMD).tmo,1)
+
+	def test_no_retry_offline(self):
+		self.bic.ts_rx_last -= self.bic.retry_alive_sec + 1 # no reply within retry_alive_sec
+		self.sim.cnt_lost = 1
+		self.assertIsNone(self.read())
+		self.assertEqual(self.sim.cnt_req,1)
+		self.assertEqual(self.bic.d_can_stat['txRetry'],0)
+
+
+if __name__ == '__main__':
+	unittest.main()
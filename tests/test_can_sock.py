@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+"""
+ - native AF_CAN backend (CCanSock, can interface 'native') with the simulated BIC-2200 on a vcan interface
+   + read burst and write, with and without the receive thread (CCanNotifier)
+   + frames of other ids are filtered by the kernel, kernel receive time stamp
+   + skipped without the vcan interface, e.g.:
+     ip link add dev vcan0 type vcan && ip link set up vcan0
+     VCAN=vcan1 selects another interface
+"""
+import os
+import sys
+import socket
+import time
+import unittest
+
+sys.path.insert(0,os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from cbic2200 import CBic,CCanSock,CCanNotifier,CCanFrame,CAN_ADR,CAN_ADR_RSP_MASK
+from cbicsim import CBicSim
+
+VCAN = os.environ.get('VCAN','vcan0')
+
+# @return True if the vcan interface is up
+def vcan_up():
+	if not hasattr(socket,'AF_CAN'):
+		return False
+	try:
+		with open('/sys/class/net/{}/operstate'.format(VCAN)) as f:
+			return f.read().strip() in ('up','unknown')
+	except OSError:
+		return False
+
+@unittest.skipUnless(vcan_up(),'vcan interface {} needed'.format(VCAN))
+class TestCanSock(unittest.TestCase):
+
+	def setUp(self):
+		self.bus_sim = CCanSock(VCAN)
+		self.sim = CBicSim(self.bus_sim)
+		self.notifier = CCanNotifier(self.bus_sim,[self.sim],timeout=0.1)
+		self.addCleanup(self.bus_sim.shutdown)
+		self.addCleanup(self.notifier.stop)
+
+	def check(self,rx_thread):
+		bic = CBic(VCAN,CAN_ADR,rx_thread=rx_thread,can_if='native')
+		try:
+			lst_cmd = [CBic.e_cmd_READ_VOUT,CBic.e_cmd_READ_IOUT,CBic.e_cmd_OPERATION,CBic.e_cmd_MFR_MODEL_B0B5]
+			d_val = bic.read_many(lst_cmd,tmo=1.0,cached=False)
+			self.assertEqual(d_val,{cmd:CBic.d_cmd_dec[cmd](self.sim.reply_get(cmd)) for cmd in lst_cmd})
+			self.assertEqual(bic.write_many({CBic.e_cmd_IOUT_SET:1111}),{CBic.e_cmd_IOUT_SET:True})
+			time.sleep(0.05)
+			self.assertEqual(self.sim.d_reg[CBic.e_cmd_IOUT_SET],1111)
+		finally:
+			bic.shutdown()
+
+	def test_direct(self):
+		self.check(False)
+
+	def test_rx_thread(self):
+		self.check(True)
+
+	def test_filter(self):
+		sock = CCanSock(VCAN,[{'can_id':CAN_ADR & CAN_ADR_RSP_MASK,'can_mask':0x1FFFFFFF,'extended':True}])
+		try:
+			self.bus_sim.send(CCanFrame(0x123,b'\xaa\xbb'))
+			self.bus_sim.send(CCanFrame(0x123,b'\xaa\xbb',is_extended_id=False))
+			self.bus_sim.send(CCanFrame(CAN_ADR & CAN_ADR_RSP_MASK,b'\x00\x00\x01'))
+			msg = sock.recv(1.0)
+			self.assertEqual((msg.arbitration_id,bytes(msg.data),msg.is_extended_id,msg.is_error_frame),
+							 (CAN_ADR & CAN_ADR_RSP_MASK,b'\x00\x00\x01',True,False))
+			self.assertAlmostEqual(msg.timestamp,time.time(),delta=1.0)
+			self.assertIsNone(sock.recv(0.05))
+		finally:
+			sock.shutdown()
+
+
+if __name__ == '__main__':
+	unittest.main()
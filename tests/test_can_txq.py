@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+"""
+ - bounded transmit queue (CCanTxQueue) on a bus that refuses the frames while it is off
+   + expired frames are dropped, the oldest frames are dropped if the queue is full
+   + pending frames are sent oldest first, a write replaces the pending write of the same register
+   + frames sent with a later flush are recorded (CCanRec) and counted (CCanStat) by CBic
+"""
+import os
+import sys
+import time
+import tempfile
+import unittest
+
+sys.path.insert(0,os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from cbic2200 import CBic,CCanTxQueue,CCanFrame,CCanRec,CAN_ADR
+
+# bus without ack: refuses all frames while off
+class CBusOff:
+	def __init__(self):
+		self.off = True
+		self.lst_sent = []
+
+	def send(self,msg,timeout=None):
+		if self.off is True:
+			raise OSError('no ack')
+		self.lst_sent.append(msg)
+
+	def recv(self,timeout=None):
+		time.sleep(timeout or 0)
+		return None
+
+	def set_filters(self,can_filters=None):
+		pass
+
+	def shutdown(self):
+		pass
+
+class TestCanTxQueue(unittest.TestCase):
+
+	def setUp(self):
+		self.bus = CBusOff()
+		self.txq = CCanTxQueue(self.bus)
+		self.lst_on_sent = []
+
+	def send(self,n :int,deadline=None,key=None):
+		msg = CCanFrame(CAN_ADR,bytes([n,0]))
+		return self.txq.send(msg,deadline or time.monotonic() + 60,key,self.lst_on_sent.append)
+
+	def sent(self):
+		return [msg.data[0] for msg in self.bus.lst_sent]
+
+	def test_order(self):
+		for n in range(3):
+			self.assertFalse(self.send(n))
+		self.assertEqual(self.txq.stat_get()['txQueued'],3)
+		self.bus.off = False
+		self.assertTrue(self.send(3))
+		self.assertEqual(self.sent(),[0,1,2,3])
+		self.assertEqual(self.lst_on_sent,self.bus.lst_sent)
+		self.assertEqual(self.txq.stat_get()['txQueued'],0)
+
+	def test_deadline(self):
+		self.send(0,time.monotonic() + 0.05)
+		self.send(1)
+		time.sleep(0.1)
+		self.bus.off = False
+		self.txq.flush()
+		self.assertEqual(self.sent(),[1])
+		self.assertEqual(self.txq.stat_get()['txExpired'],1)
+
+	def test_bound(self):
+		for n in range(CCanTxQueue.TXQ_MAX + 2):
+			self.send(n)
+		self.assertEqual(self.txq.stat_get()['txOverflow'],2)
+		self.bus.off = False
+		self.txq.flush()
+		self.assertEqual(self.sent(),list(range(2,CCanTxQueue.TXQ_MAX + 2)))
+
+	def test_superseded(self):
+		self.send(0,key='IOUT_SET')
+		self.send(1)
+		self.send(2,key='IOUT_SET')
+		self.bus.off = False
+		self.txq.flush()
+		self.assertEqual(self.sent(),[1,2])
+		self.assertEqual(self.txq.stat_get()['txSuperseded'],1)
+
+	def test_flush_recorded(self):
+		with tempfile.TemporaryDirectory() as dname:
+			fname = os.path.join(dname,'bic.rec')
+			bic = CBic('txq',CAN_ADR,can_chan=self.bus)
+			try:
+				bic.rec_start(fname)
+				self.assertFalse(bic.can_send_msg(bytes([0x30,0x00,0xe8,0x03])))
+				self.assertEqual(bic.stat.stat_get()['txFrames'],0)
+				self.bus.off = False
+				bic.txq.flush() # e.g. after a bus recovery
+				self.assertEqual(bic.stat.stat_get()['txFrames'],1)
+				bic.rec_stop()
+				self.assertEqual([(e_dir,data) for t,e_dir,adr,data in CCanRec.read(fname)],
+								 [(CCanRec.e_dir_tx,bytes([0x30,0x00,0xe8,0x03]))])
+			finally:
+				bic.shutdown()
+
+
+if __name__ == '__main__':
+	unittest.main()
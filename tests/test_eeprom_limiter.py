@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+"""
+ - eeprom write limiter (CEepromLedger) in the CBic write path, simulated BIC-2200 on a python-can virtual bus
+   + rising setpoints are deferred, a lower current and the idle setpoint are always written
+   + a direction change is never blocked, the current is not written without its direction
+   + the ledger file is not written with each eeprom write
+"""
+import os
+import sys
+import json
+import tempfile
+import unittest
+
+sys.path.insert(0,os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from simcase import CSimCase
+from cbic2200 import CBic,CEepromLedger
+
+class TestEepromLimiter(CSimCase):
+
+	def setUp(self):
+		self.dir = tempfile.TemporaryDirectory()
+		self.addCleanup(self.dir.cleanup) # after the shutdown of bic, it saves the ledger
+		super().setUp()
+		# one write per day, second write of a register after 1h
+		self.bic.eeprom_ledger_set(CEepromLedger(os.path.join(self.dir.name,'ledger.json'),budget_day=1,min_interval_sec=3600,tol=10))
+
+	def iout(self):
+		return self.sim.d_reg[CBic.e_cmd_IOUT_SET]
+
+	def test_rising_deferred(self):
+		self.bic.charge_set(CBic.e_charge_mode_charge,3000)
+		d_ret = self.bic.charge_set(CBic.e_charge_mode_charge,3200)
+		self.assertFalse(d_ret[CBic.e_cmd_IOUT_SET])
+		self.assertEqual(self.iout(),3000)
+		self.assertEqual(self.bic.d_eeprom_pending,{CBic.e_cmd_IOUT_SET:3200})
+
+	def test_lower_current_written(self):
+		self.bic.charge_set(CBic.e_charge_mode_charge,3000)
+		self.bic.charge_set(CBic.e_charge_mode_charge,3200) # deferred, budget is used up
+		d_ret = self.bic.charge_set(CBic.e_charge_mode_charge,2995) # in tolerance, but lower
+		self.assertTrue(d_ret[CBic.e_cmd_IOUT_SET])
+		self.assertEqual(self.iout(),2995)
+		self.assertEqual(self.bic.d_eeprom_pending,{})
+
+	def test_idle_written(self):
+		self.sim.d_reg[CBic.e_cmd_REVERSE_IOUT_SET] = 50 # idle value is rising
+		self.bic.charge_set(CBic.e_charge_mode_charge,3000)
+		d_ret = self.bic.write_many({CBic.e_cmd_IOUT_SET:80,CBic.e_cmd_REVERSE_IOUT_SET:80,
+									CBic.e_cmd_DIRECTION_CTRL:CBic.e_charge_mode_charge},safety=True)
+		self.assertTrue(all(d_ret.values()))
+		self.assertEqual(self.iout(),80)
+		self.assertEqual(self.sim.d_reg[CBic.e_cmd_REVERSE_IOUT_SET],80)
+
+	def test_charge_set_direction_switch(self):
+		self.bic.charge_set(CBic.e_charge_mode_charge,3000)
+		d_ret = self.bic.charge_set(CBic.e_charge_mode_discharge,2000) # rising, deferred
+		self.assertEqual(d_ret,{CBic.e_cmd_DIRECTION_CTRL:True,CBic.e_cmd_REVERSE_IOUT_SET:False})
+		# the direction follows at once with the stored lower current
+		self.assertEqual(self.sim.d_reg[CBic.e_cmd_DIRECTION_CTRL],CBic.e_charge_mode_discharge)
+		self.assertEqual(self.sim.d_reg[CBic.e_cmd_REVERSE_IOUT_SET],90)
+		self.assertFalse(self.bic.eeprom_flush_due())
+
+		self.bic.ledger.budget_day = -1
+		self.bic.ledger.min_interval_sec = 0
+		self.assertTrue(self.bic.eeprom_flush_due())
+		self.bic.eeprom_flush()
+		self.assertEqual(self.sim.d_reg[CBic.e_cmd_REVERSE_IOUT_SET],2000)
+		self.assertEqual(self.bic.d_eeprom_pending,{})
+
+	def test_charge_set_current_with_direction(self):
+		self.bic.charge_set(CBic.e_charge_mode_charge,3000)
+		self.bic.charge_set(CBic.e_charge_mode_discharge,2000) # deferred current
+		self.bic.charge_set(CBic.e_charge_mode_charge,3000) # back to charge, the discharge current is outdated
+		self.assertEqual(self.sim.d_reg[CBic.e_cmd_DIRECTION_CTRL],CBic.e_charge_mode_charge)
+		self.assertEqual(self.bic.d_eeprom_pending,{})
+
+	def test_force_limited(self):
+		self.bic.charge_set(CBic.e_charge_mode_charge,3000)
+		d_ret = self.bic.write_many({CBic.e_cmd_IOUT_SET:3200},force=True) # rising, the shadow register is known
+		self.assertFalse(d_ret[CBic.e_cmd_IOUT_SET])
+		self.bic.cache_clear()
+		d_ret = self.bic.write_many({CBic.e_cmd_IOUT_SET:2000},force=True) # unknown running value is not safe
+		self.assertFalse(d_ret[CBic.e_cmd_IOUT_SET])
+		self.assertEqual(self.iout(),3000)
+
+	def test_ledger_saved_batched(self):
+		self.bic.charge_set(CBic.e_charge_mode_charge,3000)
+		self.assertFalse(os.path.exists(self.bic.ledger.fname))
+		self.bic.eeprom_flush()
+		with open(self.bic.ledger.fname) as f:
+			self.assertEqual(json.load(f)['cntDay'],{'IOUT_SET':1})
+
+	def test_outdated_transaction_dropped(self):
+		self.bic.charge_set(CBic.e_charge_mode_charge,3000)
+		self.bic.charge_set(CBic.e_charge_mode_discharge,2000) # deferred
+		self.bic.charge_set(CBic.e_charge_mode_charge,1000) # lower, written
+		self.assertEqual(self.bic.d_eeprom_pending,{})
+		self.bic.eeprom_flush()
+		self.assertEqual(self.sim.d_reg[CBic.e_cmd_DIRECTION_CTRL],CBic.e_charge_mode_charge)
+		self.assertEqual(self.iout(),1000)
+
+
+if __name__ == '__main__':
+	unittest.main()
@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+"""
+ - register map (CReg, CBic.d_reg)
+   + write frame -> reply decoder round trip of each register width, signed registers
+   + scale: value in the unit -> register value -> value in the unit
+   + typed read and write (reg_read, reg_write) with the simulated BIC-2200
+"""
+import os
+import sys
+import unittest
+
+sys.path.insert(0,os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from simcase import CSimCase
+from cbic2200 import CBic,CReg,can_frame_write,can_frame_read,can_frame_cmd
+
+class TestReg(unittest.TestCase):
+
+	def test_round_trip(self):
+		d_val = {1:(0,1,0xff),2:(0,1,0x1234,0xffff)}
+		for cmd,reg in CBic.d_reg.items():
+			if reg.width == 6:
+				continue
+			with self.subTest(reg=reg.name):
+				self.assertEqual(reg.frame_read,can_frame_read(cmd))
+				for val in d_val[reg.width]:
+					if reg.signed is True:
+						val = val - 0x10000 if val > 0x7fff else val
+					frame = can_frame_write(cmd,val,reg.width)
+					self.assertEqual(len(frame),2 + reg.width)
+					self.assertEqual(can_frame_cmd(frame),cmd)
+					self.assertEqual(reg.dec(frame),val)
+
+	def test_chars(self):
+		reg = CBic.d_reg[CBic.e_cmd_MFR_MODEL_B0B5]
+		self.assertEqual(reg.dec(can_frame_read(reg.cmd) + b'BIC-22'),'BIC-22')
+		self.assertEqual(reg.value('BIC-22'),'BIC-22') # no scale for chars
+		with self.assertRaises(IndexError):
+			reg.dec(can_frame_read(reg.cmd) + b'BIC')
+
+	def test_signed(self):
+		reg = CBic.d_reg[CBic.e_cmd_READ_IOUT]
+		self.assertTrue(reg.signed)
+		for val in (-32768,-4000,-1,0,1,32767):
+			self.assertEqual(reg.dec(can_frame_write(reg.cmd,val)),val)
+		self.assertEqual(reg.value(-4000),-40.0)
+		self.assertEqual(reg.raw(-40.0),-4000)
+		reg = CBic.d_reg[CBic.e_cmd_READ_VOUT]
+		self.assertEqual(reg.dec(can_frame_write(reg.cmd,-1)),0xffff) # unsigned
+
+	def test_scale(self):
+		for cmd,val,raw in ((CBic.e_cmd_VOUT_SET,27.5,2750),(CBic.e_cmd_IOUT_SET,12.34,1234),
+							(CBic.e_cmd_READ_VIN,230.1,2301),(CBic.e_cmd_READ_TEMPERATURE_1,-5.5,-55),
+							(CBic.e_cmd_READ_FAN1,2800,2800),(CBic.e_cmd_OPERATION,1,1)):
+			with self.subTest(cmd=hex(cmd)):
+				reg = CBic.d_reg[cmd]
+				self.assertEqual(reg.raw(val),raw)
+				self.assertEqual(reg.value(raw),val)
+		reg = CBic.d_reg[CBic.e_cmd_VOUT_SET]
+		self.assertEqual(reg.value(2751),27.51) # rounded to the digits of the scale
+		self.assertEqual(reg.raw('27.51'),2751)
+		self.assertIsNone(reg.value(None))
+		self.assertEqual(CReg(0x1234,scale=0.001).digits,3)
+
+class TestRegSim(CSimCase):
+
+	def test_reg_write_read(self):
+		self.assertEqual(self.bic.reg_write({CBic.e_cmd_VOUT_SET:27.0,CBic.e_cmd_IOUT_SET:1.5}),
+						 {CBic.e_cmd_VOUT_SET:True,CBic.e_cmd_IOUT_SET:True})
+		self.assertEqual((self.sim.d_reg[CBic.e_cmd_VOUT_SET],self.sim.d_reg[CBic.e_cmd_IOUT_SET]),(2700,150))
+		self.assertEqual(self.bic.reg_read([CBic.e_cmd_VOUT_SET,CBic.e_cmd_IOUT_SET,CBic.e_cmd_READ_VIN],tmo=1.0,cached=False),
+						 {CBic.e_cmd_VOUT_SET:27.0,CBic.e_cmd_IOUT_SET:1.5,CBic.e_cmd_READ_VIN:230.0})
+
+	def test_reg_read_signed(self):
+		self.sim.d_reg[CBic.e_cmd_DIRECTION_CTRL] = CBic.e_charge_mode_discharge
+		self.sim.d_reg[CBic.e_cmd_REVERSE_IOUT_SET] = 1234
+		self.assertEqual(self.bic.reg_read([CBic.e_cmd_READ_IOUT],tmo=1.0,cached=False),{CBic.e_cmd_READ_IOUT:-12.34})
+
+	def test_reg_write_read_only(self):
+		with self.assertRaises(ValueError):
+			self.bic.reg_write({CBic.e_cmd_READ_VOUT:27.0})
+
+
+if __name__ == '__main__':
+	unittest.main()
@@ -0,0 +1,62 @@
+#!/usr/bin/env python3
+"""
+ - register cache of CBic, simulated BIC-2200 on a python-can virtual bus
+   + control registers changed outside of CBic are read again after their short time to live
+   + the shadow registers of the write path are fresh for a limited time only
+   + the charge cycle of bic2mqtt reads the setpoints from the shadow registers
+"""
+import os
+import sys
+import math
+import time
+import unittest
+
+sys.path.insert(0,os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from simcase import CSimCase
+from cbic2200 import CBic
+
+class TestRegisterCache(CSimCase):
+
+	def test_operation_changed_outside(self):
+		self.assertEqual(self.bic.operation_read(),1)
+		self.sim.d_reg[CBic.e_cmd_OPERATION] = 0 # front panel or another client
+		self.sim.d_reg[CBic.e_cmd_DIRECTION_CTRL] = CBic.e_charge_mode_discharge
+		time.sleep(CBic.CACHE_TTL_CTRL + 0.1)
+		self.assertEqual(self.bic.operation_read(),0)
+		self.assertEqual(self.bic.status_snapshot()['opMode'],0)
+		self.assertEqual(self.bic.BIC_chargemode_read(),CBic.e_charge_mode_discharge)
+
+	def test_shadow_changed_outside(self):
+		self.bic.cache_ttl_set(CBic.e_cmd_IOUT_SET,0.2) # short shadow window of the test
+		self.bic.charge_current(CBic.e_cmd_write,1200) # verified write, fresh shadow
+		self.sim.d_reg[CBic.e_cmd_IOUT_SET] = 500 # changed outside of the bridge
+		time.sleep(0.3)
+		self.assertEqual(self.bic.write_many({CBic.e_cmd_IOUT_SET:1200}),{CBic.e_cmd_IOUT_SET:True})
+		self.assertEqual(self.sim.d_reg[CBic.e_cmd_IOUT_SET],1200)
+
+	def test_shadow_ttl_finite(self):
+		for cmd in CBic.s_cmd_eeprom:
+			self.assertLess(self.bic.d_cache_ttl[cmd],math.inf)
+
+	def test_uncached_read_refreshes_shadow(self):
+		self.bic.charge_current(CBic.e_cmd_write,1200)
+		self.sim.d_reg[CBic.e_cmd_IOUT_SET] = 500
+		self.assertEqual(self.bic.read_many([CBic.e_cmd_IOUT_SET],cached=False)[CBic.e_cmd_IOUT_SET],500)
+		self.bic.charge_current(CBic.e_cmd_write,1200)
+		self.assertEqual(self.sim.d_reg[CBic.e_cmd_IOUT_SET],1200)
+
+	def test_charge_cycle(self):
+		lst_cmd = [CBic.e_cmd_READ_VOUT,CBic.e_cmd_READ_IOUT,CBic.e_cmd_DIRECTION_CTRL,
+					CBic.e_cmd_IOUT_SET,CBic.e_cmd_REVERSE_IOUT_SET] # bic2mqtt update_charge
+		self.bic.reg_read(lst_cmd)
+		self.bic.charge_current(CBic.e_cmd_write,1200)
+		time.sleep(CBic.CACHE_TTL_CTRL + 0.1) # next cycle
+		self.sim.cnt_rx = 0
+		d_val = self.bic.reg_read(lst_cmd)
+		self.assertEqual(self.sim.cnt_rx,3) # voltage, current and direction
+		self.assertEqual(d_val[CBic.e_cmd_IOUT_SET],12.0)
+
+
+if __name__ == '__main__':
+	unittest.main()
@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+"""
+ - bus scan (CBic.scan) with simulated BIC-2200 devices on a python-can virtual bus
+   + all devices found with model name and firmware
+   + frames refused by a full kernel queue (ENOBUFS) are repeated
+   + scan on the bus of a device (scan_bus), the device reads again afterwards
+"""
+import os
+import sys
+import errno
+import unittest
+
+sys.path.insert(0,os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import can
+from simcase import CSimCase
+from cbic2200 import CBic,CCanBus,CAN_ADR_BIC
+from cbicsim import CBicSim
+
+# virtual bus with a short kernel queue: every second frame is refused
+class CBusFull:
+	def __init__(self,bus):
+		self.bus = bus
+		self.cnt_send = 0
+		self.cnt_refused = 0
+
+	def send(self,msg,timeout=None):
+		self.cnt_send += 1
+		if self.cnt_send % 2 == 0:
+			self.cnt_refused += 1
+			raise OSError(errno.ENOBUFS,os.strerror(errno.ENOBUFS))
+		self.bus.send(msg,timeout)
+
+	def recv(self,timeout=None):
+		return self.bus.recv(timeout)
+
+	def set_filters(self,can_filters=None):
+		self.bus.set_filters(can_filters)
+
+class TestScan(CSimCase):
+	lst_dev_id = (0,3,6)
+	bic_new = False
+
+	def setUp(self):
+		super().setUp()
+		self.lst_sim[1].latency_sec = 0.02
+		self.bus = can.interface.Bus(channel=self.chan,interface='virtual')
+		self.addCleanup(self.bus.shutdown)
+
+	def check(self,lst_dev):
+		self.assertEqual([dev['devId'] for dev in lst_dev],[0,3,6])
+		for dev in lst_dev:
+			self.assertEqual(dev['type'],'BIC')
+			self.assertEqual(dev['canAdr'],CAN_ADR_BIC + dev['devId'])
+			self.assertEqual(dev['modelName'],CBicSim.MODEL_NAME[0:12].decode())
+			self.assertEqual(dev['firmRev'],hex(CBicSim.FW_REVISION))
+
+	def test_scan(self):
+		self.check(CBic.scan(can_chan=self.bus))
+		# model name to all 12 addresses, the other requests to the 3 devices only
+		self.assertEqual(sum(sim.cnt_rx for sim in self.lst_sim),3 * 3)
+
+	def test_scan_refused_frames(self):
+		bus = CBusFull(self.bus)
+		self.check(CBic.scan(can_chan=bus))
+		self.assertGreater(bus.cnt_refused,0)
+
+	def check_scan_bus(self,bic):
+		try:
+			self.check(bic.scan_bus())
+			self.assertEqual(bic.read_many([CBic.e_cmd_OPERATION],tmo=1.0,cached=False),{CBic.e_cmd_OPERATION:1})
+		finally:
+			bic.shutdown()
+
+	def test_scan_bus(self):
+		self.check_scan_bus(CBic(self.chan,CAN_ADR_BIC + 3,rx_thread=True,can_if='virtual'))
+
+	def test_scan_bus_shared(self):
+		self.check_scan_bus(CBic(self.chan,CAN_ADR_BIC + 3,can_bus=CCanBus.get(self.chan,'virtual')))
+
+
+if __name__ == '__main__':
+	unittest.main()
@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+"""
+ - resident server (CBicServer) with the simulated BIC-2200 on a python-can virtual bus
+   + command line and json read requests on the same device
+   + a read timeout is a reply with ret 2, the server keeps serving
+   + a stale socket file is replaced, a running server is not
+"""
+import os
+import sys
+import json
+import errno
+import socket
+import tempfile
+import threading
+import unittest
+
+sys.path.insert(0,os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from simcase import CSimCase
+from cbic2200 import CBicServer
+
+class TestServer(CSimCase):
+
+	def setUp(self):
+		super().setUp()
+		self.bic.tmo_set(0.05,0.05,0)
+		self.dir = tempfile.TemporaryDirectory()
+		self.server = CBicServer(self.bic,os.path.join(self.dir.name,'cbic2200.sock'))
+		self.thread = threading.Thread(target=self.server.serve_forever,daemon=True)
+		self.thread.start()
+
+	def tearDown(self):
+		self.server.shutdown()
+		self.server.server_close()
+		self.dir.cleanup()
+
+	# @return reply of one json request
+	def request(self,d_req :dict):
+		with socket.socket(socket.AF_UNIX,socket.SOCK_STREAM) as sock:
+			sock.connect(self.server.fname)
+			sock.sendall((json.dumps(d_req) + '\n').encode())
+			with sock.makefile('r') as f:
+				return json.loads(f.readline())
+
+	def test_read_and_argv(self):
+		d_rsp = self.request({'read':['READ_VOUT','OPERATION']})
+		self.assertEqual(d_rsp['ret'],0)
+		self.assertEqual(d_rsp['val']['OPERATION'],1)
+		d_rsp = self.request({'argv':['cread']})
+		self.assertEqual((d_rsp['ret'],d_rsp['out']),(0,'90\n'))
+
+	def test_timeout_after_argv(self):
+		self.sim.online = False
+		self.assertEqual(self.request({'read':['READ_VOUT']})['ret'],2)
+		self.assertEqual(self.request({'argv':['vread']})['ret'],2)
+		d_rsp = self.request({'read':['READ_VOUT']})
+		self.assertEqual(d_rsp['ret'],2)
+		self.assertEqual(d_rsp['val'],{'READ_VOUT':None})
+		self.assertTrue(self.bic.persist)
+
+	def test_running(self):
+		with self.assertRaises(OSError) as ctx:
+			CBicServer(self.bic,self.server.fname)
+		self.assertEqual(ctx.exception.errno,errno.EADDRINUSE)
+		self.assertEqual(self.request({'argv':['cread']})['ret'],0) # first server still serves
+
+	def test_stale(self):
+		fname = os.path.join(self.dir.name,'stale.sock')
+		with socket.socket(socket.AF_UNIX,socket.SOCK_STREAM) as sock:
+			sock.bind(fname) # socket file without a server
+		server = CBicServer(self.bic,fname)
+		server.server_close()
+
+
+if __name__ == '__main__':
+	unittest.main()
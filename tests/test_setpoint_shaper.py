@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+"""
+ - setpoint shaper (bic2mqtt.CSetpointShaper) with a simulated clock
+   + slew rate of the real time between the calls
+   + hysteresis of the target, slew steps smaller than the band are passed
+   + no jump after a steady period or an idle setpoint
+"""
+import os
+import sys
+import unittest
+from unittest import mock
+
+sys.path.insert(0,os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+try:
+	import bic2mqtt
+except ImportError: # paho-mqtt
+	bic2mqtt = None
+
+@unittest.skipIf(bic2mqtt is None,'paho-mqtt needed')
+class TestSetpointShaper(unittest.TestCase):
+
+	def setUp(self):
+		self.ts = 1000.0
+		patcher = mock.patch.object(bic2mqtt.time,'monotonic',lambda: self.ts)
+		patcher.start()
+		self.addCleanup(patcher.stop)
+		self.shaper = bic2mqtt.CSetpointShaper(0)
+
+	# @return shaped setpoint after sec
+	def shape(self,pow_set,sec):
+		self.ts += sec
+		return self.shaper.shape(pow_set)
+
+	def test_slew(self):
+		self.shaper.cfg_slew_pow = 50
+		self.assertEqual(self.shape(1000,3),150) # control period 3s
+		self.assertEqual(self.shape(1000,5),400)
+		self.assertEqual(self.shape(-1000,2),300)
+		self.assertEqual(self.shape(0,1),0) # stop without slew limit
+
+	def test_hysteresis(self):
+		self.shaper.cfg_hyst_pow = 100
+		self.assertIsNone(self.shape(80,2))
+		self.assertEqual(self.shape(500,2),500)
+		self.assertIsNone(self.shape(450,2))
+		self.assertEqual(self.shape(390,2),390)
+		self.assertEqual(self.shaper.cnt_suppressed,2)
+
+	def test_slew_step_in_band(self):
+		self.shaper.cfg_slew_pow = 50
+		self.shaper.cfg_hyst_pow = 100
+		lst_pow = [self.shape(1000,1) for i in range(20)]
+		self.assertEqual(lst_pow[:3],[50,100,150])
+		self.assertEqual(self.shaper.pow_last,950) # target in the band of the last step
+
+	def test_slew_step_grid(self):
+		self.shaper.cfg_slew_pow = 10
+		self.shaper.cfg_grid_pow = 50
+		self.assertEqual(self.shape(300,1),50) # one grid step
+		self.assertEqual(self.shape(300,1),100)
+		self.assertIsNone(self.shape(110,1)) # grid of the target is reached
+
+	def test_steady_period(self):
+		self.shaper.cfg_slew_pow = 50
+		self.shaper.cfg_hyst_pow = 100
+		self.assertEqual(self.shape(200,10),200)
+		for i in range(10):
+			self.assertIsNone(self.shape(250,10)) # target in the band
+		self.assertEqual(self.shape(1000,2),300) # slew from the last call, no jump
+
+	def test_idle_reset(self):
+		self.shaper.cfg_slew_pow = 50
+		self.assertEqual(self.shape(500,10),500)
+		self.ts += 600 # idle, no setpoints of the charge control
+		self.shaper.reset()
+		self.assertEqual(self.shape(1000,2),100)
+
+
+if __name__ == '__main__':
+	unittest.main()
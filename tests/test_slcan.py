@@ -0,0 +1,124 @@
+#!/usr/bin/env python3
+"""
+ - slcan backend (CCanSlcan, can interface 'native-slcan') on a pty, the adapter is a thread on the master side
+   + open sequence: close, bit rate, open
+   + the requests of a read burst are written at once, replies of other ids are filtered
+   + bit rate of the shared bus
+   + python-can is not imported
+"""
+import os
+import sys
+import struct
+import subprocess
+import threading
+import unittest
+
+sys.path.insert(0,os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from cbic2200 import CBic,CCanBus,CAN_ADR,CAN_ADR_RSP_MASK
+from cbicsim import CBicSim
+
+# slcan adapter answering with the simulated device, ack 'z' of each sent frame
+class CSlcanAdapter:
+	ADR_FOREIGN = 0x123 # frame of another device after each reply
+
+	def __init__(self):
+		self.fd_master,self.fd_slave = os.openpty()
+		self.dev = os.ttyname(self.fd_slave)
+		self.sim = CBicSim(None)
+		self.lst_cmd = [] # received slcan commands
+		self.lst_frames_read = [] # number of frames of each read on the master side
+		self.thread = threading.Thread(target=self.run,daemon=True)
+		self.thread.start()
+
+	def run(self):
+		buf = b''
+		while True:
+			try:
+				data = os.read(self.fd_master,4096)
+			except OSError:
+				return # closed
+			buf += data
+			*lst_line,buf = buf.split(b'\r')
+			self.lst_frames_read.append(sum(1 for line in lst_line if line[:1] == b'T'))
+			out = b''
+			for line in lst_line:
+				self.lst_cmd.append(line)
+				if line[:1] != b'T':
+					out += b'\r'
+					continue
+				out += b'z\r'
+				adr = int(line[1:9],16)
+				dlc = line[9] - ord('0')
+				data = bytes.fromhex(line[10:10 + 2 * dlc].decode())
+				if adr != CAN_ADR:
+					continue
+				cmd = struct.unpack_from('<H',data)[0]
+				if dlc > 2:
+					self.sim.d_reg[cmd] = int.from_bytes(data[2:4],'little')
+					continue
+				rsp = self.sim.reply_get(cmd)
+				if rsp:
+					out += b'T%08X%d%s\r' % (CAN_ADR & CAN_ADR_RSP_MASK,len(rsp),rsp.hex().upper().encode())
+				out += b'T%08X2AABB\r' % CSlcanAdapter.ADR_FOREIGN
+			if out:
+				try:
+					os.write(self.fd_master,out)
+				except OSError:
+					return
+
+	def close(self):
+		os.close(self.fd_master)
+		os.close(self.fd_slave)
+		self.thread.join(1)
+
+@unittest.skipUnless(hasattr(os,'openpty'),'pty needed')
+class TestSlcan(unittest.TestCase):
+
+	def setUp(self):
+		self.adapter = CSlcanAdapter()
+
+	def tearDown(self):
+		self.adapter.close()
+
+	def check(self,rx_thread):
+		bic = CBic(self.adapter.dev,CAN_ADR,rx_thread=rx_thread,can_if='native-slcan')
+		try:
+			lst_cmd = [CBic.e_cmd_READ_VOUT,CBic.e_cmd_READ_IOUT,CBic.e_cmd_OPERATION,CBic.e_cmd_READ_VIN]
+			d_val = bic.read_many(lst_cmd,tmo=1.0,cached=False)
+			self.assertEqual(self.adapter.lst_cmd[:3],[b'C',b'S5',b'O'])
+			self.assertEqual(max(self.adapter.lst_frames_read),len(lst_cmd)) # one write of the burst
+			self.assertEqual(d_val,{cmd:CBic.d_cmd_dec[cmd](self.adapter.sim.reply_get(cmd)) for cmd in lst_cmd})
+			self.assertEqual(bic.write_many({CBic.e_cmd_IOUT_SET:1111}),{CBic.e_cmd_IOUT_SET:True})
+			self.assertEqual(self.adapter.sim.d_reg[CBic.e_cmd_IOUT_SET],1111)
+		finally:
+			bic.shutdown()
+
+	def test_direct(self):
+		self.check(False)
+
+	def test_rx_thread(self):
+		self.check(True)
+
+	def test_bit_rate(self):
+		bic = CBic(self.adapter.dev,CAN_ADR,can_bus=CCanBus.get(self.adapter.dev,'native-slcan',500000),bit_rate=500000)
+		try:
+			self.assertEqual(bic.read_many([CBic.e_cmd_OPERATION],tmo=1.0,cached=False),{CBic.e_cmd_OPERATION:1})
+			self.assertEqual(self.adapter.lst_cmd[:3],[b'C',b'S6',b'O'])
+		finally:
+			bic.shutdown()
+		self.assertEqual(CCanBus.d_bus,{})
+
+	def test_no_python_can(self):
+		code = ("import sys\n"
+				"sys.path.insert(0,{!r})\n"
+				"from cbic2200 import CCanSlcan\n"
+				"CCanSlcan({!r}).shutdown()\n"
+				"print('can' in sys.modules,'asyncio' in sys.modules)\n").format(
+					os.path.dirname(os.path.dirname(os.path.abspath(__file__))),self.adapter.dev)
+		ret = subprocess.run([sys.executable,'-c',code],capture_output=True,text=True,timeout=30)
+		self.assertEqual(ret.stdout.strip(),'False False')
+
+
+if __name__ == '__main__':
+	unittest.main()